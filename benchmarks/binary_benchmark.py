@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""Compare loading the JSON and binary intermediate representations.
+
+Builds a synthetic document with the threats of the Software Fault Pattern library
+and a number of projects of tagged elements, and writes it as both JSON and binary.
+It then times json.load of the whole document, loading the whole binary document,
+and reading a single project and the threats from the memory-mapped binary file.
+
+    $ python benchmarks/binary_benchmark.py --projects 50 --count 4000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from pythreatspec import binary
+
+
+def build_document(projects, count):
+    """Build a document with count elements in each project."""
+    with open(os.path.join(ROOT, "sfp_library.threatspec.json")) as fh:
+        document = json.load(fh)
+    threats = list(document["threats"])
+    document["projects"] = {}
+    for p in range(projects):
+        mitigations = {}
+        for i in range(count):
+            mitigations.setdefault("@element_{}".format(i % 500), []).append({
+                "boundary": "@boundary_{}".format(i % 20),
+                "component": "@component_{}".format(i % 200),
+                "threat": threats[i % len(threats)],
+                "mitigation": "mitigation number {}".format(i),
+                "refs": [],
+                "source": {"file": "src/module_{}.py".format(i % 50), "line": i, "function": "function_{}".format(i % 500)}
+            })
+        document["projects"]["project_{}".format(p)] = {"mitigations": mitigations, "exposures": {}, "transfers": {}, "acceptances": {}, "reviews": {}}
+    return document
+
+
+def timed(function):
+    start = time.time()
+    function()
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ThreatSpec binary IR benchmark")
+    parser.add_argument("--projects", type=int, default=50, help="number of projects (default: 50)")
+    parser.add_argument("--count", type=int, default=4000, help="elements per project (default: 4000)")
+    parser.add_argument("--out", default="binary_benchmark.threatspec", help="output file prefix, removed afterwards")
+    args = parser.parse_args()
+
+    document = build_document(args.projects, args.count)
+    json_file = args.out + ".json"
+    binary_file = args.out + ".bin"
+    with open(json_file, "w") as fh:
+        json.dump(document, fh, indent=2, separators=(',', ': '))
+    with open(binary_file, "wb") as fh:
+        binary.dump(document, fh)
+
+    def load_json():
+        with open(json_file) as fh:
+            json.load(fh)
+
+    def load_binary():
+        with open(binary_file, "rb") as fh:
+            binary.load(fh)
+
+    def read_project():
+        with binary.PTSBinaryReader.open(binary_file) as reader:
+            reader.project("project_{}".format(args.projects // 2))
+
+    def read_threats():
+        with binary.PTSBinaryReader.open(binary_file) as reader:
+            reader.threats()
+
+    print("elements:      {}".format(args.projects * args.count))
+    print("json size:     {:.1f} MB".format(os.path.getsize(json_file) / 1048576.0))
+    print("binary size:   {:.1f} MB".format(os.path.getsize(binary_file) / 1048576.0))
+    print("json load:     {:.3f}s".format(timed(load_json)))
+    print("binary load:   {:.3f}s".format(timed(load_binary)))
+    print("one project:   {:.3f}s".format(timed(read_project)))
+    print("threats only:  {:.3f}s".format(timed(read_threats)))
+    os.remove(json_file)
+    os.remove(binary_file)
+
+
+if __name__ == "__main__":
+    main()
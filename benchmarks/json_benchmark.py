@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""Compare the peak memory of writing the intermediate representation.
+
+Builds a synthetic model of tagged elements and DFD edges, then writes it either by
+building the whole document with PyThreatspecReporter.export_to_json and passing it to
+json.dump, or with the streaming PyThreatspecReporter.write_json. Each method runs in
+its own process, so that the peak resident set size of each can be compared.
+
+    $ python benchmarks/json_benchmark.py --count 200000
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from pythreatspec import pythreatspec as ts
+
+METHODS = ["dump", "stream"]
+
+
+def build_parser(count):
+    """Build a parser with count mitigations and exposures and a DFD edge per 10 elements."""
+    parser = ts.PyThreatspecParser()
+    for i in range(count):
+        boundary_id = parser.add_boundary("@boundary_{}".format(i % 20))
+        component_id = parser.add_component(boundary_id, "@component_{}".format(i % 200))
+        threat_id = parser.add_threat("@threat_{}".format(i % 700))
+        source = parser.new_source("src/module_{}.py".format(i % 500), i, "function_{}".format(i % 5000))
+        if i % 2:
+            element = ts.PTSMitigation(boundary_id, component_id, threat_id, "mitigation number {}".format(i), [])
+            kind = "mitigations"
+        else:
+            element = ts.PTSExposure(boundary_id, component_id, threat_id, "exposure number {}".format(i), [])
+            kind = "exposures"
+        element.source = source
+        parser.add_element(kind, "@element_{}".format(i % 5000), element)
+        if i % 10 == 0:
+            parser.dfd.add_edge(ts.PTSDfdEdge(boundary_id, component_id, "@boundary_{}".format((i + 1) % 20), "@component_{}".format((i + 7) % 200), "uni", "edge {}".format(i), source))
+    return parser
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / (1024.0 * 1024.0)
+    return peak / 1024.0
+
+
+def run(method, count, outfile):
+    parser = build_parser(count)
+    reporter = ts.PyThreatspecReporter(parser, "benchmark")
+    before = peak_rss_mb()
+    start = time.time()
+    with open(outfile, "w") as fh:
+        if method == "dump":
+            json.dump(reporter.export_to_json(), fh, indent=2, separators=(',', ': '))
+        else:
+            reporter.write_json(fh)
+    print(json.dumps({"model": before, "peak": peak_rss_mb(), "seconds": time.time() - start}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ThreatSpec JSON output memory benchmark")
+    parser.add_argument("--count", type=int, default=200000, help="number of elements (default: 200000)")
+    parser.add_argument("--out", default="json_benchmark.threatspec.json", help="output file, removed afterwards")
+    parser.add_argument("--method", choices=METHODS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.method:
+        run(args.method, args.count, args.out)
+        return
+
+    print("elements:           {}".format(args.count))
+    for method in METHODS:
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--count", str(args.count), "--out", args.out, "--method", method])
+        result = json.loads(output.decode("utf-8"))
+        print("{:<8} peak RSS {:7.1f} MB, {:7.1f} MB over the model, {:.2f}s".format(method, result["peak"], result["peak"] - result["model"], result["seconds"]))
+    os.remove(args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Time a portfolio rollup using bitset coverage matrices.
+
+Builds coverage for a synthetic portfolio of projects, each with components that
+are exposed to, and mitigate, threats drawn from the Software Fault Pattern library.
+It then times the union of the project matrices and the rollup through the SFP
+parent hierarchy.
+
+    $ python benchmarks/matrix_benchmark.py --projects 200 --components 50
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from pythreatspec.coverage import PTSCoverage
+from pythreatspec.matrix import PTSCoverageMatrix, PTSMatrixAxes, union
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ThreatSpec coverage matrix benchmark")
+    parser.add_argument("--projects", type=int, default=200, help="number of projects (default: 200)")
+    parser.add_argument("--components", type=int, default=50, help="components per project (default: 50)")
+    parser.add_argument("--threats", type=int, default=20, help="threats per component (default: 20)")
+    args = parser.parse_args()
+
+    with open(os.path.join(ROOT, "sfp_library.threatspec.json")) as fh:
+        library = json.load(fh)["threats"]
+    threat_ids = sorted(library.keys())
+    kinds = ["exposures", "mitigations", "acceptances", "transfers"]
+
+    random.seed(0)
+    coverages = []
+    for project in range(args.projects):
+        coverage = PTSCoverage()
+        for component in range(args.components):
+            for threat_id in random.sample(threat_ids, args.threats):
+                coverage.add(random.choice(kinds), "@boundary_{}".format(component % 10), "@component_{}_{}".format(project, component), threat_id)
+        coverages.append(coverage)
+
+    start = time.time()
+    axes = PTSMatrixAxes()
+    matrices = [PTSCoverageMatrix.from_coverage(coverage, axes) for coverage in coverages]
+    built = time.time()
+    portfolio = union(matrices)
+    rolled = portfolio.rollup(library)
+    unmitigated = len(rolled.unmitigated())
+    done = time.time()
+
+    print("projects:           {}".format(args.projects))
+    print("matrix cells:       {} x {}".format(len(axes.components), len(axes.threats)))
+    print("build matrices:     {:.3f}s".format(built - start))
+    print("union and rollup:   {:.3f}s".format(done - built))
+    print("unmitigated rows:   {}".format(unmitigated))
+
+
+if __name__ == "__main__":
+    main()
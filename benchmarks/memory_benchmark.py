@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""Measure the memory used by the ThreatSpec model classes.
+
+Builds a synthetic corpus of tagged locations, one mitigation or exposure with its
+PTSSource per tag, and reports the memory allocated per element as measured by
+tracemalloc. The "dict" figures use plain classes with the same attributes and no
+__slots__, which is how the classes were represented before they were slotted,
+so the two runs show the memory used before and after.
+
+    $ python benchmarks/memory_benchmark.py --count 1000000
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pythreatspec import pythreatspec as ts
+
+
+class DictSource(object):
+    def __init__(self, fname="", lineno=0, function=""):
+        self.fname = fname
+        self.lineno = lineno
+        self.function = function
+
+
+class DictElement(object):
+    def __init__(self, boundary, component, threat, refs=[]):
+        self.boundary = boundary
+        self.component = component
+        self.threat = threat
+        self.refs = refs
+        self.source = None
+
+
+class DictMitigation(DictElement):
+    def __init__(self, boundary, component, threat, mitigation, refs=[]):
+        DictElement.__init__(self, boundary, component, threat, refs)
+        self.mitigation = mitigation
+
+
+class DictExposure(DictElement):
+    def __init__(self, boundary, component, threat, exposure, refs=[]):
+        DictElement.__init__(self, boundary, component, threat, refs)
+        self.exposure = exposure
+
+
+def build_corpus(count, source_class, mitigation_class, exposure_class):
+    """Build a list of elements shaped like the output of a real parse."""
+    boundaries = ["@boundary_{}".format(i) for i in range(20)]
+    components = ["@component_{}".format(i) for i in range(200)]
+    threats = ["@threat_{}".format(i) for i in range(700)]
+    files = ["src/module_{}.py".format(i) for i in range(2000)]
+    functions = ["function_{}".format(i) for i in range(5000)]
+    texts = ["control {}".format(i) for i in range(1000)]
+
+    elements = []
+    for i in range(count):
+        if i % 2:
+            element = mitigation_class(boundaries[i % 20], components[i % 200], threats[i % 700], texts[i % 1000], [])
+        else:
+            element = exposure_class(boundaries[i % 20], components[i % 200], threats[i % 700], texts[i % 1000], [])
+        element.source = source_class(files[i % 2000], i, functions[i % 5000])
+        elements.append(element)
+    return elements
+
+
+def measure(count, source_class, mitigation_class, exposure_class):
+    """Return the bytes allocated per element for a corpus."""
+    gc.collect()
+    tracemalloc.start()
+    elements = build_corpus(count, source_class, mitigation_class, exposure_class)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del elements
+    gc.collect()
+    return float(current) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ThreatSpec model memory benchmark")
+    parser.add_argument("-c", "--count", type=int, default=1000000, help="number of tags in the synthetic corpus (default: 1000000)")
+    args = parser.parse_args()
+
+    before = measure(args.count, DictSource, DictMitigation, DictExposure)
+    after = measure(args.count, ts.PTSSource, ts.PTSMitigation, ts.PTSExposure)
+
+    print("tags:                 {}".format(args.count))
+    print("bytes/element (dict): {:.1f}".format(before))
+    print("bytes/element (slot): {:.1f}".format(after))
+    print("reduction:            {:.1f}%".format(100 * (before - after) / before))
+
+
+if __name__ == "__main__":
+    main()
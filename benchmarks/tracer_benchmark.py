@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""Measure the overhead of PTSTracer on a call-heavy workload.
+
+Times a workload in which tagged handlers call untagged helpers, which in turn call
+tagged data access functions. It runs without tracing and then with tracing at
+several sample rates.
+
+    $ python benchmarks/tracer_benchmark.py --calls 200000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from pythreatspec import pythreatspec as ts
+from pythreatspec.tracer import PTSTracer
+
+
+def handler(n):
+    """@mitigates @web:@server against @xss with templates"""
+    total = 0
+    for i in range(n):
+        total += helper(i)
+    return total
+
+
+def helper(i):
+    return query(i) + len(str(i))
+
+
+def query(i):
+    """@exposes @db:@mysql to @sqli with raw queries"""
+    return i * 2
+
+
+def timed(calls, tracer=None):
+    start = time.time()
+    if tracer is None:
+        handler(calls)
+    else:
+        with tracer:
+            handler(calls)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ThreatSpec runtime tracer benchmark")
+    parser.add_argument("--calls", type=int, default=200000, help="number of helper calls (default: 200000)")
+    args = parser.parse_args()
+
+    ts_parser = ts.PyThreatspecParser()
+    ts_parser.parse(os.path.abspath(__file__))
+
+    baseline = timed(args.calls)
+    print("untraced:           {:.3f}s".format(baseline))
+    for sample in (1, 10, 100):
+        tracer = PTSTracer(ts_parser, sample=sample)
+        elapsed = timed(args.calls, tracer)
+        print("sample 1 in {:<4}    {:.3f}s ({:.1f}x), {} edges".format(sample, elapsed, elapsed / baseline, len(tracer.component_edges())))
+
+
+if __name__ == "__main__":
+    main()
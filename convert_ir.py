@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+import json
+import logging
+from cli.log import LoggingApp
+from pythreatspec import binary
+from pythreatspec.files import open_file
+
+class ConvertIrApp(LoggingApp):
+    def main(self):
+        self.log.level = logging.INFO
+
+        with open_file(self.params.file, "rb") as fh:
+            data = fh.read()
+
+        if binary.is_binary(data):
+            self.log.info("Converting binary file {} to JSON".format(self.params.file))
+            document = binary.PTSBinaryReader(data).document()
+            with open_file(self.params.out, "w") as fh:
+                json.dump(document, fh, indent=2, separators=(',', ': '))
+        else:
+            self.log.info("Converting JSON file {} to binary".format(self.params.file))
+            document = json.loads(data.decode("utf-8"))
+            with open_file(self.params.out, "wb") as fh:
+                binary.dump(document, fh)
+
+        self.log.info("Wrote output to {}".format(self.params.out))
+
+if __name__ == "__main__":
+    app = ConvertIrApp(
+        name="convert_ir.py",
+        description="ThreatSpec IR converter. Convert between the JSON and binary intermediate representations.",
+        message_format = '%(asctime)s %(levelname)s: %(message)s'
+    )
+    app.add_param("-o", "--out", required=True, help="output file, compressed if it ends in .gz, .bz2 or .xz")
+    app.add_param("file", help="threatspec json or binary file to convert")
+    app.run()
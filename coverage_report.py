@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import logging
+from cli.log import LoggingApp
+from pythreatspec.coverage import PTSCoverage, STATUSES
+from pythreatspec.files import load_document, open_file
+
+class CoverageReportApp(LoggingApp):
+    def main(self):
+        self.log.level = logging.INFO
+
+        coverage = PTSCoverage()
+        for filename in self.params.files:
+            self.log.info("Loading file {}".format(filename))
+            PTSCoverage.from_json(load_document(filename), self.params.project, coverage)
+
+        summary = coverage.summary()
+        for status in STATUSES:
+            self.log.info("{}: {} of {}".format(status, summary[status], summary["exposed"]))
+        if summary["unexposed"]:
+            self.log.info("handled but not exposed: {}".format(summary["unexposed"]))
+
+        if self.params.out:
+            self.log.info("Writing coverage report to {}".format(self.params.out))
+            with open_file(self.params.out, "w") as fh:
+                json.dump(coverage.export_to_json(), fh, indent=2, separators=(',', ': '))
+
+        if self.params.fail and summary["unmitigated"] > 0:
+            for boundary_id, component_id, threat_id in sorted(coverage.unmitigated()):
+                self.log.warning("Unmitigated exposure of {}:{} to {}".format(boundary_id, component_id, threat_id))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    app = CoverageReportApp(
+        name="coverage_report.py",
+        description="ThreatSpec coverage report. Find exposures without a mitigation, transfer or acceptance.",
+        message_format = '%(asctime)s %(levelname)s: %(message)s'
+    )
+    app.add_param("-p", "--project", default=None, action="append", help="only report on this project (default: all projects)")
+    app.add_param("-o", "--out", default=None, help="write the coverage report JSON to this file")
+    app.add_param("-f", "--fail", action="store_true", help="exit with an error if there are unmitigated exposures")
+    app.add_param("files", action="append", help="threatspec json files to report on")
+    app.run()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import logging
+from cli.log import LoggingApp
+from pythreatspec.diff import diff_files, SECTIONS
+from pythreatspec.files import open_file
+
+class DiffIrApp(LoggingApp):
+    def main(self):
+        self.log.level = logging.INFO
+
+        self.log.info("Comparing {} with {}".format(self.params.old, self.params.new))
+        diff = diff_files(self.params.old, self.params.new, self.params.ignore_lines)
+
+        for line in diff.summary():
+            print(line)
+
+        counts = diff.counts()
+        for section in SECTIONS:
+            self.log.info("{}: {} added, {} removed, {} changed".format(
+                section, counts[section]["added"], counts[section]["removed"], counts[section]["changed"]
+            ))
+
+        if self.params.out:
+            self.log.info("Writing differences to {}".format(self.params.out))
+            with open_file(self.params.out, "w") as fh:
+                json.dump(diff.export_to_json(), fh, indent=2, separators=(',', ': '))
+
+        if self.params.fail and diff:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    app = DiffIrApp(
+        name="diff_ir.py",
+        description="ThreatSpec IR diff. Show the threats, DFD edges and elements added or removed between two threat models.",
+        message_format = '%(asctime)s %(levelname)s: %(message)s'
+    )
+    app.add_param("-o", "--out", default=None, help="write the differences as JSON to this file")
+    app.add_param("-i", "--ignore-lines", action="store_true", help="ignore elements that only moved to another line or file")
+    app.add_param("-f", "--fail", action="store_true", help="exit with an error if the models differ")
+    app.add_param("old", help="old threatspec json or binary file")
+    app.add_param("new", help="new threatspec json or binary file")
+    app.run()
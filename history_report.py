@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+import json
+import logging
+from cli.log import LoggingApp
+from pythreatspec.history import PTSGitRepository, PTSHistory, DAY
+from pythreatspec.files import open_file
+
+class HistoryReportApp(LoggingApp):
+    def main(self):
+        self.log.level = logging.INFO
+
+        repository = PTSGitRepository(self.params.repository)
+        revisions = repository.revisions(self.params.range, self.params.since)
+        interval = self.params.interval * DAY if self.params.interval else None
+        self.log.info("Found {} revisions in {}".format(len(revisions), self.params.range))
+
+        history = PTSHistory(repository, self.params.include)
+        series = history.run(revisions, interval)
+        self.log.info("Scanned {} revisions, reading {} files".format(len(series), repository.blobs_read))
+
+        self.log.info("Writing history to {}".format(self.params.out))
+        with open_file(self.params.out, "w") as fh:
+            if self.params.out.endswith(".csv"):
+                series.write_csv(fh)
+            else:
+                json.dump(series.export_to_json(), fh, separators=(',', ':'))
+
+if __name__ == "__main__":
+    app = HistoryReportApp(
+        name="history_report.py",
+        description="ThreatSpec history report. Compute threat model metrics for each revision of a git repository.",
+        message_format = '%(asctime)s %(levelname)s: %(message)s'
+    )
+    app.add_param("-o", "--out", default="history.json", help="output file, as csv if it ends in .csv, otherwise json (default: history.json)")
+    app.add_param("-r", "--range", default="HEAD", help="revision or range of revisions to scan (default: HEAD)")
+    app.add_param("--since", default=None, help="only scan revisions after this date, such as \"2 years ago\"")
+    app.add_param("-i", "--interval", default=None, type=int, help="only scan the last revision in each interval of this many days (default: every revision)")
+    app.add_param("--include", default=None, action="append", help="glob pattern of the paths to scan, may be repeated (default: all files)")
+    app.add_param("repository", nargs="?", default=".", help="path of the git repository (default: .)")
+    app.run()
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+
+import sys
+import logging
+from cli.log import LoggingApp
+from pythreatspec.lsp import PTSLanguageServer
+
+class LanguageServerApp(LoggingApp):
+    def main(self):
+        self.log.level = logging.INFO
+        self.log.info("Starting ThreatSpec language server")
+        server = PTSLanguageServer(
+            getattr(sys.stdin, "buffer", sys.stdin),
+            getattr(sys.stdout, "buffer", sys.stdout)
+        )
+        server.run()
+        self.log.info("ThreatSpec language server stopped")
+
+if __name__ == "__main__":
+    app = LanguageServerApp(
+        name="lsp_server.py",
+        description="ThreatSpec Language Server. Speaks LSP over stdin and stdout.",
+        message_format = '%(asctime)s %(levelname)s: %(message)s',
+        stream=sys.stderr
+    )
+    app.run()
@@ -1,10 +1,12 @@
 #!/usr/bin/env python
 
 import sys
-import json
 import logging
 from cli.log import LoggingApp
 from pythreatspec import pythreatspec as ts
+from pythreatspec.events import PTSEventWriter
+from pythreatspec.files import open_file, compressor
+from pythreatspec.callgraph import PTSCallGraph
 
 class PythonParserApp(LoggingApp):
     def main(self):
@@ -12,17 +14,44 @@ class PythonParserApp(LoggingApp):
         if self.params.out:
             outfile = self.params.out
         else:
-            outfile = "{}.threatspec.json".format(self.params.project)
+            outfile = "{}.threatspec.{}".format(self.params.project, self.params.format)
 
         parser = ts.PyThreatspecParser()
+        if self.params.format == "ndjson":
+            if self.params.map:
+                self.log.error("--map is not supported with --format ndjson")
+                sys.exit(1)
+            self.log.info("Writing records to {}".format(outfile))
+            with open_file(outfile, "w") as fh:
+                # Flushing each record would defeat the compression.
+                PTSEventWriter(fh, self.params.project, compressor(outfile) is None).attach(parser)
+                self.parse_files(parser)
+            return
+
+        self.parse_files(parser)
+        project_map = ts.PTSProjectMap.from_strings(self.params.map) if self.params.map else None
+        reporter = ts.PyThreatspecReporter(parser, self.params.project, self.params.canonical, self.params.source_date, project_map)
+        if self.params.shard:
+            directory = self.params.out or "{}.threatspec".format(self.params.project)
+            self.log.info("Writing shards by {} to {}".format(self.params.shard, directory))
+            manifest = reporter.write_shards(directory, self.params.shard, self.params.shard_depth, None if self.params.compact else 2)
+            self.log.info("Wrote {} shards".format(len(manifest["shards"])))
+            return
+
+        self.log.info("Writing output to {}".format(outfile))
+        with open_file(outfile, "w") as fh:
+            reporter.write_json(fh, None if self.params.compact else 2)
+
+    def parse_files(self, parser):
+        callgraph = PTSCallGraph(parser)
         for f in self.params.files:
             self.log.info("Parsing file {}".format(f))
-            parser.parse(f)
+            module = parser.parse(f)
+            if self.params.callgraph:
+                callgraph.add_file(f, module)
 
-        reporter = ts.PyThreatspecReporter(parser, self.params.project)
-        self.log.info("Writing output to {}".format(outfile))
-        with open(outfile, "w") as fh:
-            json.dumps(fh, reporter.export_to_json(), indent=2, separators=(',', ': '))
+        if self.params.callgraph:
+            self.log.info("Added {} call graph edges to the DFD".format(callgraph.merge()))
 
 if __name__ == "__main__":
     app = PythonParserApp(
@@ -31,6 +60,14 @@ if __name__ == "__main__":
         message_format = '%(asctime)s %(levelname)s: %(message)s',
     )
     app.add_param("-p", "--project", default="default", help="project name (default: default)")
-    app.add_param("-o", "--out", default=None, help="output file (default: PROJECT.threatspec.json)")
+    app.add_param("-o", "--out", default=None, help="output file, compressed if it ends in .gz, .bz2 or .xz (default: PROJECT.threatspec.FORMAT)")
+    app.add_param("--compact", action="store_true", help="write json without indentation")
+    app.add_param("--canonical", action="store_true", help="write the same json for the same model, with sorted keys, fixed timestamps and a content digest")
+    app.add_param("--source-date", default=None, type=int, help="timestamp in seconds since the epoch for --canonical (default: SOURCE_DATE_EPOCH or 0)")
+    app.add_param("--shard", default=None, choices=["boundary", "directory"], help="write a directory of json shards per boundary or source directory, with a manifest, to OUT (default: PROJECT.threatspec)")
+    app.add_param("--shard-depth", default=1, type=int, help="number of directory levels per shard with --shard directory (default: 1)")
+    app.add_param("-m", "--map", default=None, action="append", help="PATTERN=PROJECT to put elements from files below a directory, or matching a glob, in a project, may be repeated (default: all in PROJECT)")
+    app.add_param("-f", "--format", default="json", choices=["json", "ndjson"], help="json for a single document, or ndjson for one record per line as tags are found (default: json)")
+    app.add_param("-c", "--callgraph", action="store_true", help="add DFD edges for calls between tagged components")
     app.add_param("files", action="append", help="source files to parse")
     app.run()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import logging
+from cli.log import LoggingApp
+from pythreatspec import stream
+from pythreatspec.merge import merge_files
+from pythreatspec.files import open_file
+
+class MergeIrApp(LoggingApp):
+    def main(self):
+        self.log.level = logging.INFO
+
+        self.log.info("Merging {} files".format(len(self.params.files)))
+        merger = merge_files(self.params.files, self.params.workers)
+
+        for conflict in merger.conflicts:
+            self.log.warn("Conflict: {}".format(conflict))
+
+        self.log.info("Writing output to {}".format(self.params.out))
+        with open_file(self.params.out, "w") as fh:
+            stream.PTSJsonWriter(fh, None if self.params.compact else 2).write(merger.export_to_json())
+
+        if self.params.conflicts:
+            self.log.info("Writing {} conflicts to {}".format(len(merger.conflicts), self.params.conflicts))
+            with open_file(self.params.conflicts, "w") as fh:
+                json.dump([conflict.export_to_json() for conflict in merger.conflicts], fh, indent=2, separators=(',', ': '))
+
+        if self.params.strict and merger.conflicts:
+            self.log.warn("{} conflicts found".format(len(merger.conflicts)))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    app = MergeIrApp(
+        name="merge_ir.py",
+        description="ThreatSpec IR merger. Merge threatspec json or binary files by identifier, reporting conflicting values.",
+        message_format = '%(asctime)s %(levelname)s: %(message)s'
+    )
+    app.add_param("-o", "--out", required=True, help="output file, compressed if it ends in .gz, .bz2 or .xz")
+    app.add_param("-c", "--conflicts", default=None, help="write the conflicts found as JSON to this file")
+    app.add_param("-w", "--workers", default=4, type=int, help="number of files to load in parallel (default: 4)")
+    app.add_param("--compact", action="store_true", help="write json without indentation")
+    app.add_param("-s", "--strict", action="store_true", help="exit with an error if there are conflicts")
+    app.add_param("files", action="append", help="threatspec json or binary files to merge")
+    app.run()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import logging
+from cli.log import LoggingApp
+from pythreatspec.sqlstore import PTSSqliteStore, COLUMNS
+from pythreatspec.files import open_file
+
+class ModelStoreApp(LoggingApp):
+    def main(self):
+        self.log.level = logging.INFO
+
+        with PTSSqliteStore(self.params.database) as store:
+            for filename in self.params.add or []:
+                projects = store.add_file(filename, self.params.project and [self.params.project])
+                self.log.info("Added {} from {}".format(", ".join(projects) or "no projects", filename))
+
+            for project in self.params.remove or []:
+                self.log.info("Removing {}".format(project))
+                store.remove_project(project)
+
+            if self.params.export:
+                self.log.info("Exporting to {}".format(self.params.export))
+                with open_file(self.params.export, "w") as fh:
+                    json.dump(store.document(self.params.project and [self.params.project]), fh, indent=2, separators=(',', ': '))
+                return
+
+            filters = dict(
+                kind=self.params.kind, project=self.params.project, file=self.params.file,
+                boundary=self.params.boundary, component=self.params.component, threat=self.params.threat
+            )
+            if self.params.sql:
+                columns, rows = store.execute(self.params.sql)
+            elif self.params.count_by:
+                columns, rows = [self.params.count_by, "count"], store.count_by(self.params.count_by, **filters)
+            elif self.params.add or self.params.remove:
+                return
+            else:
+                columns = COLUMNS
+                rows = [[row[column] for column in COLUMNS] for row in store.select(**filters)]
+
+        if self.params.json:
+            json.dump([dict(zip(columns, row)) for row in rows], sys.stdout, indent=2, separators=(',', ': '))
+            print()
+        else:
+            print("\t".join(columns))
+            for row in rows:
+                print("\t".join("" if value is None else str(value) for value in row))
+
+if __name__ == "__main__":
+    app = ModelStoreApp(
+        name="model_store.py",
+        description="ThreatSpec model store. Keep threatspec files in a SQLite database and query them.",
+        message_format = '%(asctime)s %(levelname)s: %(message)s'
+    )
+    app.add_param("-a", "--add", default=None, action="append", help="add or replace the projects of a threatspec json or binary file, may be repeated")
+    app.add_param("-r", "--remove", default=None, action="append", help="remove a project, may be repeated")
+    app.add_param("-e", "--export", default=None, help="write the projects as a threatspec json file")
+    app.add_param("-p", "--project", default=None, help="only add, export or query this project, or projects matching this pattern when querying")
+    app.add_param("-k", "--kind", default=None, choices=["mitigations", "exposures", "acceptances", "transfers", "reviews"], help="only query elements of this kind")
+    app.add_param("-b", "--boundary", default=None, help="only query elements on this boundary, which may be a pattern such as @data*")
+    app.add_param("-c", "--component", default=None, help="only query elements on this component, which may be a pattern")
+    app.add_param("-t", "--threat", default=None, help="only query elements for this threat, which may be a pattern")
+    app.add_param("--file", default=None, help="only query elements found in this source file, which may be a pattern")
+    app.add_param("--count-by", default=None, choices=COLUMNS, help="count the matching elements by this column")
+    app.add_param("--sql", default=None, help="run a SQL query, for example against the element_details view")
+    app.add_param("--json", action="store_true", help="print the results as json")
+    app.add_param("database", help="SQLite database file, created if needed")
+    app.run()
@@ -2,16 +2,17 @@
 
 from cli.log import LoggingApp
 import yaml
-import json
 import logging
 from pythreatspec import pythreatspec as ts
+from pythreatspec.events import PTSEventWriter
+from pythreatspec.files import open_file, compressor
 
 
 class OpenapiParserApp(LoggingApp):
 
     def parse_field(self, key, data):
         field_type = key[13:]
-        self.parser._parse_comment("@{} {}".format(field_type, data), ts.PTSSource())
+        self.parser._parse_comment("@{} {}".format(field_type, data), self.parser.new_source())
 
     def parse_openapi(self, data):
         if isinstance(data, dict):
@@ -35,24 +36,41 @@ class OpenapiParserApp(LoggingApp):
         # call self.parser._parse_comment()
         pass
 
+    def parse_files(self):
+        for f in self.params.files:
+            self.log.info("Parsing file {}".format(f))
+            self.parse_file(f)
+
     def main(self):
         self.log.level = logging.INFO
 
         if self.params.out:
             outfile = self.params.out
         else:
-            outfile = "{}.threatspec.json".format(self.params.project)
+            outfile = "{}.threatspec.{}".format(self.params.project, self.params.format)
         self.parser = ts.PyThreatspecParser()
-        
-        for f in self.params.files:
-            self.log.info("Parsing file {}".format(f))
-            self.parse_file(f)
 
-        reporter = ts.PyThreatspecReporter(self.parser, self.params.project)
+        if self.params.format == "ndjson":
+            self.log.info("Writing records to {}".format(outfile))
+            with open_file(outfile, "w") as fh:
+                # Flushing each record would defeat the compression.
+                PTSEventWriter(fh, self.params.project, compressor(outfile) is None).attach(self.parser)
+                self.parse_files()
+            return
+
+        self.parse_files()
+        reporter = ts.PyThreatspecReporter(self.parser, self.params.project, self.params.canonical, self.params.source_date)
+        if self.params.shard:
+            directory = self.params.out or "{}.threatspec".format(self.params.project)
+            self.log.info("Writing shards by {} to {}".format(self.params.shard, directory))
+            manifest = reporter.write_shards(directory, self.params.shard, self.params.shard_depth, None if self.params.compact else 2)
+            self.log.info("Wrote {} shards".format(len(manifest["shards"])))
+            return
+
         self.log.info("Writing output to {}".format(outfile))
 
-        with open(outfile, "w") as fh:
-            json.dump(reporter.export_to_json(), fh, indent=2, separators=(',', ': '))
+        with open_file(outfile, "w") as fh:
+            reporter.write_json(fh, None if self.params.compact else 2)
 
 if __name__ == "__main__":
     app = OpenapiParserApp(
@@ -61,6 +79,12 @@ if __name__ == "__main__":
         message_format='%(asctime)s %(levelname)s: %(message)s'
     )
     app.add_param("-p", "--project", default="default", help="project name (default: default)")
-    app.add_param("-o", "--out", default=None, help="output file (default: PROJECT.threatspec.json)")
+    app.add_param("-o", "--out", default=None, help="output file, compressed if it ends in .gz, .bz2 or .xz (default: PROJECT.threatspec.FORMAT)")
+    app.add_param("--compact", action="store_true", help="write json without indentation")
+    app.add_param("--canonical", action="store_true", help="write the same json for the same model, with sorted keys, fixed timestamps and a content digest")
+    app.add_param("--source-date", default=None, type=int, help="timestamp in seconds since the epoch for --canonical (default: SOURCE_DATE_EPOCH or 0)")
+    app.add_param("--shard", default=None, choices=["boundary", "directory"], help="write a directory of json shards per boundary or source directory, with a manifest, to OUT (default: PROJECT.threatspec)")
+    app.add_param("--shard-depth", default=1, type=int, help="number of directory levels per shard with --shard directory (default: 1)")
+    app.add_param("-f", "--format", default="json", choices=["json", "ndjson"], help="json for a single document, or ndjson for one record per line as tags are found (default: json)")
     app.add_param("files", action="append", help="openapi files to parse")
     app.run()
@@ -0,0 +1,497 @@
+#!/usr/bin/env python
+"""Compact binary intermediate representation.
+
+Large intermediate representation files, such as the CWE and SFP threat libraries,
+are slow to load as JSON because every identifier, file name and text is parsed
+again wherever it is repeated. This module stores the same document in a versioned
+binary format instead, which can be converted to and from the JSON IR without loss:
+load(dump(document)) == document for any document with the structure of the schema.
+
+The file starts with a header and a directory of sections:
+
+    header      magic "PTSB", version (u16), reserved (u16), flags (u32), section count (u32)
+    directory   per section: tag (4 bytes), offset (u64), length (u64)
+
+Each string is stored once in the STRS section and everything else refers to it by
+index, with NONE for a missing value. Boundaries, components, threats, DFD edges,
+element groups and elements are fixed-width records of u32 fields in their own
+sections. Projects are an index over the element groups, and the groups an index
+over the elements, so PTSBinaryReader can decode a single project without reading
+the rest. Members that the records have no field for, such as the references and
+parent of a threat, are kept as a JSON string in each record's extra field.
+
+All integers are little-endian.
+
+Copyright (c) 2017 the ThreatSpec contributors
+
+This software may be modified and distributed under the terms
+of the MIT license.  See the LICENSE file for details.
+"""
+
+import json
+import mmap
+import struct
+
+from .pythreatspec import ELEMENT_KINDS, ELEMENT_TEXT
+
+MAGIC = b"PTSB"
+VERSION = 1
+NONE = 0xFFFFFFFF
+
+HEADER = struct.Struct("<4sHHII")
+SECTION = struct.Struct("<4sQQ")
+U32 = struct.Struct("<I")
+# boundary (components only), identifier, name, description, references, parent, extra
+PROPERTY = struct.Struct("<IIIIIII")
+# source boundary, source component, destination boundary, destination component, type, name, file, line, function, extra
+EDGE = struct.Struct("<IIIIIIIiII")
+# name, (first group, group count) per ELEMENT_KINDS, extra
+PROJECT = struct.Struct("<I" + "II" * len(ELEMENT_KINDS) + "I")
+# element identifier, first element, element count
+GROUP = struct.Struct("<III")
+# boundary, component, threat, text, refs, file, line, function, extra
+ELEMENT = struct.Struct("<IIIIIIiII")
+# first string id in IDS, count
+LIST = struct.Struct("<II")
+
+# The top-level collections, in the order they are written back, with a flag for each.
+COLLECTIONS = ["boundaries", "components", "threats", "dfd", "projects"]
+FLAGS = dict((name, 1 << bit) for bit, name in enumerate(COLLECTIONS))
+
+PROPERTY_SECTIONS = {"boundaries": b"BNDS", "components": b"CMPS", "threats": b"THRT"}
+PROPERTY_MEMBERS = ("name", "description", "references", "parent")
+EDGE_MEMBERS = ("type", "name", "source")
+
+INT_MIN = -(1 << 31)
+INT_MAX = (1 << 31) - 1
+
+
+class PTSBinaryWriter(object):
+    """Encodes a JSON IR document in the binary format.
+
+    A writer collects the string table as it goes, so it is used for a single document.
+    """
+
+    def __init__(self):
+        """Initialise the PTSBinaryWriter class."""
+        self.strings = []
+        self._ids = {}
+        self.sections = dict((tag, bytearray()) for tag in [b"BNDS", b"CMPS", b"THRT", b"EDGE", b"PRJS", b"GRPS", b"ELEM", b"LIST", b"IDS "])
+        self.flags = 0
+
+    def string(self, value):
+        """Return the index of a string in the string table, adding it if needed."""
+        if value is None:
+            return NONE
+        index = self._ids.get(value)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(value)
+            self._ids[value] = index
+        return index
+
+    def write(self, document, fh):
+        """Encode a document and write it to a binary file object.
+
+        Args:
+            document: A JSON IR document, as returned by json.load or PyThreatspecReporter.export_to_json.
+            fh: A file object opened for binary writing.
+
+        Returns:
+            Nothing.
+        """
+        if not isinstance(document, dict):
+            raise ValueError("a ThreatSpec document must be an object")
+
+        meta = {}
+        for key, value in document.items():
+            if key in FLAGS:
+                if not isinstance(value, dict):
+                    raise ValueError("{} must be an object".format(key))
+                self.flags |= FLAGS[key]
+            else:
+                meta[key] = value
+
+        for name, tag in PROPERTY_SECTIONS.items():
+            if name == "components":
+                for boundary_id, components in document.get(name, {}).items():
+                    if not isinstance(components, dict):
+                        raise ValueError("components of {} must be an object".format(boundary_id))
+                    if not components:
+                        self.sections[tag] += PROPERTY.pack(self.string(boundary_id), NONE, NONE, NONE, NONE, NONE, NONE)
+                    for component_id, rep in components.items():
+                        self._property(tag, boundary_id, component_id, rep)
+            else:
+                for identifier, rep in document.get(name, {}).items():
+                    self._property(tag, None, identifier, rep)
+
+        self._dfd(document.get("dfd", {}), [])
+
+        for project, details in document.get("projects", {}).items():
+            self._project(project, details)
+
+        self._write_file(json.dumps(meta, separators=(',', ':')).encode("utf-8"), fh)
+
+    def _extra(self, extra):
+        return self.string(json.dumps(extra, separators=(',', ':'))) if extra else NONE
+
+    def _text(self, rep, key, extra):
+        """Return the string index of a member, moving it to extra if it is not a string."""
+        if key not in rep:
+            return NONE
+        value = rep[key]
+        if isinstance(value, str):
+            return self.string(value)
+        extra[key] = value
+        return NONE
+
+    def _source(self, rep, extra):
+        """Return the (file, line, function) fields of the source member of rep."""
+        if "source" not in rep:
+            return NONE, 0, NONE
+        source = rep["source"]
+        if (isinstance(source, dict) and sorted(source) == ["file", "function", "line"]
+                and isinstance(source["file"], str) and isinstance(source["function"], str)
+                and type(source["line"]) is int and INT_MIN <= source["line"] <= INT_MAX):
+            return self.string(source["file"]), source["line"], self.string(source["function"])
+        extra["source"] = source
+        return NONE, 0, NONE
+
+    def _list(self, rep, key, extra):
+        """Return the LIST index of a member of rep that is a list of strings."""
+        if key not in rep:
+            return NONE
+        refs = rep[key]
+        if not isinstance(refs, list) or not all(isinstance(ref, str) for ref in refs):
+            extra[key] = refs
+            return NONE
+        ids = self.sections[b"IDS "]
+        lists = self.sections[b"LIST"]
+        index = len(lists) // LIST.size
+        lists += LIST.pack(len(ids) // U32.size, len(refs))
+        for ref in refs:
+            ids += U32.pack(self.string(ref))
+        return index
+
+    def _property(self, tag, boundary_id, identifier, rep):
+        if not isinstance(rep, dict):
+            raise ValueError("{} must be an object".format(identifier))
+        extra = dict((key, value) for key, value in rep.items() if key not in PROPERTY_MEMBERS)
+        self.sections[tag] += PROPERTY.pack(
+            self.string(boundary_id), self.string(identifier),
+            self._text(rep, "name", extra), self._text(rep, "description", extra),
+            self._list(rep, "references", extra), self._text(rep, "parent", extra),
+            self._extra(extra)
+        )
+
+    def _dfd(self, tree, path):
+        """Write an edge record for each leaf of the DFD, or for each empty level."""
+        if len(path) == 4:
+            if not isinstance(tree, dict):
+                raise ValueError("DFD edge {} must be an object".format(":".join(path)))
+            extra = dict((key, value) for key, value in tree.items() if key not in EDGE_MEMBERS)
+            type_id = self._text(tree, "type", extra)
+            name_id = self._text(tree, "name", extra)
+            fname, line, function = self._source(tree, extra)
+            self.sections[b"EDGE"] += EDGE.pack(*([self.string(node) for node in path] + [type_id, name_id, fname, line, function, self._extra(extra)]))
+            return
+        if not isinstance(tree, dict):
+            raise ValueError("DFD level {} must be an object".format(":".join(path)))
+        if not tree and path:
+            ids = [self.string(node) for node in path] + [NONE] * (4 - len(path))
+            self.sections[b"EDGE"] += EDGE.pack(*(ids + [NONE, NONE, NONE, 0, NONE, NONE]))
+        for key, subtree in tree.items():
+            self._dfd(subtree, path + [key])
+
+    def _project(self, project, details):
+        if not isinstance(details, dict):
+            raise ValueError("project {} must be an object".format(project))
+        fields = [self.string(project)]
+        for kind in ELEMENT_KINDS:
+            if kind not in details:
+                fields += [NONE, 0]
+                continue
+            groups = details[kind]
+            if not isinstance(groups, dict):
+                raise ValueError("{} of project {} must be an object".format(kind, project))
+            fields += [len(self.sections[b"GRPS"]) // GROUP.size, len(groups)]
+            for element_id, elements in groups.items():
+                if not isinstance(elements, list):
+                    raise ValueError("{} {} of project {} must be an array".format(kind, element_id, project))
+                self.sections[b"GRPS"] += GROUP.pack(self.string(element_id), len(self.sections[b"ELEM"]) // ELEMENT.size, len(elements))
+                for rep in elements:
+                    self._element(kind, rep)
+        extra = dict((key, value) for key, value in details.items() if key not in ELEMENT_KINDS)
+        fields.append(self._extra(extra))
+        self.sections[b"PRJS"] += PROJECT.pack(*fields)
+
+    def _element(self, kind, rep):
+        if not isinstance(rep, dict):
+            raise ValueError("{} must contain objects".format(kind))
+        text = ELEMENT_TEXT[kind]
+        members = ("boundary", "component", "threat", text, "refs", "source")
+        extra = dict((key, value) for key, value in rep.items() if key not in members)
+        fields = [self._text(rep, key, extra) for key in ("boundary", "component", "threat", text)]
+        fields.append(self._list(rep, "refs", extra))
+        fields.extend(self._source(rep, extra))
+        fields.append(self._extra(extra))
+        self.sections[b"ELEM"] += ELEMENT.pack(*fields)
+
+    def _string_table(self):
+        encoded = [value.encode("utf-8") for value in self.strings]
+        table = bytearray(U32.pack(len(encoded)))
+        offset = 0
+        for data in encoded:
+            table += U32.pack(offset)
+            offset += len(data)
+        table += U32.pack(offset)
+        table += b"".join(encoded)
+        return table
+
+    def _write_file(self, meta, fh):
+        sections = [(b"META", meta), (b"STRS", self._string_table())] + sorted(self.sections.items())
+        offset = HEADER.size + SECTION.size * len(sections)
+        fh.write(HEADER.pack(MAGIC, VERSION, 0, self.flags, len(sections)))
+        for tag, data in sections:
+            fh.write(SECTION.pack(tag, offset, len(data)))
+            offset += len(data)
+        for tag, data in sections:
+            fh.write(data)
+
+
+class PTSBinaryReader(object):
+    """Reads a binary IR file lazily.
+
+    Only the header and section directory are read up front. Records and strings are
+    decoded when they are asked for, so reading one project of a memory-mapped file only
+    touches the pages that hold that project, its elements and their strings.
+
+        with PTSBinaryReader.open("library.threatspec.bin") as reader:
+            threats = reader.threats()
+
+    Attributes:
+        data: The bytes-like object holding the file.
+        flags: The collection flags from the header.
+    """
+
+    def __init__(self, data):
+        """Initialise the PTSBinaryReader class from a bytes-like object."""
+        self.data = data
+        self._file = None
+        if len(data) < HEADER.size:
+            raise ValueError("not a binary ThreatSpec file")
+        magic, version, _, self.flags, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("not a binary ThreatSpec file")
+        if version != VERSION:
+            raise ValueError("unsupported binary ThreatSpec version {}".format(version))
+        self.sections = {}
+        for i in range(count):
+            tag, offset, length = SECTION.unpack_from(data, HEADER.size + SECTION.size * i)
+            self.sections[tag] = (offset, length)
+        self._strings = {}
+        offset, _ = self.sections[b"STRS"]
+        self._string_offsets = offset + U32.size
+        self._string_data = self._string_offsets + U32.size * (U32.unpack_from(data, offset)[0] + 1)
+        self._project_index = None
+
+    @classmethod
+    def open(cls, filename):
+        """Return a reader for a memory-mapped file. Close it when done."""
+        fh = open(filename, "rb")
+        try:
+            reader = cls(mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ))
+        except (ValueError, OSError):
+            fh.close()
+            raise
+        reader._file = fh
+        return reader
+
+    def close(self):
+        """Release the memory map, if any."""
+        if self._file is not None:
+            self.data.close()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def string(self, index):
+        """Return a string from the string table, or None for NONE."""
+        if index == NONE:
+            return None
+        value = self._strings.get(index)
+        if value is None:
+            start, end = LIST.unpack_from(self.data, self._string_offsets + U32.size * index)
+            value = self._strings[index] = self.data[self._string_data + start:self._string_data + end].decode("utf-8")
+        return value
+
+    def _records(self, tag, record, first=0, count=None):
+        offset, length = self.sections[tag]
+        if count is None:
+            count = length // record.size - first
+        start = offset + record.size * first
+        return (record.unpack_from(self.data, start + record.size * i) for i in range(count))
+
+    def _extra(self, index, rep):
+        if index != NONE:
+            rep.update(json.loads(self.string(index)))
+        return rep
+
+    def _set(self, rep, key, index):
+        if index != NONE:
+            rep[key] = self.string(index)
+
+    def _source(self, rep, fname, line, function):
+        if fname != NONE:
+            rep["source"] = {"file": self.string(fname), "line": line, "function": self.string(function)}
+
+    def meta(self):
+        """Return the top-level members other than the collections, such as the specification."""
+        offset, length = self.sections[b"META"]
+        return json.loads(bytes(self.data[offset:offset + length]).decode("utf-8"))
+
+    def _properties(self, name):
+        rep = {}
+        for boundary, identifier, prop_name, description, references, parent, extra in self._records(PROPERTY_SECTIONS[name], PROPERTY):
+            if boundary != NONE:
+                table = rep.setdefault(self.string(boundary), {})
+            else:
+                table = rep
+            if identifier == NONE:
+                continue
+            prop = {}
+            self._set(prop, "name", prop_name)
+            self._set(prop, "description", description)
+            if references != NONE:
+                prop["references"] = self._list(references)
+            self._set(prop, "parent", parent)
+            table[self.string(identifier)] = self._extra(extra, prop)
+        return rep
+
+    def boundaries(self):
+        """Return the boundaries object."""
+        return self._properties("boundaries")
+
+    def components(self):
+        """Return the components object."""
+        return self._properties("components")
+
+    def threats(self):
+        """Return the threats object."""
+        return self._properties("threats")
+
+    def dfd(self):
+        """Return the dfd object."""
+        rep = {}
+        for record in self._records(b"EDGE", EDGE):
+            level = rep
+            nodes = [self.string(index) for index in record[:4] if index != NONE]
+            for node in nodes[:-1]:
+                level = level.setdefault(node, {})
+            if len(nodes) < 4:
+                level.setdefault(nodes[-1], {})
+                continue
+            type_id, name_id, fname, line, function, extra = record[4:]
+            edge = {}
+            self._set(edge, "type", type_id)
+            self._set(edge, "name", name_id)
+            self._source(edge, fname, line, function)
+            level[nodes[-1]] = self._extra(extra, edge)
+        return rep
+
+    def projects(self):
+        """Return the names of the projects, in order."""
+        return list(self._projects())
+
+    def _projects(self):
+        if self._project_index is None:
+            self._project_index = dict((self.string(record[0]), record) for record in self._records(b"PRJS", PROJECT))
+        return self._project_index
+
+    def iter_elements(self, project, kinds=None):
+        """Iterate over the elements of one project, grouped by kind and element identifier.
+
+        Args:
+            project: The project name.
+            kinds: An optional list of element kinds to include. Defaults to ELEMENT_KINDS.
+
+        Returns:
+            An iterator of (kind, element_id, element JSON representation) tuples.
+        """
+        for kind, element_id, elements in self._groups(project, kinds):
+            for rep in elements:
+                yield kind, element_id, rep
+
+    def project(self, project):
+        """Return the details of one project, as in the projects object of the JSON IR."""
+        record = self._projects()[project]
+        details = {}
+        for i, kind in enumerate(ELEMENT_KINDS):
+            if record[1 + 2 * i] != NONE:
+                details[kind] = {}
+        for kind, element_id, elements in self._groups(project):
+            details[kind][element_id] = list(elements)
+        return self._extra(record[-1], details)
+
+    def _groups(self, project, kinds=None):
+        record = self._projects()[project]
+        for i, kind in enumerate(ELEMENT_KINDS):
+            if kinds is not None and kind not in kinds:
+                continue
+            first, count = record[1 + 2 * i:3 + 2 * i]
+            if first == NONE:
+                continue
+            for element_id, first_element, element_count in self._records(b"GRPS", GROUP, first, count):
+                yield kind, self.string(element_id), self._elements(kind, first_element, element_count)
+
+    def _elements(self, kind, first, count):
+        text = ELEMENT_TEXT[kind]
+        for boundary, component, threat, text_id, refs, fname, line, function, extra in self._records(b"ELEM", ELEMENT, first, count):
+            rep = {}
+            self._set(rep, "boundary", boundary)
+            self._set(rep, "component", component)
+            self._set(rep, "threat", threat)
+            self._set(rep, text, text_id)
+            if refs != NONE:
+                rep["refs"] = self._list(refs)
+            self._source(rep, fname, line, function)
+            yield self._extra(extra, rep)
+
+    def _list(self, index):
+        offset, _ = self.sections[b"LIST"]
+        first, count = LIST.unpack_from(self.data, offset + LIST.size * index)
+        return [self.string(record[0]) for record in self._records(b"IDS ", U32, first, count)]
+
+    def document(self):
+        """Return the whole document, as json.load would for the JSON IR."""
+        document = self.meta()
+        for name in COLLECTIONS:
+            if not self.flags & FLAGS[name]:
+                continue
+            if name == "dfd":
+                document[name] = self.dfd()
+            elif name == "projects":
+                document[name] = dict((project, self.project(project)) for project in self.projects())
+            else:
+                document[name] = self._properties(name)
+        return document
+
+
+def dump(document, fh):
+    """Write a JSON IR document to a binary file object in the binary format."""
+    PTSBinaryWriter().write(document, fh)
+
+
+def load(fh):
+    """Read a whole binary IR document from a binary file object."""
+    return PTSBinaryReader(fh.read()).document()
+
+
+def is_binary(data):
+    """Return True if data, the start of a file, is in the binary format."""
+    return data[:len(MAGIC)] == MAGIC
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+"""Build the DFD from a static Python call graph.
+
+Rather than relying only on @connects tags, PTSCallGraph reads the AST of each module
+and records the functions it defines and the calls made from each one. Functions are
+mapped to the components tagged in their docstrings, or in the docstring of their class,
+using the sources of the elements already found by the parser. A call from a function
+of one component to a function of another becomes a DFD edge, with the call site as its
+source. For example:
+
+    callgraph = PTSCallGraph(parser)
+    for f in files:
+        callgraph.add_file(f, parser.parse(f))
+    callgraph.merge()
+
+Calls are resolved after every file has been added, so a call can refer to a function
+in a module added later. Names are resolved through module level definitions, imports
+(including relative imports and names re-exported by a package), self and cls within
+methods, and nested functions. Resolution results are memoized, so each distinct name
+used in a module is resolved once however many times it is called. Calls that cannot
+be resolved, such as calls to methods of arbitrary objects, are ignored.
+
+Copyright (c) 2017 the ThreatSpec contributors
+
+This software may be modified and distributed under the terms
+of the MIT license.  See the LICENSE file for details.
+"""
+
+import os
+import ast
+
+from . import pythreatspec as ts
+
+FUNCTION_TYPES = tuple(getattr(ast, name) for name in ("FunctionDef", "AsyncFunctionDef") if hasattr(ast, name))
+
+
+def module_name(filename):
+    """Return the dotted module name for a Python file name.
+
+    For example "app/db/__init__.py" is "app.db" and "./app/views.py" is "app.views".
+    """
+    parts = [p for p in os.path.normpath(os.path.splitext(filename)[0]).split(os.sep) if p not in ("", ".", "..")]
+    if parts and parts[-1] == "__init__":
+        parts.pop()
+    return ".".join(parts)
+
+
+def dotted_name(node):
+    """Return the dotted name of a Name or Attribute chain, or None for other expressions."""
+    names = []
+    while isinstance(node, ast.Attribute):
+        names.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    names.append(node.id)
+    names.reverse()
+    return ".".join(names)
+
+
+class PTSCallGraph(object):
+    """Static call graph of Python modules.
+
+    Attributes:
+        parser: The PyThreatspecParser whose elements map functions to components and whose DFD is extended.
+        functions: A dict of function qualified name to (filename, lineno, name, class qualified name).
+        classes: A dict of class qualified name to (filename, lineno, name).
+        imports: A dict of module name to a dict of local name to the qualified name it is bound to.
+        calls: A list of (caller qualified name, dotted name called, lineno) tuples.
+    """
+
+    def __init__(self, parser):
+        """Initialise the PTSCallGraph class."""
+        self.parser = parser
+        self.functions = {}
+        self.classes = {}
+        self.imports = {}
+        self.packages = set()
+        self.calls = []
+        self._modules = {}
+        self._resolved = {}
+
+    def add_file(self, filename, module=None, name=None):
+        """Add the functions and calls of a Python file.
+
+        Args:
+            filename: String containing the filename, as given to the parser.
+            module: The parsed AST module. The file is read and parsed if this is None.
+            name: The dotted module name. Defaults to the name derived from filename.
+
+        Returns:
+            Nothing.
+        """
+        if module is None:
+            with open(os.path.splitext(filename)[0] + '.py', 'r') as fd:
+                module = ast.parse(fd.read())
+        if name is None:
+            name = module_name(filename)
+        if os.path.splitext(os.path.basename(filename))[0] == "__init__":
+            self.packages.add(name)
+
+        imports = self.imports.setdefault(name, {})
+        self._resolved = {}
+
+        # Each stack entry is (node, qualified name of the enclosing scope, enclosing class, enclosing function).
+        stack = [(child, name, None, None) for child in ast.iter_child_nodes(module)]
+        while stack:
+            node, scope, class_name, function = stack.pop()
+            if isinstance(node, FUNCTION_TYPES):
+                qualname = "{}.{}".format(scope, node.name)
+                self.functions[qualname] = (filename, node.lineno, node.name, class_name)
+                self._modules[qualname] = name
+                for child in node.body:
+                    stack.append((child, qualname, None, qualname))
+                continue
+            if isinstance(node, ast.ClassDef):
+                qualname = "{}.{}".format(scope, node.name)
+                self.classes[qualname] = (filename, node.lineno, node.name)
+                for child in node.body:
+                    stack.append((child, qualname, qualname, function))
+                continue
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    if alias.asname:
+                        imports[alias.asname] = alias.name
+                    else:
+                        head = alias.name.split(".")[0]
+                        imports[head] = head
+            elif isinstance(node, ast.ImportFrom):
+                base = self._import_base(name, node.module, node.level)
+                for alias in node.names:
+                    if alias.name != "*":
+                        imports[alias.asname or alias.name] = "{}.{}".format(base, alias.name) if base else alias.name
+            elif isinstance(node, ast.Call) and function is not None:
+                called = dotted_name(node.func)
+                if called:
+                    self.calls.append((function, called, node.lineno))
+            for child in ast.iter_child_nodes(node):
+                stack.append((child, scope, class_name, function))
+
+    def _import_base(self, name, module, level):
+        """Return the absolute module named by a, possibly relative, from ... import statement."""
+        if not level:
+            return module or ""
+        package = name.split(".") if name in self.packages else name.split(".")[:-1]
+        if level > 1:
+            package = package[:-(level - 1)]
+        if module:
+            package.append(module)
+        return ".".join(package)
+
+    def resolve(self, caller, called):
+        """Resolve a called name to the qualified name of a function.
+
+        Calling a class resolves to its __init__ method.
+
+        Args:
+            caller: Qualified name of the calling function.
+            called: The dotted name called.
+
+        Returns:
+            The qualified name of the function, or None if it cannot be resolved.
+        """
+        if "." not in called:
+            nested = "{}.{}".format(caller, called)
+            if nested in self.functions:
+                return nested
+
+        head = called.split(".")[0]
+        class_name = self.functions[caller][3]
+        if head in ("self", "cls") and class_name:
+            return self._resolve_attribute(class_name + called[len(head):])
+        return self._resolve(self._modules[caller], called)
+
+    def _resolve(self, module, called):
+        key = (module, called)
+        if key in self._resolved:
+            return self._resolved[key]
+        self._resolved[key] = None
+
+        head, _, rest = called.partition(".")
+        local = "{}.{}".format(module, head)
+        if local in self.functions or local in self.classes:
+            target = local
+        else:
+            target = self.imports.get(module, {}).get(head, head)
+        if rest:
+            target = "{}.{}".format(target, rest)
+
+        result = self._resolve_attribute(target)
+        self._resolved[key] = result
+        return result
+
+    def _resolve_attribute(self, target):
+        """Resolve a qualified name, following names imported into a package or module."""
+        if target in self.classes:
+            target += ".__init__"
+        if target in self.functions:
+            return target
+        module, _, name = target.rpartition(".")
+        if module in self.imports and name in self.imports[module]:
+            return self._resolve(module, name)
+        return None
+
+    def iter_calls(self):
+        """Iterate over the resolved calls.
+
+        Returns:
+            An iterator of (caller qualified name, callee qualified name, lineno) tuples.
+        """
+        for caller, called, lineno in self.calls:
+            callee = self.resolve(caller, called)
+            if callee is not None:
+                yield caller, callee, lineno
+
+    def function_components(self):
+        """Return a dict of function qualified name to the (boundary, component) tuples it is tagged with.
+
+        A method without any tags of its own takes the components of its class.
+        """
+        tagged = {}
+        for kind, element_id, element in self.parser.iter_elements():
+            source = element.source
+            if source is None:
+                continue
+            components = tagged.setdefault((source.fname, source.lineno, source.function), [])
+            component = (element.boundary, element.component)
+            if component not in components:
+                components.append(component)
+
+        function_components = {}
+        for qualname, (filename, lineno, name, class_name) in self.functions.items():
+            components = tagged.get((filename, lineno, name))
+            if not components and class_name:
+                components = tagged.get(self.classes[class_name])
+            if components:
+                function_components[qualname] = components
+        return function_components
+
+    def component_edges(self):
+        """Return the calls between functions of different components.
+
+        Returns:
+            A list of (source component, destination component, caller, callee, lineno) tuples,
+            with one entry for the first call site of each callee from each pair of components.
+        """
+        function_components = self.function_components()
+        seen = set()
+        edges = []
+        for caller, callee, lineno in self.iter_calls():
+            sources = function_components.get(caller)
+            dests = function_components.get(callee)
+            if not sources or not dests:
+                continue
+            for source in sources:
+                for dest in dests:
+                    key = (source, dest, callee)
+                    if source != dest and key not in seen:
+                        seen.add(key)
+                        edges.append((source, dest, caller, callee, lineno))
+        return edges
+
+    def merge(self):
+        """Add an edge to the parser's DFD for each call between components.
+
+        Edges are named after the function called, and their source is the call site.
+
+        Returns:
+            The number of edges added.
+        """
+        dfd = self.parser.dfd
+        symbols = self.parser.symbols
+        before = len(dfd.edges)
+        for source, dest, caller, callee, lineno in self.component_edges():
+            filename, _, name, _ = self.functions[caller]
+            self.parser.add_edge(ts.PTSDfdEdge(
+                source[0], source[1], dest[0], dest[1],
+                ts.PTSDfdEdge.UNI_DIRECTIONAL,
+                symbols.intern(callee),
+                self.parser.new_source(filename, lineno, name)
+            ))
+        return len(dfd.edges) - before
+
+    def export_to_json(self):
+        """Return the resolved calls as a list of call objects, as defined by the schema."""
+        return [{"source": caller, "destination": callee} for caller, callee, lineno in self.iter_calls()]
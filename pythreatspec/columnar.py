@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+"""Columnar element storage for very large ThreatSpec models.
+
+By default PyThreatspecParser keeps mitigations, exposures, acceptances, transfers
+and reviews as dicts of lists of element objects. For portfolio-wide models with
+millions of elements this object graph dominates memory use and makes reporting
+slow, as every filter has to walk it.
+
+PTSColumnarStore is an alternative element store that keeps one row per element in
+parallel array columns of integers: the kind, element identifier, boundary, component
+and threat (as PTSSymbolTable ids), the text (as an index into a text table) and the
+source (as PTSSourceTable indexes). Filters and aggregations run as tight loops over
+these arrays. The store exports exactly the same project JSON as the default storage.
+
+    parser = PTSColumnarStore.new_parser()
+    parser.parse("example.py")
+    report = parser.store.select(kind="exposures", threat="@cwe_319_cleartext_transmission")
+
+Copyright (c) 2017 the ThreatSpec contributors
+
+This software may be modified and distributed under the terms
+of the MIT license.  See the LICENSE file for details.
+"""
+
+from array import array
+
+from . import pythreatspec as ts
+
+
+class PTSColumnarStore(object):
+    """Stores elements as parallel columns.
+
+    Attributes:
+        symbols: The PTSSymbolTable used for identifiers.
+        source_table: The PTSSourceTable used for source file and function names.
+        texts: A list of element text strings, indexed by the text column.
+        kind: Column of indexes into ELEMENT_KINDS.
+        element_id: Column of element identifier symbol ids.
+        boundary: Column of boundary symbol ids.
+        component: Column of component symbol ids.
+        threat: Column of threat symbol ids, or -1 for reviews.
+        text: Column of indexes into texts.
+        file: Column of source file indexes, or -1 if the source has not been set.
+        line: Column of source line numbers.
+        function: Column of source function indexes.
+        refs: A dict of row number to references, for the few rows that have them.
+    """
+
+    COLUMNS = ["kind", "element_id", "boundary", "component", "threat", "text", "file", "line", "function"]
+
+    def __init__(self, symbols=None, source_table=None):
+        """Initialise the PTSColumnarStore class.
+
+        Args:
+            symbols: An optional PTSSymbolTable. Pass the parser's table to share identifiers with it.
+            source_table: An optional PTSSourceTable. Pass the parser's table to share names with it.
+        """
+        self.symbols = symbols if symbols is not None else ts.PTSSymbolTable()
+        self.source_table = source_table if source_table is not None else ts.PTSSourceTable()
+        self.texts = []
+        self._text_index = {}
+        self.refs = {}
+
+        self.kind = array('b')
+        for column in self.COLUMNS[1:]:
+            setattr(self, column, array('i'))
+
+    @classmethod
+    def new_parser(cls):
+        """Return a new parser that stores its elements in a new PTSColumnarStore.
+
+        The parser shares the store's symbol and source tables.
+        """
+        return ts.PyThreatspecParser(store=cls())
+
+    def __len__(self):
+        return len(self.kind)
+
+    def _text(self, text):
+        """Return the index of an element text, adding it to the text table if needed."""
+        index = self._text_index.get(text)
+        if index is None:
+            index = len(self.texts)
+            self.texts.append(text)
+            self._text_index[text] = index
+        return index
+
+    def add_element(self, kind, element_id, element):
+        """Add an element as a new row.
+
+        Args:
+            kind: One of ELEMENT_KINDS.
+            element_id: The identifier of the element text.
+            element: A PTSElement or PTSReview instance.
+
+        Returns:
+            The row number.
+        """
+        row = len(self.kind)
+        threat = getattr(element, "threat", None)
+        self.kind.append(ts.ELEMENT_KINDS.index(kind))
+        self.element_id.append(self.symbols.id_of(element_id))
+        self.boundary.append(self.symbols.id_of(element.boundary))
+        self.component.append(self.symbols.id_of(element.component))
+        self.threat.append(self.symbols.id_of(threat) if threat is not None else -1)
+        self.text.append(self._text(getattr(element, ts.ELEMENT_TEXT[kind])))
+
+        source = element.source
+        if source is None:
+            self.file.append(-1)
+            self.line.append(0)
+            self.function.append(-1)
+        elif source.table is self.source_table:
+            self.file.append(source.file_index)
+            self.line.append(source.lineno)
+            self.function.append(source.function_index)
+        else:
+            self.file.append(self.source_table.file_index(source.fname))
+            self.line.append(source.lineno)
+            self.function.append(self.source_table.function_index(source.function))
+
+        if element.refs:
+            self.refs[row] = list(element.refs)
+        return row
+
+    def source(self, row):
+        """Return the PTSSource for a row, or None if it has not been set."""
+        if self.file[row] < 0:
+            return None
+        return self.source_table.expand((self.file[row], self.line[row], self.function[row]))
+
+    def element(self, row):
+        """Return a new element object for a row."""
+        kind = ts.ELEMENT_KINDS[self.kind[row]]
+        boundary = self.symbols.lookup(self.boundary[row])
+        component = self.symbols.lookup(self.component[row])
+        text = self.texts[self.text[row]]
+        refs = self.refs.get(row, [])
+        if kind == "reviews":
+            element = ts.PTSReview(boundary, component, text, refs)
+        else:
+            threat = self.symbols.lookup(self.threat[row])
+            if kind == "mitigations":
+                element = ts.PTSMitigation(boundary, component, threat, text, refs)
+            elif kind == "exposures":
+                element = ts.PTSExposure(boundary, component, threat, text, refs)
+            elif kind == "acceptances":
+                element = ts.PTSAcceptance(boundary, component, threat, text, refs)
+            else:
+                element = ts.PTSTransfer(boundary, component, threat, text, refs)
+        element.source = self.source(row)
+        return element
+
+    def rows(self, kinds=None):
+        """Return the row numbers grouped by kind, then element identifier, then insertion order.
+
+        This is the order used by the default dict of lists storage, and so the order
+        of the exported JSON.
+        """
+        kind_codes = [ts.ELEMENT_KINDS.index(kind) for kind in (kinds or ts.ELEMENT_KINDS)]
+        groups = {}
+        order = []
+        kind_column = self.kind
+        element_id_column = self.element_id
+        for row in range(len(kind_column)):
+            key = (kind_column[row], element_id_column[row])
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = array('i')
+                order.append(key)
+            group.append(row)
+
+        rows = []
+        for kind_code in kind_codes:
+            for key in order:
+                if key[0] == kind_code:
+                    rows.extend(groups[key])
+        return rows
+
+    def iter_elements(self, kinds=None):
+        """Iterate over (kind, element_id, element) tuples, in the same order as the parser."""
+        for row in self.rows(kinds):
+            yield ts.ELEMENT_KINDS[self.kind[row]], self.symbols.lookup(self.element_id[row]), self.element(row)
+
+    def select(self, kind=None, boundary=None, component=None, threat=None):
+        """Return the row numbers of the elements matching all of the given criteria.
+
+        Args:
+            kind: An optional element kind, for example "exposures".
+            boundary: An optional boundary identifier.
+            component: An optional component identifier.
+            threat: An optional threat identifier.
+
+        Returns:
+            A list of row numbers in insertion order.
+        """
+        filters = []
+        if kind is not None:
+            filters.append((self.kind, ts.ELEMENT_KINDS.index(kind)))
+        for column, identifier in [(self.boundary, boundary), (self.component, component), (self.threat, threat)]:
+            if identifier is not None:
+                symbol_id = self.symbols.get(identifier)
+                if symbol_id is None:
+                    return []
+                filters.append((column, symbol_id))
+
+        if not filters:
+            return list(range(len(self.kind)))
+
+        column, value = filters[0]
+        rows = [row for row in range(len(column)) if column[row] == value]
+        for column, value in filters[1:]:
+            rows = [row for row in rows if column[row] == value]
+        return rows
+
+    def count_by(self, column, rows=None):
+        """Count the elements by the value of a column.
+
+        Args:
+            column: One of "kind", "element_id", "boundary", "component" or "threat".
+            rows: An optional list of row numbers to count, for example from select().
+
+        Returns:
+            A dict of identifier (or kind) to count.
+        """
+        values = getattr(self, column)
+        counts = {}
+        if rows is None:
+            for value in values:
+                counts[value] = counts.get(value, 0) + 1
+        else:
+            for row in rows:
+                value = values[row]
+                counts[value] = counts.get(value, 0) + 1
+
+        if column == "kind":
+            return dict((ts.ELEMENT_KINDS[value], count) for value, count in counts.items())
+        return dict((self.symbols.lookup(value) if value >= 0 else None, count) for value, count in counts.items())
+
+    def export_to_json(self):
+        """Return a JSON representation of this class.
+
+        This is the same as the project details written by PyThreatspecReporter when
+        using the default storage.
+        """
+        rep = {}
+        for kind in ts.ELEMENT_KINDS:
+            rep[kind] = {}
+        for row in self.rows():
+            kind = ts.ELEMENT_KINDS[self.kind[row]]
+            element_id = self.symbols.lookup(self.element_id[row])
+            source = self.source(row)
+            if source is None:
+                raise ValueError("metadata has not been set")
+            element_rep = {
+                "boundary": self.symbols.lookup(self.boundary[row]),
+                "component": self.symbols.lookup(self.component[row])
+            }
+            if kind != "reviews":
+                element_rep["threat"] = self.symbols.lookup(self.threat[row])
+            else:
+                element_rep["review"] = self.texts[self.text[row]]
+            element_rep["refs"] = self.refs.get(row, [])
+            element_rep["source"] = source.export_to_json()
+            if kind != "reviews":
+                element_rep[ts.ELEMENT_TEXT[kind]] = self.texts[self.text[row]]
+            if element_id not in rep[kind]:
+                rep[kind][element_id] = []
+            rep[kind][element_id].append(element_rep)
+        return rep
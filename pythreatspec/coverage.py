@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+"""Threat coverage for ThreatSpec models.
+
+The main question asked of a threat model is which exposures have no matching
+mitigation, transfer or acceptance on the same boundary, component and threat.
+PTSCoverage answers this in a single pass over the elements by grouping them on
+their (boundary, component, threat) symbol ids, so it runs in linear time, and it can
+be attached to a parser as a listener to be kept up to date as elements are added.
+
+    coverage = PTSCoverage.from_parser(parser)
+    for boundary_id, component_id, threat_id in coverage.unmitigated():
+        ...
+
+Copyright (c) 2017 the ThreatSpec contributors
+
+This software may be modified and distributed under the terms
+of the MIT license.  See the LICENSE file for details.
+"""
+
+from . import pythreatspec as ts
+
+
+EXPOSED = 1
+MITIGATED = 2
+ACCEPTED = 4
+TRANSFERRED = 8
+
+KIND_FLAGS = {
+    "exposures": EXPOSED,
+    "mitigations": MITIGATED,
+    "acceptances": ACCEPTED,
+    "transfers": TRANSFERRED
+}
+
+STATUSES = ["unmitigated", "mitigated", "transferred", "accepted"]
+
+
+def coverage_status(flags):
+    """Return the coverage status for a set of flags.
+
+    A threat that is mitigated on a component counts as mitigated however else it is
+    handled. Otherwise a transfer takes precedence over an acceptance. An exposure with
+    none of these is unmitigated.
+
+    Args:
+        flags: An integer combination of EXPOSED, MITIGATED, ACCEPTED and TRANSFERRED.
+
+    Returns:
+        One of STATUSES.
+    """
+    if flags & MITIGATED:
+        return "mitigated"
+    elif flags & TRANSFERRED:
+        return "transferred"
+    elif flags & ACCEPTED:
+        return "accepted"
+    return "unmitigated"
+
+
+class PTSCoverage(object):
+    """Coverage status per boundary, component and threat.
+
+    Attributes:
+        symbols: The PTSSymbolTable used for identifiers.
+        flags: A dict of (boundary, component, threat) symbol ids to coverage flags.
+        exposures: A dict of (boundary, component, threat) symbol ids to a list of
+            (exposure text, source JSON) tuples.
+    """
+
+    def __init__(self, symbols=None):
+        """Initialise the PTSCoverage class.
+
+        Args:
+            symbols: An optional PTSSymbolTable. Pass the parser's table to share identifiers with it.
+        """
+        self.symbols = symbols if symbols is not None else ts.PTSSymbolTable()
+        self.flags = {}
+        self.exposures = {}
+
+    @classmethod
+    def from_parser(cls, parser, attach=True):
+        """Compute the coverage of a parser's elements.
+
+        Args:
+            parser: A PyThreatspecParser instance.
+            attach: If True, the coverage is added to the parser's listeners so that it
+                is updated as more elements are added.
+
+        Returns:
+            A PTSCoverage object.
+        """
+        coverage = cls(parser.symbols)
+        for kind, element_id, element in parser.iter_elements(list(KIND_FLAGS.keys())):
+            coverage.add_element(kind, element_id, element)
+        if attach:
+            parser.listeners.append(coverage)
+        return coverage
+
+    @classmethod
+    def from_json(cls, data, projects=None, coverage=None):
+        """Compute the coverage of an intermediate representation document.
+
+        Args:
+            data: A dict loaded from a .threatspec.json file.
+            projects: An optional list of project names to include. Defaults to all projects.
+            coverage: An optional PTSCoverage to add to, for combining several documents.
+
+        Returns:
+            A PTSCoverage object.
+        """
+        if coverage is None:
+            coverage = cls()
+        for project, details in data.get("projects", {}).items():
+            if projects is not None and project not in projects:
+                continue
+            for kind in KIND_FLAGS:
+                for element_id, reps in details.get(kind, {}).items():
+                    for rep in reps:
+                        coverage.add(kind, rep["boundary"], rep["component"], rep["threat"],
+                                     rep.get(ts.ELEMENT_TEXT[kind]), rep.get("source"))
+        return coverage
+
+    def add(self, kind, boundary_id, component_id, threat_id, text=None, source=None):
+        """Record an element.
+
+        Args:
+            kind: An element kind. Reviews are ignored as they have no threat.
+            boundary_id: Boundary identifier string.
+            component_id: Component identifier string.
+            threat_id: Threat identifier string.
+            text: The element text, kept for exposures.
+            source: The source JSON, kept for exposures.
+
+        Returns:
+            Nothing.
+        """
+        flag = KIND_FLAGS.get(kind)
+        if flag is None:
+            return
+        key = (self.symbols.id_of(boundary_id), self.symbols.id_of(component_id), self.symbols.id_of(threat_id))
+        self.flags[key] = self.flags.get(key, 0) | flag
+        if flag == EXPOSED:
+            self.exposures.setdefault(key, []).append((text, source))
+
+    def add_element(self, kind, element_id, element):
+        """Record an element. Called by the parser as each element is added."""
+        if kind not in KIND_FLAGS:
+            return
+        source = element.source.export_to_json() if element.source is not None else None
+        self.add(kind, element.boundary, element.component, element.threat,
+                 getattr(element, ts.ELEMENT_TEXT[kind]), source)
+
+    def status(self, boundary_id, component_id, threat_id):
+        """Return the coverage status of a threat on a component, or None if it isn't referenced."""
+        key = (self.symbols.get(boundary_id), self.symbols.get(component_id), self.symbols.get(threat_id))
+        flags = self.flags.get(key)
+        return coverage_status(flags) if flags is not None else None
+
+    def _identifiers(self, key):
+        lookup = self.symbols.lookup
+        return lookup(key[0]), lookup(key[1]), lookup(key[2])
+
+    def unmitigated(self):
+        """Return the (boundary, component, threat) identifiers of the unmitigated exposures."""
+        return [
+            self._identifiers(key) for key, flags in self.flags.items()
+            if flags == EXPOSED
+        ]
+
+    def summary(self):
+        """Return the number of exposed (boundary, component, threat) combinations with each status.
+
+        Combinations that are mitigated, transferred or accepted without being exposed
+        are counted as unexposed rather than in STATUSES, so the statuses add up to the
+        number exposed, and total counts every combination.
+        """
+        summary = dict((status, 0) for status in STATUSES)
+        unexposed = 0
+        for flags in self.flags.values():
+            if flags & EXPOSED:
+                summary[coverage_status(flags)] += 1
+            else:
+                unexposed += 1
+        summary["total"] = len(self.flags)
+        summary["exposed"] = summary["total"] - unexposed
+        summary["unexposed"] = unexposed
+        return summary
+
+    def export_to_json(self):
+        """Return a JSON representation of this class.
+
+        The report contains a summary of counts, the coverage status of every boundary,
+        component and threat combination, and the details of the unmitigated exposures.
+        """
+        rep = {
+            "summary": self.summary(),
+            "coverage": {},
+            "unmitigated": {}
+        }
+        for key, flags in self.flags.items():
+            boundary_id, component_id, threat_id = self._identifiers(key)
+            status = coverage_status(flags)
+            rep["coverage"].setdefault(boundary_id, {}).setdefault(component_id, {})[threat_id] = status
+            if status == "unmitigated":
+                rep["unmitigated"].setdefault(boundary_id, {}).setdefault(component_id, {})[threat_id] = [
+                    {"exposure": text, "source": source} for text, source in self.exposures[key]
+                ]
+        return rep
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""Semantic differences between two threat models.
+
+The order of members in IR documents is not stable between runs, so a textual diff
+of two documents mostly shows noise. PTSDiff compares the models instead. Each
+boundary, component, threat, DFD edge and element is reduced to a key:
+
+    boundaries  (boundary)
+    components  (boundary, component)
+    threats     (threat)
+    dfd         (source boundary, source component, dest boundary, dest component, type, name)
+    elements    (kind, boundary, component, threat, text, file, line)
+
+The keys of each document are counted in a single pass and the counts subtracted, so
+a diff runs in linear time in the size of the models, and an element found twice
+counts twice. With ignore_lines the source file and line are left out of element
+keys, so elements that only moved, within their file or to another file, are not
+reported. Boundaries, components and threats whose name or description changed are
+reported as changed.
+
+    diff = PTSDiff(old_document, new_document, ignore_lines=True)
+    for line in diff.summary():
+        print(line)
+
+Copyright (c) 2017 the ThreatSpec contributors
+
+This software may be modified and distributed under the terms
+of the MIT license.  See the LICENSE file for details.
+"""
+
+from collections import Counter
+
+from . import pythreatspec as ts
+from .files import load_document
+
+SECTIONS = ["boundaries", "components", "threats", "dfd", "elements"]
+
+KEY_FIELDS = {
+    "boundaries": ["boundary"],
+    "components": ["boundary", "component"],
+    "threats": ["threat"],
+    "dfd": ["source_boundary", "source_component", "dest_boundary", "dest_component", "type", "name"],
+    "elements": ["kind", "boundary", "component", "threat", "text", "file", "line"]
+}
+
+
+def property_keys(document):
+    """Return a dict of the properties of a document for each property section.
+
+    Each is a dict from the key of a boundary, component or threat to its (name,
+    description).
+    """
+    properties = dict((section, {}) for section in ["boundaries", "components", "threats"])
+    for boundary_id, rep in document.get("boundaries", {}).items():
+        properties["boundaries"][(boundary_id,)] = (rep.get("name"), rep.get("description"))
+    for boundary_id, components in document.get("components", {}).items():
+        for component_id, rep in components.items():
+            properties["components"][(boundary_id, component_id)] = (rep.get("name"), rep.get("description"))
+    for threat_id, rep in document.get("threats", {}).items():
+        properties["threats"][(threat_id,)] = (rep.get("name"), rep.get("description"))
+    return properties
+
+
+def edge_keys(document):
+    """Return a Counter of the DFD edge keys of a document."""
+    keys = Counter()
+    for source_boundary_id, source_components in document.get("dfd", {}).items():
+        for source_component_id, dest_boundaries in source_components.items():
+            for dest_boundary_id, dest_components in dest_boundaries.items():
+                for dest_component_id, details in dest_components.items():
+                    keys[(source_boundary_id, source_component_id, dest_boundary_id, dest_component_id,
+                          details.get("type"), details.get("name", ""))] += 1
+    return keys
+
+
+def element_keys(document, ignore_lines=False):
+    """Return a Counter of the element keys of all projects of a document.
+
+    Args:
+        document: A JSON IR document.
+        ignore_lines: If True, leave the source file and line out of the keys, as None.
+
+    Returns:
+        A Counter of (kind, boundary, component, threat, text, file, line) tuples.
+    """
+    keys = Counter()
+    for details in document.get("projects", {}).values():
+        for kind in ts.ELEMENT_KINDS:
+            field = ts.ELEMENT_TEXT[kind]
+            for elements in details.get(kind, {}).values():
+                for rep in elements:
+                    source = rep.get("source", {})
+                    if ignore_lines:
+                        location = (None, None)
+                    else:
+                        location = (source.get("file"), source.get("line"))
+                    keys[(kind, rep.get("boundary"), rep.get("component"), rep.get("threat"), rep.get(field)) + location] += 1
+    return keys
+
+
+class PTSDiff(object):
+    """The semantic differences between an old and a new threat model.
+
+    Attributes:
+        added: A dict from each of SECTIONS to a sorted list of the keys only in the new model.
+        removed: A dict from each of SECTIONS to a sorted list of the keys only in the old model.
+        changed: A dict from boundaries, components and threats to a sorted list of
+            (key, old (name, description), new (name, description)) tuples.
+        ignore_lines: Whether source locations were left out of element keys.
+    """
+
+    def __init__(self, old, new, ignore_lines=False):
+        """Initialise the PTSDiff class.
+
+        Args:
+            old: The old JSON IR document.
+            new: The new JSON IR document.
+            ignore_lines: If True, elements that only moved to another line or file are not reported.
+        """
+        self.ignore_lines = ignore_lines
+        self.added = {}
+        self.removed = {}
+        self.changed = {}
+
+        old_properties = property_keys(old)
+        new_properties = property_keys(new)
+        for section, old_keys in old_properties.items():
+            new_keys = new_properties[section]
+            self.added[section] = sorted(key for key in new_keys if key not in old_keys)
+            self.removed[section] = sorted(key for key in old_keys if key not in new_keys)
+            self.changed[section] = sorted(
+                (key, old_keys[key], new_keys[key]) for key in old_keys if key in new_keys and old_keys[key] != new_keys[key]
+            )
+
+        self._counted("dfd", edge_keys(old), edge_keys(new))
+        self._counted("elements", element_keys(old, ignore_lines), element_keys(new, ignore_lines))
+
+    def _counted(self, section, old_keys, new_keys):
+        self.added[section] = sorted((new_keys - old_keys).elements(), key=sort_key)
+        self.removed[section] = sorted((old_keys - new_keys).elements(), key=sort_key)
+
+    def __bool__(self):
+        return any(self.added.values()) or any(self.removed.values()) or any(self.changed.values())
+
+    __nonzero__ = __bool__
+
+    def counts(self):
+        """Return a dict of the number of added, removed and changed keys for each section."""
+        return dict(
+            (section, {
+                "added": len(self.added[section]),
+                "removed": len(self.removed[section]),
+                "changed": len(self.changed.get(section, []))
+            })
+            for section in SECTIONS
+        )
+
+    def summary(self):
+        """Return a list of lines summarising the differences, for people to read."""
+        lines = []
+        for section in SECTIONS:
+            for sign, keys in (("+", self.added[section]), ("-", self.removed[section])):
+                for key in keys:
+                    lines.append("{} {} {}".format(sign, section, describe(section, key)))
+            for key, old, new in self.changed.get(section, []):
+                lines.append("~ {} {} {!r} -> {!r}".format(section, ":".join(key), old[0], new[0])
+                             if old[0] != new[0] else
+                             "~ {} {} description changed".format(section, ":".join(key)))
+        return lines
+
+    def export_to_json(self):
+        """Return a JSON representation of this class."""
+        rep = {"ignore_lines": self.ignore_lines, "counts": self.counts(), "added": {}, "removed": {}, "changed": {}}
+        for section in SECTIONS:
+            fields = KEY_FIELDS[section]
+            rep["added"][section] = [dict(zip(fields, key)) for key in self.added[section]]
+            rep["removed"][section] = [dict(zip(fields, key)) for key in self.removed[section]]
+        for section, changes in self.changed.items():
+            fields = KEY_FIELDS[section]
+            rep["changed"][section] = [
+                dict(zip(fields, key), old={"name": old[0], "description": old[1]}, new={"name": new[0], "description": new[1]})
+                for key, old, new in changes
+            ]
+        return rep
+
+
+def sort_key(key):
+    """Return a sort key for a key that may hold None, such as the threat of a review."""
+    return tuple((value is not None, value if value is not None else "") for value in key)
+
+
+def describe(section, key):
+    """Return a key as a line of text."""
+    if section == "dfd":
+        return "{}:{} -> {}:{} ({}{})".format(key[0], key[1], key[2], key[3], key[4], ", " + key[5] if key[5] else "")
+    if section == "elements":
+        kind, boundary_id, component_id, threat_id, text, fname, lineno = key
+        if fname is None:
+            location = ""
+        elif lineno is None:
+            location = " at {}".format(fname)
+        else:
+            location = " at {}:{}".format(fname, lineno)
+        against = " against {}".format(threat_id) if threat_id is not None else ""
+        return "{} {}:{}{} {!r}{}".format(kind, boundary_id, component_id, against, text, location)
+    return ":".join(key)
+
+
+def diff_files(old_filename, new_filename, ignore_lines=False):
+    """Return the PTSDiff between two JSON or binary IR files, which may be compressed."""
+    return PTSDiff(load_document(old_filename), load_document(new_filename), ignore_lines)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""JSON Lines (NDJSON) event output.
+
+Instead of a single intermediate representation document written once parsing has
+finished, PTSEventWriter writes one self-contained JSON record per line as each
+boundary, component, threat, DFD edge and element is found. It is attached to a
+parser as a listener, so nothing is accumulated beyond what the parser itself keeps
+and downstream tools, such as a SIEM or data warehouse loader, can consume the
+records while parsing is still going on.
+
+Every record has an "event" member naming its type:
+
+    {"event": "document", "specification": {...}, "project": "...", "created": ...}
+    {"event": "boundary", "id": "@web", "name": "Web"}
+    {"event": "component", "boundary": "@web", "id": "@server", "name": "Server"}
+    {"event": "threat", "id": "@xss", "name": "XSS", "description": "..."}
+    {"event": "edge", "source_boundary": ..., "dest_component": ..., "type": "uni", "name": "", "source": {...}}
+    {"event": "element", "kind": "mitigations", "id": "@output_encoding", "boundary": ..., "source": {...}}
+
+A boundary, component or threat is written again when @describe gives it a
+description, and the later record replaces the earlier one. load_events rebuilds a
+PyThreatspecParser from a stream of records.
+
+Copyright (c) 2017 the ThreatSpec contributors
+
+This software may be modified and distributed under the terms
+of the MIT license.  See the LICENSE file for details.
+"""
+
+import json
+
+from . import pythreatspec as ts
+
+PROPERTY_CLASSES = {
+    "boundary": ts.PTSBoundary,
+    "component": ts.PTSComponent,
+    "threat": ts.PTSThreat
+}
+
+
+class PTSEventWriter(object):
+    """Writes parser events to a file as JSON Lines.
+
+    Attributes:
+        fh: The file object written to.
+        project: The project name recorded in the document record.
+        flush: If True, fh is flushed after every record so that readers see it straight away.
+    """
+
+    def __init__(self, fh, project, flush=True):
+        """Initialise the PTSEventWriter class."""
+        self.fh = fh
+        self.project = project
+        self.flush = flush
+
+    def attach(self, parser):
+        """Write the document record and add this writer to the parser's listeners.
+
+        Anything the parser already holds is written first, so the writer can be attached
+        to a parser that has been partly loaded.
+
+        Args:
+            parser: A PyThreatspecParser instance.
+
+        Returns:
+            The writer.
+        """
+        self.write({
+            "event": "document",
+            "specification": {
+                "name": "ThreatSpec",
+                "version": "0.1.0"
+            },
+            "project": self.project,
+            "created": parser.creation_time
+        })
+        for boundary_id, boundary in parser.boundaries.items():
+            self.add_property("boundary", boundary_id, boundary)
+        for boundary_id, components in parser.components.items():
+            for component_id, component in components.items():
+                self.add_property("component", component_id, component, boundary_id)
+        for threat_id, threat in parser.threats.items():
+            self.add_property("threat", threat_id, threat)
+        for edge in parser.dfd.edges:
+            self.add_edge(edge)
+        for kind, element_id, element in parser.iter_elements():
+            self.add_element(kind, element_id, element)
+        parser.listeners.append(self)
+        return self
+
+    def write(self, record):
+        """Write a single record as a line."""
+        self.fh.write(json.dumps(record, separators=(',', ':')) + "\n")
+        if self.flush:
+            self.fh.flush()
+
+    def add_property(self, pclass, identifier, prop, boundary_id=None):
+        """Write a boundary, component or threat record. Called by the parser."""
+        record = {"event": pclass}
+        if boundary_id is not None:
+            record["boundary"] = boundary_id
+        record["id"] = identifier
+        record.update(prop.export_to_json())
+        self.write(record)
+
+    def add_edge(self, edge):
+        """Write a DFD edge record. Called by the parser."""
+        self.write({
+            "event": "edge",
+            "source_boundary": edge.source_boundary_id,
+            "source_component": edge.source_component_id,
+            "dest_boundary": edge.dest_boundary_id,
+            "dest_component": edge.dest_component_id,
+            "type": edge.connection_type,
+            "name": edge.name,
+            "source": edge.source.export_to_json()
+        })
+
+    def add_element(self, kind, element_id, element):
+        """Write an element record. Called by the parser."""
+        record = {"event": "element", "kind": kind, "id": element_id}
+        record.update(element.export_to_json())
+        self.write(record)
+
+
+def load_events(fh, parser=None):
+    """Rebuild a parser from JSON Lines records written by PTSEventWriter.
+
+    Records are applied one at a time as they are read, so the stream is never held in
+    memory. Blank lines are skipped.
+
+    Args:
+        fh: An iterable of lines, such as a file object opened for reading.
+        parser: An optional PyThreatspecParser to load into. A new one is created if this is None.
+
+    Returns:
+        A (parser, project) tuple. The project is None if the stream has no document record.
+    """
+    if parser is None:
+        parser = ts.PyThreatspecParser()
+    project = None
+
+    for lineno, line in enumerate(fh, 1):
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        event = record.get("event")
+
+        if event == "document":
+            project = record.get("project")
+            if "created" in record:
+                parser.creation_time = record["created"]
+        elif event in PROPERTY_CLASSES:
+            parser.set_property(event, record["id"], PROPERTY_CLASSES[event].from_json(record), record.get("boundary"))
+        elif event == "edge":
+            parser.add_edge(ts.PTSDfdEdge(
+                record["source_boundary"], record["source_component"],
+                record["dest_boundary"], record["dest_component"],
+                record["type"], record.get("name", ""),
+                ts.PTSSource.from_json(record.get("source", {}), parser.source_table)
+            ))
+        elif event == "element":
+            kind = record["kind"]
+            if kind not in ts.ELEMENT_KINDS:
+                raise ValueError("unknown element kind {} on line {}".format(kind, lineno))
+            element = ts.element_from_json(kind, record, parser.source_table)
+            element.boundary = parser.symbols.intern(element.boundary)
+            element.component = parser.symbols.intern(element.component)
+            if kind != "reviews":
+                element.threat = parser.symbols.intern(element.threat)
+            parser.add_element(kind, parser.symbols.intern(record["id"]), element)
+        else:
+            raise ValueError("unknown event {} on line {}".format(event, lineno))
+
+    return parser, project
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""Reading and writing compressed intermediate representation files.
+
+IR files are mostly whitespace and repeated keys, so they compress well. open_file
+opens a file through the gzip, bz2 or lzma module of the standard library when its
+name ends in .gz, .bz2 or .xz. When reading, the compression is recognised from the
+first bytes of the file instead, so a compressed file is read correctly whatever it
+is called. Data is compressed and decompressed as it is streamed, so whole files are
+never held in memory. Python 2 has no lzma module, so .xz files are only supported
+on Python 3.
+
+load_document reads a JSON or binary IR document from any of these files.
+
+Copyright (c) 2017 the ThreatSpec contributors
+
+This software may be modified and distributed under the terms
+of the MIT license.  See the LICENSE file for details.
+"""
+
+import bz2
+import gzip
+import json
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+from . import binary
+
+COMPRESSORS = {
+    ".gz": gzip,
+    ".bz2": bz2
+}
+
+SIGNATURES = [
+    (b"\x1f\x8b", gzip),
+    (b"BZh", bz2)
+]
+
+XZ_EXTENSION = ".xz"
+XZ_SIGNATURE = b"\xfd7zXZ\x00"
+
+if lzma is not None:
+    COMPRESSORS[XZ_EXTENSION] = lzma
+    SIGNATURES.append((XZ_SIGNATURE, lzma))
+
+
+def compressor(filename):
+    """Return the compression module for a file name, or None if it is not compressed."""
+    for extension, module in COMPRESSORS.items():
+        if filename.endswith(extension):
+            return module
+    if filename.endswith(XZ_EXTENSION):
+        raise ValueError("{} is xz compressed, which needs the lzma module of Python 3".format(filename))
+    return None
+
+
+def detect(filename):
+    """Return the compression module for the contents of a file, or None if it is not compressed."""
+    with open(filename, "rb") as fh:
+        start = fh.read(6)
+    for signature, module in SIGNATURES:
+        if start.startswith(signature):
+            return module
+    if start.startswith(XZ_SIGNATURE):
+        raise ValueError("{} is xz compressed, which needs the lzma module of Python 3".format(filename))
+    return None
+
+
+def open_file(filename, mode="r"):
+    """Open a file, compressing or decompressing it if needed.
+
+    Args:
+        filename: The file name. When writing, a .gz, .bz2 or .xz extension selects the compression.
+        mode: "r" or "w" for text, "rb" or "wb" for binary.
+
+    Returns:
+        A file object.
+
+    Raises:
+        ValueError: The file is xz compressed and the lzma module is not available.
+    """
+    module = detect(filename) if mode.startswith("r") else compressor(filename)
+    if module is None:
+        return open(filename, mode)
+    # Python 2 has no bz2.open, and its files read and write str in any mode.
+    opener = getattr(module, "open", None) or module.BZ2File
+    if "b" in mode or str is bytes:
+        return opener(filename, mode)
+    return opener(filename, mode + "t", encoding="utf-8")
+
+
+def load_document(filename):
+    """Load a JSON or binary IR document, which may be compressed."""
+    with open_file(filename, "rb") as fh:
+        data = fh.read()
+    if binary.is_binary(data):
+        return binary.PTSBinaryReader(data).document()
+    return json.loads(data.decode("utf-8"))
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+"""Reachability and attack path analysis over the DFD.
+
+PTSDfdAnalysis answers questions such as which internal components can be reached
+from the @external boundary, by which shortest paths, and which edges cross trust
+boundaries. Bidirectional edges can be followed both ways. If a PTSCoverage is
+given, each hop of a path is joined with the unmitigated exposures of the component
+it leads to, so the paths that matter stand out.
+
+Reachability between every pair of components is computed once, as one bitset per
+component, by finding the strongly connected components of the graph and combining
+their bitsets in reverse topological order. Repeated reachability queries are then
+a single bit test.
+
+    analysis = PTSDfdAnalysis(parser.dfd, PTSCoverage.from_parser(parser))
+    for path in analysis.attack_paths("@external"):
+        ...
+
+Copyright (c) 2017 the ThreatSpec contributors
+
+This software may be modified and distributed under the terms
+of the MIT license.  See the LICENSE file for details.
+"""
+
+from collections import deque
+
+from . import pythreatspec as ts
+
+
+class PTSDfdAnalysis(object):
+    """Graph analysis of a PTSDfd.
+
+    Components are referred to by (boundary id, component id) tuples.
+
+    Attributes:
+        dfd: The PTSDfd being analysed.
+        coverage: An optional PTSCoverage used to find the unmitigated exposures on each hop.
+    """
+
+    def __init__(self, dfd, coverage=None):
+        """Initialise the PTSDfdAnalysis class."""
+        self.dfd = dfd
+        self.coverage = coverage
+        self._reach = None
+        self._reach_edges = -1
+
+    def neighbours(self, node_id):
+        """Return the (neighbour node id, edge number) pairs that can be reached in one hop."""
+        dfd = self.dfd
+        hops = []
+        for edge_number in dfd.forward[node_id]:
+            hops.append((dfd.edge_nodes(edge_number)[1], edge_number))
+        for edge_number in dfd.reverse[node_id]:
+            if dfd.edges[edge_number].connection_type == ts.PTSDfdEdge.BI_DIRECTIONAL:
+                hops.append((dfd.edge_nodes(edge_number)[0], edge_number))
+        return hops
+
+    def _node_id(self, component):
+        node_id = self.dfd.get_node_id(component[0], component[1])
+        if node_id is None:
+            raise ValueError("unknown component {}:{}".format(component[0], component[1]))
+        return node_id
+
+    def _bfs(self, start_nodes):
+        """Breadth first search, returning a dict of node id to (previous node id, edge number)."""
+        parents = dict((node_id, None) for node_id in start_nodes)
+        queue = deque(start_nodes)
+        while queue:
+            node_id = queue.popleft()
+            for neighbour, edge_number in self.neighbours(node_id):
+                if neighbour not in parents:
+                    parents[neighbour] = (node_id, edge_number)
+                    queue.append(neighbour)
+        return parents
+
+    def _path(self, parents, node_id):
+        """Return the edge numbers of the path to a node found by _bfs."""
+        edge_numbers = []
+        while parents[node_id] is not None:
+            node_id, edge_number = parents[node_id]
+            edge_numbers.append(edge_number)
+        edge_numbers.reverse()
+        return edge_numbers
+
+    def reachable_from(self, boundary_id):
+        """Return the components outside a boundary that can be reached from any component inside it."""
+        start_nodes = self.dfd.boundary_nodes.get(boundary_id, [])
+        parents = self._bfs(start_nodes)
+        return [self.dfd.nodes[n] for n in sorted(parents) if self.dfd.nodes[n][0] != boundary_id]
+
+    def shortest_path(self, source, dest):
+        """Return the edges of a shortest path between two components, or None if there is no path.
+
+        Args:
+            source: The (boundary id, component id) to start from.
+            dest: The (boundary id, component id) to reach.
+
+        Returns:
+            A list of PTSDfdEdge objects, empty if source and dest are the same.
+        """
+        dest_node = self._node_id(dest)
+        parents = self._bfs([self._node_id(source)])
+        if dest_node not in parents:
+            return None
+        return [self.dfd.edges[e] for e in self._path(parents, dest_node)]
+
+    def boundary_crossings(self):
+        """Return the edges that connect components in different boundaries."""
+        return [edge for edge in self.dfd.edges if edge.source_boundary_id != edge.dest_boundary_id]
+
+    def reachability(self):
+        """Return the reachability bitsets, computing them if the DFD has changed.
+
+        Returns:
+            A list, indexed by node id, of integers with a bit set for every node that can
+            be reached from that node, including the node itself.
+        """
+        if self._reach is not None and self._reach_edges == len(self.dfd.edges) and len(self._reach) == len(self.dfd.nodes):
+            return self._reach
+
+        node_count = len(self.dfd.nodes)
+        successors = [[n for n, e in self.neighbours(node_id)] for node_id in range(node_count)]
+
+        # Iterative Tarjan. Strongly connected components are found successors first,
+        # so each one's bitset can be completed from the bitsets already found.
+        index = [None] * node_count
+        lowlink = [0] * node_count
+        on_stack = [False] * node_count
+        scc_of = [None] * node_count
+        scc_reach = []
+        stack = []
+        counter = 0
+        for root in range(node_count):
+            if index[root] is not None:
+                continue
+            work = [(root, 0)]
+            while work:
+                node_id, position = work.pop()
+                if position == 0:
+                    index[node_id] = lowlink[node_id] = counter
+                    counter += 1
+                    stack.append(node_id)
+                    on_stack[node_id] = True
+                recurse = False
+                for i in range(position, len(successors[node_id])):
+                    successor = successors[node_id][i]
+                    if index[successor] is None:
+                        work.append((node_id, i + 1))
+                        work.append((successor, 0))
+                        recurse = True
+                        break
+                    elif on_stack[successor]:
+                        lowlink[node_id] = min(lowlink[node_id], index[successor])
+                if recurse:
+                    continue
+                if lowlink[node_id] == index[node_id]:
+                    members = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        scc_of[member] = len(scc_reach)
+                        members.append(member)
+                        if member == node_id:
+                            break
+                    bits = 0
+                    for member in members:
+                        bits |= 1 << member
+                    for member in members:
+                        for successor in successors[member]:
+                            if scc_of[successor] is not None and scc_of[successor] != len(scc_reach):
+                                bits |= scc_reach[scc_of[successor]]
+                    scc_reach.append(bits)
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node_id])
+
+        self._reach = [scc_reach[scc_of[node_id]] for node_id in range(node_count)]
+        self._reach_edges = len(self.dfd.edges)
+        return self._reach
+
+    def can_reach(self, source, dest):
+        """Return whether there is a path from one component to another."""
+        return bool(self.reachability()[self._node_id(source)] >> self._node_id(dest) & 1)
+
+    def _unmitigated_by_component(self):
+        unmitigated = {}
+        if self.coverage is not None:
+            for boundary_id, component_id, threat_id in self.coverage.unmitigated():
+                unmitigated.setdefault((boundary_id, component_id), []).append(threat_id)
+        return unmitigated
+
+    def unmitigated_exposures(self, component):
+        """Return the threat identifiers with unmitigated exposures on a component."""
+        return sorted(self._unmitigated_by_component().get(component, []))
+
+    def attack_paths(self, boundary_id="@external"):
+        """Return a shortest path from a boundary to every component outside it that it can reach.
+
+        Each path is a dict with the "target" component and a list of "hops". Each hop has
+        the "edge", the component it goes "from" and "to", and the threats with "unmitigated"
+        exposures on the "to" component.
+        """
+        parents = self._bfs(self.dfd.boundary_nodes.get(boundary_id, []))
+        unmitigated = self._unmitigated_by_component()
+        paths = []
+        for node_id in sorted(parents):
+            if self.dfd.nodes[node_id][0] == boundary_id:
+                continue
+            hops = []
+            current = node_id
+            for edge_number in reversed(self._path(parents, node_id)):
+                previous = parents[current][0]
+                hops.append({
+                    "edge": self.dfd.edges[edge_number],
+                    "from": self.dfd.nodes[previous],
+                    "to": self.dfd.nodes[current],
+                    "unmitigated": sorted(unmitigated.get(self.dfd.nodes[current], []))
+                })
+                current = previous
+            hops.reverse()
+            paths.append({"target": self.dfd.nodes[node_id], "hops": hops})
+        return paths
+
+    def export_to_json(self, boundary_id="@external"):
+        """Return a JSON representation of the attack paths from a boundary."""
+        rep = []
+        for path in self.attack_paths(boundary_id):
+            rep.append({
+                "target": "{}:{}".format(*path["target"]),
+                "hops": [
+                    {
+                        "from": "{}:{}".format(*hop["from"]),
+                        "to": "{}:{}".format(*hop["to"]),
+                        "name": hop["edge"].name,
+                        "type": hop["edge"].connection_type,
+                        "unmitigated": hop["unmitigated"]
+                    }
+                    for hop in path["hops"]
+                ]
+            })
+        return rep
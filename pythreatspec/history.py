@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+"""Threat model history across the revisions of a git repository.
+
+PTSHistory scans a series of revisions of a local git repository with the universal
+parser and computes metrics for each one: the number of each kind of element, threat
+and DFD edge, and the coverage summary of PTSCoverage. The result is a compact time
+series with one row per revision, for trend lines of exposures and mitigations.
+
+Scanning every file of every revision would cost revisions times repository size.
+Instead the work is shared between revisions:
+
+    - Only the first revision's tree is listed in full. Each later revision's tree is
+      updated from the one before with git diff-tree, so only changed paths are visited.
+    - Files are read by their blob hash through a single git cat-file process, and the
+      tag lines found in each blob are cached. A file that is unchanged between
+      revisions, or has the same content as another file, is only read and scanned once.
+
+Each revision is then parsed from the cached tag lines alone, which are a small part
+of the repository, so most of the cost scales with the files changed.
+
+    history = PTSHistory(PTSGitRepository("."))
+    series = history.run(history.repository.revisions(since="2 years ago"), interval=WEEK)
+
+Copyright (c) 2017 the ThreatSpec contributors
+
+This software may be modified and distributed under the terms
+of the MIT license.  See the LICENSE file for details.
+"""
+
+import fnmatch
+import re
+import subprocess
+
+from . import pythreatspec as ts
+from .coverage import PTSCoverage, STATUSES
+
+DAY = 24 * 60 * 60
+WEEK = 7 * DAY
+
+COLUMNS = ["revision", "time", "files", "errors"] + ts.ELEMENT_KINDS + ["threats", "edges", "total", "exposed", "unexposed"] + STATUSES
+
+# git treats a blob with a NUL byte in its first 8000 bytes as binary.
+BINARY_CHECK = 8000
+
+
+class PTSGitRepository(object):
+    """A local git repository, read through the git command.
+
+    Attributes:
+        path: The path of the repository.
+        blobs_read: The number of blobs read so far.
+    """
+
+    def __init__(self, path="."):
+        """Initialise the PTSGitRepository class."""
+        self.path = path
+        self.blobs_read = 0
+        self._cat_file = None
+
+    def git(self, *args):
+        """Run a git command in the repository and return its output as bytes."""
+        return subprocess.check_output(["git", "-C", self.path] + list(args))
+
+    def revisions(self, revision_range="HEAD", since=None):
+        """Return the revisions along the first parent history, oldest first.
+
+        Args:
+            revision_range: A revision or range, such as HEAD or v1.0..master.
+            since: An optional date for git log --since, such as "2 years ago".
+
+        Returns:
+            A list of (commit hash, commit timestamp) tuples.
+        """
+        args = ["log", "--first-parent", "--reverse", "--format=%H %ct"]
+        if since is not None:
+            args.append("--since={}".format(since))
+        args.extend([revision_range, "--"])
+        revisions = []
+        for line in self.git(*args).decode("utf-8").splitlines():
+            revision, timestamp = line.split()
+            revisions.append((revision, int(timestamp)))
+        return revisions
+
+    def tree(self, revision):
+        """Return a dict of the path of each file in a revision to its blob hash."""
+        tree = {}
+        for entry in self.git("ls-tree", "-r", "-z", revision).decode("utf-8").split("\0"):
+            if not entry:
+                continue
+            details, path = entry.split("\t", 1)
+            mode, kind, blob = details.split()
+            if kind == "blob" and mode != "120000":
+                tree[path] = blob
+        return tree
+
+    def changes(self, old_revision, new_revision):
+        """Iterate over the files changed between two revisions.
+
+        Yields:
+            Tuples of (path, blob hash), where the blob hash is None for a deleted file.
+        """
+        fields = self.git("diff-tree", "-r", "-z", "--no-renames", old_revision, new_revision).decode("utf-8").split("\0")
+        for details, path in zip(fields[0::2], fields[1::2]):
+            old_mode, new_mode, old_blob, new_blob, status = details.lstrip(":").split()
+            if status == "D" or not new_mode.startswith("100"):
+                yield path, None
+            else:
+                yield path, new_blob
+
+    def read_blob(self, blob):
+        """Return the contents of a blob as bytes."""
+        if self._cat_file is None:
+            self._cat_file = subprocess.Popen(["git", "-C", self.path, "cat-file", "--batch"],
+                                              stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._cat_file.stdin.write(blob.encode("ascii") + b"\n")
+        self._cat_file.stdin.flush()
+        header = self._cat_file.stdout.readline().split()
+        if len(header) != 3:
+            raise ValueError("unable to read blob {}".format(blob))
+        data = self._cat_file.stdout.read(int(header[2]))
+        self._cat_file.stdout.read(1)
+        self.blobs_read += 1
+        return data
+
+    def close(self):
+        """Stop the git cat-file process, if it was started."""
+        if self._cat_file is not None:
+            self._cat_file.stdin.close()
+            self._cat_file.wait()
+            self._cat_file.stdout.close()
+            self._cat_file = None
+
+
+def sample(revisions, interval):
+    """Return the last revision in each interval.
+
+    Args:
+        revisions: A list of (commit hash, commit timestamp) tuples, oldest first.
+        interval: The length of each interval in seconds, or None for every revision.
+
+    Returns:
+        A list of (commit hash, commit timestamp) tuples.
+    """
+    if not interval:
+        return list(revisions)
+    sampled = []
+    for revision, timestamp in revisions:
+        bucket = timestamp // interval
+        if sampled and sampled[-1][1] // interval == bucket:
+            sampled[-1] = (revision, timestamp)
+        else:
+            sampled.append((revision, timestamp))
+    return sampled
+
+
+class PTSHistory(object):
+    """Computes threat model metrics for revisions of a git repository.
+
+    Attributes:
+        repository: The PTSGitRepository to scan.
+        include: A list of glob patterns for the paths to scan, or None for all files.
+        tag_regex: The tag regular expression, as used by the universal parser.
+    """
+
+    def __init__(self, repository, include=None):
+        """Initialise the PTSHistory class."""
+        self.repository = repository
+        self.include = include
+        self.tag_regex = ts.universal_tag_regex()
+        self._tags = {}
+
+    def included(self, path):
+        """Return True if a path is to be scanned."""
+        return self.include is None or any(fnmatch.fnmatch(path, pattern) for pattern in self.include)
+
+    def tags(self, blob):
+        """Return the (line number, line) of the tag lines of a blob, reading it if it has not been seen."""
+        tags = self._tags.get(blob)
+        if tags is None:
+            data = self.repository.read_blob(blob)
+            if b"\0" in data[:BINARY_CHECK]:
+                tags = ()
+            else:
+                tags = tuple(
+                    (lineno, line.strip())
+                    for lineno, line in enumerate(data.decode("utf-8", "replace").splitlines(), 1)
+                    if "@" in line and re.search(self.tag_regex, line.strip(), re.M | re.I)
+                )
+            self._tags[blob] = tags
+        return tags
+
+    def parse(self, tree):
+        """Parse the tags of a tree of paths and blob hashes.
+
+        A history goes back over revisions that can no longer be fixed, so an invalid
+        or unknown tag is counted rather than stopping the scan.
+
+        Returns:
+            A tuple of (parser, number of invalid tags).
+        """
+        parser = ts.PyThreatspecParser()
+        parser.tag_regex = self.tag_regex
+        errors = 0
+        for path in sorted(tree):
+            for lineno, line in self.tags(tree[path]):
+                try:
+                    parser._parse_comment(line, parser.new_source(path, lineno, "universal_parser"))
+                except (ValueError, KeyError):
+                    errors += 1
+        return parser, errors
+
+    def metrics(self, parser):
+        """Return a dict of the metrics of a parser, with a member for each of COLUMNS after errors."""
+        metrics = dict((kind, sum(len(elements) for elements in parser.element_tables[kind].values())) for kind in ts.ELEMENT_KINDS)
+        metrics["threats"] = len(parser.threats)
+        metrics["edges"] = len(parser.dfd.edges)
+        metrics.update(PTSCoverage.from_parser(parser, False).summary())
+        return metrics
+
+    def run(self, revisions, interval=None):
+        """Compute the metrics of revisions.
+
+        Args:
+            revisions: A list of (commit hash, commit timestamp) tuples, oldest first,
+                as from PTSGitRepository.revisions.
+            interval: An optional length of time in seconds. Only the last revision in
+                each interval is scanned.
+
+        Returns:
+            A PTSTimeSeries.
+        """
+        series = PTSTimeSeries()
+        tree = None
+        previous = None
+        try:
+            for revision, timestamp in sample(revisions, interval):
+                if tree is None:
+                    tree = dict((path, blob) for path, blob in self.repository.tree(revision).items() if self.included(path))
+                else:
+                    for path, blob in self.repository.changes(previous, revision):
+                        if blob is None:
+                            tree.pop(path, None)
+                        elif self.included(path):
+                            tree[path] = blob
+                previous = revision
+                parser, errors = self.parse(tree)
+                metrics = self.metrics(parser)
+                metrics.update(revision=revision, time=timestamp, files=len(tree), errors=errors)
+                series.append(metrics)
+        finally:
+            self.repository.close()
+        return series
+
+
+class PTSTimeSeries(object):
+    """Metrics for a series of revisions, stored as rows of COLUMNS.
+
+    Attributes:
+        rows: A list of lists of values, one per revision, in the order of COLUMNS.
+    """
+
+    def __init__(self):
+        """Initialise the PTSTimeSeries class."""
+        self.rows = []
+
+    def append(self, metrics):
+        """Add a dict of metrics as a row."""
+        self.rows.append([metrics[column] for column in COLUMNS])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def column(self, name):
+        """Return the values of one of COLUMNS."""
+        index = COLUMNS.index(name)
+        return [row[index] for row in self.rows]
+
+    def export_to_json(self):
+        """Return a JSON representation of this class, with the column names given once."""
+        return {"columns": COLUMNS, "rows": self.rows}
+
+    def write_csv(self, fh):
+        """Write the series as CSV with a header row."""
+        fh.write(",".join(COLUMNS) + "\n")
+        for row in self.rows:
+            fh.write(",".join(str(value) for value in row) + "\n")
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+"""Load intermediate representation files back into a parser.
+
+PTSLoader rebuilds the state of a PyThreatspecParser from one or more JSON or binary
+IR documents: the boundaries, components and threats, the DFD edges, and the element
+lists of each project with their PTSSource objects. Everything goes through the
+parser's own add methods, so its symbol and source tables, index and listeners are
+kept up to date just as if the tags had been parsed, and newly parsed tags can be
+added to the same parser afterwards.
+
+Documents are only queued when they are added. Each section is turned into objects
+the first time it is asked for, so a report that only needs the threats of a large
+library does not pay for its elements:
+
+    loader = PTSLoader()
+    loader.add_file("sfp_library.threatspec.json")
+    parser = loader.load(["threats"])
+
+Binary documents are read through a PTSBinaryReader, which also only decodes the
+sections that are loaded.
+
+The parser itself has no notion of projects, so the project of each loaded element
+is kept in the loader's PTSProjectMap. Passing it to PyThreatspecReporter writes the
+elements back out to the projects they were loaded from:
+
+    loader = PTSLoader()
+    loader.add_file("portfolio.threatspec.json")
+    reporter = PyThreatspecReporter(loader.load(), "default", project_map=loader.project_map)
+
+Copyright (c) 2017 the ThreatSpec contributors
+
+This software may be modified and distributed under the terms
+of the MIT license.  See the LICENSE file for details.
+"""
+
+import json
+
+from . import pythreatspec as ts
+from . import binary
+from .files import open_file
+
+SECTIONS = ["boundaries", "components", "threats", "dfd", "projects"]
+
+
+class PTSLoader(object):
+    """Loads IR documents into a PyThreatspecParser, one section at a time.
+
+    Attributes:
+        parser: The PyThreatspecParser being loaded into.
+        projects: The names of the projects loaded so far, in order.
+        project_map: A PTSProjectMap with each loaded element assigned to its project.
+    """
+
+    def __init__(self, parser=None, project_map=None):
+        """Initialise the PTSLoader class.
+
+        Args:
+            parser: An optional parser to load into. A new one is created if this is None.
+            project_map: An optional PTSProjectMap to assign the loaded elements to. A new
+                one is created if this is None.
+        """
+        self.parser = parser if parser is not None else ts.PyThreatspecParser()
+        self.project_map = project_map if project_map is not None else ts.PTSProjectMap()
+        self.projects = []
+        self._pending = dict((section, []) for section in SECTIONS)
+        self._dated = False
+
+    def add(self, document, projects=None):
+        """Queue a document to be loaded.
+
+        Args:
+            document: A JSON IR document, or a PTSBinaryReader.
+            projects: An optional list of the project names to load. Defaults to all projects.
+
+        Returns:
+            Nothing.
+        """
+        for section in SECTIONS:
+            self._pending[section].append((document, projects))
+        self._add_times(document)
+
+    def add_file(self, filename, projects=None):
+        """Queue a JSON or binary IR file, which may be compressed, to be loaded."""
+        with open_file(filename, "rb") as fh:
+            data = fh.read()
+        if binary.is_binary(data):
+            self.add(binary.PTSBinaryReader(data), projects)
+        else:
+            self.add(json.loads(data.decode("utf-8")), projects)
+
+    def _add_times(self, document):
+        """Take the earliest created and latest updated time of the documents."""
+        meta = document.meta() if isinstance(document, binary.PTSBinaryReader) else document
+        times = meta.get("document", {})
+        if "created" not in times:
+            return
+        parser = self.parser
+        if not self._dated:
+            parser.creation_time = times["created"]
+            parser.updated_time = times.get("updated", times["created"])
+            self._dated = True
+        else:
+            parser.creation_time = min(parser.creation_time, times["created"])
+            parser.updated_time = max(parser.updated_time, times.get("updated", times["created"]))
+
+    def load(self, sections=None):
+        """Load the queued documents' sections that have not been loaded yet.
+
+        Args:
+            sections: An optional list of sections to load, from SECTIONS. Defaults to all of them.
+
+        Returns:
+            The parser.
+        """
+        for section in sections or SECTIONS:
+            if section not in self._pending:
+                raise ValueError("unknown section {}".format(section))
+            pending = self._pending[section]
+            self._pending[section] = []
+            for document, projects in pending:
+                getattr(self, "_load_" + section)(document, projects)
+        return self.parser
+
+    def pending(self):
+        """Return the sections that still have documents to load."""
+        return [section for section in SECTIONS if self._pending[section]]
+
+    def _section(self, document, section):
+        if isinstance(document, binary.PTSBinaryReader):
+            if not document.flags & binary.FLAGS[section]:
+                return {}
+            return getattr(document, section)()
+        return document.get(section, {})
+
+    def _load_boundaries(self, document, projects):
+        for boundary_id, rep in self._section(document, "boundaries").items():
+            self.parser.set_property("boundary", boundary_id, ts.PTSBoundary.from_json(rep))
+
+    def _load_components(self, document, projects):
+        for boundary_id, components in self._section(document, "components").items():
+            for component_id, rep in components.items():
+                self.parser.set_property("component", component_id, ts.PTSComponent.from_json(rep), boundary_id)
+
+    def _load_threats(self, document, projects):
+        for threat_id, rep in self._section(document, "threats").items():
+            self.parser.set_property("threat", threat_id, ts.PTSThreat.from_json(rep))
+
+    def _load_dfd(self, document, projects):
+        parser = self.parser
+        for source_boundary_id, source_components in self._section(document, "dfd").items():
+            for source_component_id, dest_boundaries in source_components.items():
+                for dest_boundary_id, dest_components in dest_boundaries.items():
+                    for dest_component_id, details in dest_components.items():
+                        parser.add_edge(ts.PTSDfdEdge(
+                            parser.symbols.intern(source_boundary_id), parser.symbols.intern(source_component_id),
+                            parser.symbols.intern(dest_boundary_id), parser.symbols.intern(dest_component_id),
+                            details['type'], details.get('name', ''),
+                            ts.PTSSource.from_json(details.get('source', {}), parser.source_table)
+                        ))
+
+    def _load_projects(self, document, projects):
+        if isinstance(document, binary.PTSBinaryReader):
+            names = document.projects() if document.flags & binary.FLAGS["projects"] else []
+            details = ((name, document.project(name)) for name in names if projects is None or name in projects)
+        else:
+            details = ((name, rep) for name, rep in document.get("projects", {}).items() if projects is None or name in projects)
+
+        parser = self.parser
+        project_map = self.project_map
+        intern = parser.symbols.intern
+        for name, rep in details:
+            if name not in self.projects:
+                self.projects.append(name)
+            project_map.add_project(name)
+            for kind in ts.ELEMENT_KINDS:
+                for element_id, elements in rep.get(kind, {}).items():
+                    element_id = intern(element_id)
+                    for element_rep in elements:
+                        element = ts.element_from_json(kind, element_rep, parser.source_table)
+                        element.boundary = intern(element.boundary)
+                        element.component = intern(element.component)
+                        if kind != "reviews":
+                            element.threat = intern(element.threat)
+                        project_map.assign(element, name)
+                        parser.add_element(kind, element_id, element)
+
+
+def load_parser(filenames, projects=None, sections=None, parser=None, project_map=None):
+    """Return a parser loaded from IR files.
+
+    Args:
+        filenames: A list of JSON or binary IR file names, which may be compressed.
+        projects: An optional list of the project names to load. Defaults to all projects.
+        sections: An optional list of sections to load. Defaults to all of them.
+        parser: An optional parser to load into.
+        project_map: An optional PTSProjectMap to assign the loaded elements to their projects.
+
+    Returns:
+        The PyThreatspecParser.
+    """
+    loader = PTSLoader(parser, project_map)
+    for filename in filenames:
+        loader.add_file(filename, projects)
+    return loader.load(sections)
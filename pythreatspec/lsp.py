@@ -0,0 +1,470 @@
+#!/usr/bin/env python
+"""Language server for ThreatSpec tags.
+
+This module implements a small Language Server Protocol (LSP) server on top of the
+ThreatSpec parser so that editors can report invalid tags and unknown identifiers
+while the threat model is being written, rather than after a CI run.
+
+Each open document is parsed on its own with the same tag handlers used by
+PyThreatspecParser (_parse_describe and friends), so only the edited document is
+re-parsed on a change. The definitions found in each document are merged into
+workspace symbol tables of boundaries, components and threats which are used for
+completion and go-to-definition.
+
+Copyright (c) 2017 the ThreatSpec contributors
+
+This software may be modified and distributed under the terms
+of the MIT license.  See the LICENSE file for details.
+"""
+
+import json
+import re
+
+from . import pythreatspec as ts
+
+
+IDENTIFIER_REGEX = r'@[A-Za-z0-9_]+'
+
+SEVERITY_ERROR = 1
+SEVERITY_WARNING = 2
+
+MESSAGE_TYPE_ERROR = 1
+
+COMPLETION_KIND_CLASS = 7
+COMPLETION_KIND_MODULE = 9
+COMPLETION_KIND_EVENT = 23
+
+
+class PTSDocumentParser(ts.PyThreatspecParser):
+    """A parser for a single editor document.
+
+    This is a PyThreatspecParser that parses a document line by line, using the
+    universal tag regex, and records where boundaries, components and threats are
+    defined or referenced. Errors raised by the tag handlers are collected as
+    diagnostics instead of aborting the parse.
+
+    Attributes:
+        uri: The document URI string.
+        definitions: A list of (pclass, key, name, line) tuples for the identifiers created by this document.
+        references: A list of (pclass, key, line) tuples for the identifiers used by this document.
+        diagnostics: A list of (line, severity, message) tuples.
+    """
+
+    def __init__(self, uri):
+        """Initialise the PTSDocumentParser class."""
+        ts.PyThreatspecParser.__init__(self)
+        self.tag_regex = ts.universal_tag_regex()
+        self.uri = uri
+        self.definitions = []
+        self.references = []
+        self.diagnostics = []
+        self.lineno = 0
+        self.seeded = set()
+
+    def _record(self, pclass, key, name, naming, created):
+        """Record a definition or reference.
+
+        An identifier is defined by this document if it was created here, or if it was
+        seeded from another document and is named here too, so that both documents
+        define it.
+        """
+        if created or (naming and (pclass, key) in self.seeded):
+            self.seeded.discard((pclass, key))
+            self.definitions.append((pclass, key, name, self.lineno))
+        else:
+            self.references.append((pclass, key, self.lineno))
+
+    def add_boundary(self, boundary, boundary_id=None):
+        """Add a boundary, recording the definition or reference."""
+        known = len(self.boundaries)
+        naming = bool(boundary_id) or not ts.is_identifier(boundary)
+        boundary_id = ts.PyThreatspecParser.add_boundary(self, boundary, boundary_id)
+        self._record("boundary", boundary_id, boundary, naming, len(self.boundaries) > known)
+        return boundary_id
+
+    def add_component(self, boundary_id, component, component_id=None):
+        """Add a component, recording the definition or reference."""
+        known = len(self.components.get(boundary_id, {}))
+        naming = bool(component_id) or not ts.is_identifier(component)
+        component_id = ts.PyThreatspecParser.add_component(self, boundary_id, component, component_id)
+        created = len(self.components.get(boundary_id, {})) > known
+        self._record("component", (boundary_id, component_id), component, naming, created)
+        return component_id
+
+    def add_threat(self, threat, threat_id=None):
+        """Add a threat, recording the definition or reference."""
+        known = len(self.threats)
+        naming = bool(threat_id) or not ts.is_identifier(threat)
+        threat_id = ts.PyThreatspecParser.add_threat(self, threat, threat_id)
+        self._record("threat", threat_id, threat, naming, len(self.threats) > known)
+        return threat_id
+
+    def parse_text(self, text):
+        """Parse the document text.
+
+        Args:
+            text: The full text of the document.
+
+        Returns:
+            Nothing.
+        """
+        for lineno, line in enumerate(text.splitlines(), 1):
+            if "@" not in line:
+                continue
+            self.lineno = lineno
+            try:
+                self._parse_comment(line.strip(), self.new_source(self.uri, lineno, "lsp"))
+            except ValueError as e:
+                self.diagnostics.append((lineno, SEVERITY_ERROR, str(e)))
+
+
+class PTSWorkspace(object):
+    """The set of documents known to the language server.
+
+    The workspace keeps the parse results for every document, plus symbol tables that
+    index every boundary, component and threat definition by identifier. Updating a
+    document only re-parses that document and replaces its entries in the symbol tables.
+
+    Attributes:
+        documents: A dict of URI to PTSDocumentParser objects.
+        symbols: A dict of pclass to a dict of identifier keys to a list of (uri, line, name) tuples.
+    """
+
+    def __init__(self):
+        """Initialise the PTSWorkspace class."""
+        self.documents = {}
+        self.symbols = {
+            "boundary": {},
+            "component": {},
+            "threat": {}
+        }
+
+    def _seed(self, parser):
+        """Make identifiers defined by other documents known to a document parser."""
+        for boundary_id, locations in self.symbols["boundary"].items():
+            parser.boundaries[boundary_id] = ts.PTSBoundary(locations[0][2])
+            parser.seeded.add(("boundary", boundary_id))
+        for (boundary_id, component_id), locations in self.symbols["component"].items():
+            parser.components.setdefault(boundary_id, {})[component_id] = ts.PTSComponent(locations[0][2])
+            parser.seeded.add(("component", (boundary_id, component_id)))
+        for threat_id, locations in self.symbols["threat"].items():
+            parser.threats[threat_id] = ts.PTSThreat(locations[0][2])
+            parser.seeded.add(("threat", threat_id))
+
+    def _remove_symbols(self, uri):
+        """Remove the symbol table entries for a document."""
+        document = self.documents.get(uri)
+        if not document:
+            return
+        for pclass, key, name, lineno in document.definitions:
+            locations = [location for location in self.symbols[pclass].get(key, []) if location[0] != uri]
+            if locations:
+                self.symbols[pclass][key] = locations
+            else:
+                self.symbols[pclass].pop(key, None)
+
+    def update(self, uri, text):
+        """Parse a document and update the symbol tables.
+
+        Args:
+            uri: The document URI string.
+            text: The full text of the document.
+
+        Returns:
+            The PTSDocumentParser for the document.
+        """
+        self._remove_symbols(uri)
+        parser = PTSDocumentParser(uri)
+        self._seed(parser)
+        parser.parse_text(text)
+        for pclass, key, name, lineno in parser.definitions:
+            self.symbols[pclass].setdefault(key, []).append((uri, lineno, name))
+        self.documents[uri] = parser
+        return parser
+
+    def remove(self, uri):
+        """Forget about a document."""
+        self._remove_symbols(uri)
+        self.documents.pop(uri, None)
+
+    def diagnostics(self, uri):
+        """Return the diagnostics for a document.
+
+        Diagnostics are the errors raised by the tag handlers, plus warnings for any
+        identifiers that are referenced but not defined anywhere in the workspace.
+
+        Args:
+            uri: The document URI string.
+
+        Returns:
+            A list of (line, severity, message) tuples.
+        """
+        document = self.documents.get(uri)
+        if not document:
+            return []
+        diagnostics = list(document.diagnostics)
+        for pclass, key, lineno in document.references:
+            if key not in self.symbols[pclass]:
+                if pclass == "component":
+                    identifier = "{}:{}".format(key[0], key[1])
+                else:
+                    identifier = key
+                diagnostics.append((lineno, SEVERITY_WARNING, "unknown {} identifier {}".format(pclass, identifier)))
+        return sorted(diagnostics)
+
+    def complete(self, prefix):
+        """Return completion candidates for the text before the cursor.
+
+        Args:
+            prefix: The text of the current line up to the cursor.
+
+        Returns:
+            A list of (label, pclass, name) tuples.
+        """
+        match = re.search(r'(@?[A-Za-z0-9_]+):(@?[A-Za-z0-9_]*)$', prefix)
+        if match:
+            boundary_id = ts.text_to_identifier(match.group(1))
+            partial = match.group(2)
+            return sorted(
+                (key[1], "component", locations[0][2])
+                for key, locations in self.symbols["component"].items()
+                if key[0] == boundary_id and key[1].startswith(partial)
+            )
+
+        match = re.search(r'(@[A-Za-z0-9_]*)$', prefix)
+        partial = match.group(1) if match else "@"
+        candidates = []
+        for pclass in ["boundary", "threat"]:
+            for key, locations in self.symbols[pclass].items():
+                if key.startswith(partial):
+                    candidates.append((key, pclass, locations[0][2]))
+        return sorted(candidates)
+
+    def definition(self, line, character):
+        """Find the definitions of the identifier at a position in a line.
+
+        Args:
+            line: The text of the line.
+            character: The zero-based column of the cursor.
+
+        Returns:
+            A list of (uri, line) tuples.
+        """
+        for match in re.finditer(IDENTIFIER_REGEX, line):
+            if match.start() <= character <= match.end():
+                break
+        else:
+            return []
+
+        identifier = match.group(0)
+        if line[match.end():match.end() + 1] == ":":
+            candidates = [("boundary", identifier)]
+        elif match.start() > 0 and line[match.start() - 1] == ":":
+            boundary = re.search(r'(@?[A-Za-z0-9_]+):$', line[:match.start()])
+            if not boundary:
+                return []
+            candidates = [("component", (ts.text_to_identifier(boundary.group(1)), identifier))]
+        else:
+            candidates = [("threat", identifier), ("boundary", identifier)]
+
+        for pclass, key in candidates:
+            if key in self.symbols[pclass]:
+                return [(uri, lineno) for uri, lineno, name in self.symbols[pclass][key]]
+        return []
+
+
+class PTSLanguageServer(object):
+    """A Language Server Protocol server for ThreatSpec.
+
+    The server speaks JSON-RPC over a pair of binary streams, normally stdin and
+    stdout, using full document synchronisation. Requests are dispatched using a
+    method table in the same way that the parser dispatches tags.
+
+    Attributes:
+        instream: A binary stream to read requests from.
+        outstream: A binary stream to write responses to.
+        workspace: A PTSWorkspace instance.
+    """
+
+    def __init__(self, instream, outstream):
+        """Initialise the PTSLanguageServer class."""
+        self.instream = instream
+        self.outstream = outstream
+        self.workspace = PTSWorkspace()
+        self.lines = {}
+        self.running = False
+        self.shutdown_requested = False
+
+        self.method_table = {}
+        self.method_table["initialize"] = self._initialize
+        self.method_table["initialized"] = self._ignore
+        self.method_table["shutdown"] = self._shutdown
+        self.method_table["exit"] = self._exit
+        self.method_table["textDocument/didOpen"] = self._did_open
+        self.method_table["textDocument/didChange"] = self._did_change
+        self.method_table["textDocument/didClose"] = self._did_close
+        self.method_table["textDocument/completion"] = self._completion
+        self.method_table["textDocument/definition"] = self._definition
+
+    def read_message(self):
+        """Read a single JSON-RPC message, returning None at the end of the stream."""
+        length = None
+        while True:
+            header = self.instream.readline()
+            if not header:
+                return None
+            header = header.decode("ascii").strip()
+            if not header:
+                break
+            name, _, value = header.partition(":")
+            if name.lower() == "content-length":
+                length = int(value.strip())
+        if length is None:
+            raise ValueError("message is missing a Content-Length header")
+        return json.loads(self.instream.read(length).decode("utf-8"))
+
+    def write_message(self, message):
+        """Write a single JSON-RPC message."""
+        body = json.dumps(message, separators=(',', ':')).encode("utf-8")
+        self.outstream.write("Content-Length: {}\r\n\r\n".format(len(body)).encode("ascii"))
+        self.outstream.write(body)
+        self.outstream.flush()
+
+    def notify(self, method, params):
+        """Send a notification to the client."""
+        self.write_message({"jsonrpc": "2.0", "method": method, "params": params})
+
+    def handle(self, message):
+        """Dispatch a single message and send the response if one is required.
+
+        An unexpected error in a handler is sent back as an internal error, or logged to
+        the client for a notification, rather than stopping the server.
+        """
+        method = message.get("method")
+        handler = self.method_table.get(method)
+        if "id" not in message:
+            if handler:
+                try:
+                    handler(message.get("params", {}))
+                except Exception as e:
+                    self.notify("window/logMessage", {"type": MESSAGE_TYPE_ERROR, "message": "{} failed: {!r}".format(method, e)})
+            return
+
+        response = {"jsonrpc": "2.0", "id": message["id"]}
+        if handler:
+            try:
+                response["result"] = handler(message.get("params", {}))
+            except Exception as e:
+                response["error"] = {"code": -32603, "message": "internal error: {!r}".format(e)}
+        else:
+            response["error"] = {"code": -32601, "message": "method not found: {}".format(method)}
+        self.write_message(response)
+
+    def run(self):
+        """Serve requests until the client exits."""
+        self.running = True
+        while self.running:
+            message = self.read_message()
+            if message is None:
+                break
+            self.handle(message)
+
+    def publish_diagnostics(self, uri):
+        """Send the diagnostics for a document to the client."""
+        diagnostics = []
+        for lineno, severity, message in self.workspace.diagnostics(uri):
+            line = lineno - 1
+            diagnostics.append({
+                "range": {
+                    "start": {"line": line, "character": 0},
+                    "end": {"line": line, "character": len(self.lines[uri][line])}
+                },
+                "severity": severity,
+                "source": "threatspec",
+                "message": message
+            })
+        self.notify("textDocument/publishDiagnostics", {"uri": uri, "diagnostics": diagnostics})
+
+    def _update(self, uri, text):
+        """Re-parse a changed document and refresh the diagnostics of every open document."""
+        before = self.workspace.documents.get(uri)
+        before = before.definitions if before else []
+        self.lines[uri] = text.splitlines()
+        after = self.workspace.update(uri, text).definitions
+        if [d[:2] for d in before] != [d[:2] for d in after]:
+            uris = list(self.lines.keys())
+        else:
+            uris = [uri]
+        for changed_uri in uris:
+            self.publish_diagnostics(changed_uri)
+
+    def _ignore(self, params):
+        return None
+
+    def _initialize(self, params):
+        return {
+            "capabilities": {
+                "textDocumentSync": 1,
+                "completionProvider": {"triggerCharacters": ["@", ":"]},
+                "definitionProvider": True
+            },
+            "serverInfo": {"name": "pythreatspec"}
+        }
+
+    def _shutdown(self, params):
+        self.shutdown_requested = True
+        return None
+
+    def _exit(self, params):
+        self.running = False
+
+    def _did_open(self, params):
+        document = params["textDocument"]
+        self._update(document["uri"], document["text"])
+
+    def _did_change(self, params):
+        uri = params["textDocument"]["uri"]
+        self._update(uri, params["contentChanges"][-1]["text"])
+
+    def _did_close(self, params):
+        uri = params["textDocument"]["uri"]
+        document = self.workspace.documents.get(uri)
+        self.workspace.remove(uri)
+        self.lines.pop(uri, None)
+        self.notify("textDocument/publishDiagnostics", {"uri": uri, "diagnostics": []})
+        if document and document.definitions:
+            for other_uri in list(self.lines.keys()):
+                self.publish_diagnostics(other_uri)
+
+    def _cursor(self, params):
+        """Return the line text and column for a text document position."""
+        lines = self.lines.get(params["textDocument"]["uri"], [])
+        position = params["position"]
+        if position["line"] >= len(lines):
+            return "", 0
+        return lines[position["line"]], position["character"]
+
+    def _completion(self, params):
+        line, character = self._cursor(params)
+        kinds = {
+            "boundary": COMPLETION_KIND_MODULE,
+            "component": COMPLETION_KIND_CLASS,
+            "threat": COMPLETION_KIND_EVENT
+        }
+        return [
+            {"label": label, "kind": kinds[pclass], "detail": name}
+            for label, pclass, name in self.workspace.complete(line[:character])
+        ]
+
+    def _definition(self, params):
+        line, character = self._cursor(params)
+        return [
+            {
+                "uri": uri,
+                "range": {
+                    "start": {"line": lineno - 1, "character": 0},
+                    "end": {"line": lineno - 1, "character": 0}
+                }
+            }
+            for uri, lineno in self.workspace.definition(line, character)
+        ]
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+"""Bitset coverage matrices for portfolio-scale rollups.
+
+A PTSCoverageMatrix holds component x threat matrices for each of the exposed,
+mitigated, accepted and transferred states. Each row of a matrix, one per boundary and
+component, is a Python integer used as a bitset with one bit per threat. Matrices that
+share a PTSMatrixAxes can be combined across projects with whole-row unions and
+intersections, and rolled up through the threat "parent" hierarchy (for example the
+Software Fault Pattern library) with one mask test per row and parent.
+
+    axes = PTSMatrixAxes()
+    matrices = [PTSCoverageMatrix.from_json(data, axes) for data in documents]
+    portfolio = union(matrices)
+    by_cluster = portfolio.rollup(library["threats"])
+
+Copyright (c) 2017 the ThreatSpec contributors
+
+This software may be modified and distributed under the terms
+of the MIT license.  See the LICENSE file for details.
+"""
+
+from . import coverage as cov
+
+
+STATES = ["exposed", "mitigated", "accepted", "transferred"]
+
+STATE_FLAGS = {
+    "exposed": cov.EXPOSED,
+    "mitigated": cov.MITIGATED,
+    "accepted": cov.ACCEPTED,
+    "transferred": cov.TRANSFERRED
+}
+
+
+class PTSAxis(object):
+    """An ordered set of keys, each given a dense index.
+
+    Attributes:
+        keys: A list of keys, indexed by position.
+    """
+
+    def __init__(self, keys=None):
+        """Initialise the PTSAxis class."""
+        self.keys = []
+        self._index = {}
+        for key in keys or []:
+            self.index(key)
+
+    def index(self, key):
+        """Return the position of a key, adding it to the axis if needed."""
+        position = self._index.get(key)
+        if position is None:
+            position = len(self.keys)
+            self.keys.append(key)
+            self._index[key] = position
+        return position
+
+    def get(self, key, default=None):
+        """Return the position of a key without adding it to the axis."""
+        return self._index.get(key, default)
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class PTSMatrixAxes(object):
+    """The row and column axes shared by a set of matrices.
+
+    Matrices can only be combined if they share their axes, so that the same row and bit
+    mean the same (boundary, component) and threat in each of them.
+
+    Attributes:
+        components: A PTSAxis of (boundary, component) identifier tuples.
+        threats: A PTSAxis of threat identifiers.
+    """
+
+    def __init__(self, components=None, threats=None):
+        """Initialise the PTSMatrixAxes class."""
+        self.components = components if components is not None else PTSAxis()
+        self.threats = threats if threats is not None else PTSAxis()
+
+
+class PTSCoverageMatrix(object):
+    """Component x threat bit matrices for each coverage state.
+
+    Attributes:
+        axes: The PTSMatrixAxes for the matrix.
+        rows: A dict of state to a dict of component position to a threat bitset. Rows
+            without any bits set are left out, so matrices sharing large axes stay small.
+        unmitigated_rows: For a rolled up matrix, the rolled up rows of the threats that
+            were unmitigated before rolling up, otherwise None.
+    """
+
+    def __init__(self, axes=None):
+        """Initialise the PTSCoverageMatrix class."""
+        self.axes = axes if axes is not None else PTSMatrixAxes()
+        self.rows = dict((state, {}) for state in STATES)
+        self.unmitigated_rows = None
+
+    @classmethod
+    def from_coverage(cls, coverage, axes=None):
+        """Build a matrix from a PTSCoverage."""
+        matrix = cls(axes)
+        lookup = coverage.symbols.lookup
+        for (boundary, component, threat), flags in coverage.flags.items():
+            row = matrix.axes.components.index((lookup(boundary), lookup(component)))
+            bit = 1 << matrix.axes.threats.index(lookup(threat))
+            for state in STATES:
+                if flags & STATE_FLAGS[state]:
+                    rows = matrix.rows[state]
+                    rows[row] = rows.get(row, 0) | bit
+        return matrix
+
+    @classmethod
+    def from_parser(cls, parser, axes=None):
+        """Build a matrix from the elements of a PyThreatspecParser."""
+        return cls.from_coverage(cov.PTSCoverage.from_parser(parser, attach=False), axes)
+
+    @classmethod
+    def from_json(cls, data, axes=None, projects=None):
+        """Build a matrix from an intermediate representation document."""
+        return cls.from_coverage(cov.PTSCoverage.from_json(data, projects), axes)
+
+    def row(self, state, boundary_id, component_id):
+        """Return the threat bitset for a component."""
+        return self.rows[state].get(self.axes.components.get((boundary_id, component_id)), 0)
+
+    def has(self, state, boundary_id, component_id, threat_id):
+        """Return whether a component has a threat in a state."""
+        column = self.axes.threats.get(threat_id)
+        if column is None:
+            return False
+        return bool(self.row(state, boundary_id, component_id) >> column & 1)
+
+    def threats(self, state, boundary_id, component_id):
+        """Return the identifiers of the threats set for a component."""
+        bits = self.row(state, boundary_id, component_id)
+        keys = self.axes.threats.keys
+        return [keys[column] for column in _columns(bits)]
+
+    def components(self, state, threat_id):
+        """Return the (boundary, component) identifiers that have a threat set."""
+        column = self.axes.threats.get(threat_id)
+        if column is None:
+            return []
+        keys = self.axes.components.keys
+        return [keys[row] for row, bits in sorted(self.rows[state].items()) if bits >> column & 1]
+
+    def unmitigated(self):
+        """Return a dict of component position to the bitset of threats exposed but not otherwise handled.
+
+        For a rolled up matrix a parent is unmitigated if any of its descendants was, even
+        if another descendant is handled.
+        """
+        if self.unmitigated_rows is not None:
+            return dict(self.unmitigated_rows)
+        handled = _union_rows([self.rows[state] for state in STATES[1:]])
+        unmitigated = {}
+        for row, bits in self.rows["exposed"].items():
+            bits &= ~handled.get(row, 0)
+            if bits:
+                unmitigated[row] = bits
+        return unmitigated
+
+    def count(self, state):
+        """Return the number of bits set for a state."""
+        return sum(bin(bits).count("1") for bits in self.rows[state].values())
+
+    def rollup(self, threats):
+        """Roll the matrix up through the threat parent hierarchy.
+
+        Args:
+            threats: A dict of threat identifier to threat JSON, as found in the "threats"
+                section of an intermediate representation document. The "parent" of each
+                threat, if any, is followed to the top of the hierarchy.
+
+        Returns:
+            A new PTSCoverageMatrix whose columns are the parent threats, and the threats
+            without a parent. A column's bit is set for a component if the bit of the
+            threat itself or of any of its descendants is set. Unmitigated threats are
+            worked out before rolling up, so an exposed threat is not hidden by a handled
+            sibling.
+        """
+        parents = PTSAxis()
+        ancestors = []
+        for threat_id in self.axes.threats.keys:
+            bits = 0
+            seen = set()
+            parent_id = threats.get(threat_id, {}).get("parent")
+            while parent_id and parent_id not in seen:
+                seen.add(parent_id)
+                bits |= 1 << parents.index(parent_id)
+                parent_id = threats.get(parent_id, {}).get("parent")
+            ancestors.append(bits)
+
+        for column, threat_id in enumerate(self.axes.threats.keys):
+            if not ancestors[column]:
+                ancestors[column] = 1 << parents.index(threat_id)
+        for column, threat_id in enumerate(self.axes.threats.keys):
+            position = parents.get(threat_id)
+            if position is not None:
+                ancestors[column] |= 1 << position
+
+        rolled = PTSCoverageMatrix(PTSMatrixAxes(self.axes.components, parents))
+        for state in STATES:
+            rolled.rows[state] = _rollup_rows(self.rows[state], ancestors)
+        rolled.unmitigated_rows = _rollup_rows(self.unmitigated(), ancestors)
+        return rolled
+
+    def export_to_json(self):
+        """Return a JSON representation of this class.
+
+        Each state maps boundary and component identifiers to the list of threats set.
+        """
+        rep = {}
+        components = self.axes.components.keys
+        threats = self.axes.threats.keys
+        for state in STATES:
+            rep[state] = {}
+            for row, bits in sorted(self.rows[state].items()):
+                boundary_id, component_id = components[row]
+                rep[state].setdefault(boundary_id, {})[component_id] = [threats[column] for column in _columns(bits)]
+        return rep
+
+
+def _columns(bits):
+    """Iterate over the positions of the set bits in a bitset, lowest first."""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def _rollup_rows(rows, ancestors):
+    """Return rows with each bit replaced by the bits of its ancestors."""
+    rolled_rows = {}
+    for row, bits in rows.items():
+        rolled_bits = 0
+        for column in _columns(bits):
+            rolled_bits |= ancestors[column]
+        if rolled_bits:
+            rolled_rows[row] = rolled_bits
+    return rolled_rows
+
+
+def _union_rows(row_dicts):
+    """Return the row by row union of dicts of row bitsets."""
+    result = {}
+    for rows in row_dicts:
+        for row, bits in rows.items():
+            result[row] = result.get(row, 0) | bits
+    return result
+
+
+def _intersect_rows(row_dicts):
+    """Return the row by row intersection of dicts of row bitsets."""
+    result = dict(min(row_dicts, key=len))
+    for rows in row_dicts:
+        for row in list(result.keys()):
+            bits = result[row] & rows.get(row, 0)
+            if bits:
+                result[row] = bits
+            else:
+                del result[row]
+    return result
+
+
+def _check_axes(matrices):
+    if not matrices:
+        raise ValueError("no matrices given")
+    axes = matrices[0].axes
+    for matrix in matrices[1:]:
+        if matrix.axes is not axes:
+            raise ValueError("matrices do not share the same axes")
+    # The unmitigated threats of rolled up matrices cannot be combined, so combine and then roll up.
+    if any(matrix.unmitigated_rows is not None for matrix in matrices):
+        raise ValueError("rolled up matrices cannot be combined")
+    return axes
+
+
+def union(matrices):
+    """Return a matrix with the bits set in any of the matrices, which must share their axes."""
+    matrix = PTSCoverageMatrix(_check_axes(matrices))
+    for state in STATES:
+        matrix.rows[state] = _union_rows([m.rows[state] for m in matrices])
+    return matrix
+
+
+def intersection(matrices):
+    """Return a matrix with the bits set in all of the matrices, which must share their axes."""
+    matrix = PTSCoverageMatrix(_check_axes(matrices))
+    for state in STATES:
+        matrix.rows[state] = _intersect_rows([m.rows[state] for m in matrices])
+    return matrix
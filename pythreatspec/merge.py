@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+"""Merging intermediate representation documents.
+
+Updating one document with another replaces whole top level members, so the second
+file's threats or projects silently take the place of the first's. PTSMerger instead
+merges any number of IR documents by identifier:
+
+    boundaries, threats       merged by identifier
+    components                merged by boundary and then component identifier
+    dfd                       merged by source and destination boundary and component
+    projects                  merged by project, element kind and identifier, with the
+                              elements of each identifier concatenated and exact
+                              duplicates dropped
+
+The first value found for an identifier is kept. Members missing from it are filled
+in from later documents, and a later document giving a different name, description
+or other value for the same identifier is recorded as a PTSConflict rather than
+quietly winning or losing. The DFD only holds one edge between a pair of components,
+so a different type or name for the same pair is also a conflict.
+
+merge_files loads files, which may be compressed or binary, on a pool of threads and
+merges them in the order given as they arrive. Only a few documents are loaded ahead
+of the merge at any time, so each input is released as soon as it has been merged and
+memory use is bounded by the merged model rather than by the number of inputs.
+
+Copyright (c) 2017 the ThreatSpec contributors
+
+This software may be modified and distributed under the terms
+of the MIT license.  See the LICENSE file for details.
+"""
+
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+from . import pythreatspec as ts
+from .files import load_document
+
+PROPERTY_SECTIONS = ["boundaries", "components", "threats"]
+
+
+class PTSConflict(object):
+    """Differing values for the same identifier in two documents.
+
+    Attributes:
+        section: The section of the documents, such as "threats" or "dfd".
+        identifier: A list of the identifiers leading to the value, such as
+            [boundary_id, component_id] for a component.
+        field: The member whose values differ, such as "name" or "description".
+        kept: The value kept, from the first document that had one.
+        other: The value that was not kept.
+        files: The names of the two documents, kept first.
+    """
+
+    __slots__ = ("section", "identifier", "field", "kept", "other", "files")
+
+    def __init__(self, section, identifier, field, kept, other, files):
+        """Initialise the PTSConflict class."""
+        self.section = section
+        self.identifier = identifier
+        self.field = field
+        self.kept = kept
+        self.other = other
+        self.files = files
+
+    def __str__(self):
+        return "{} {} has {} {!r} in {} but {!r} in {}".format(
+            self.section, ":".join(self.identifier), self.field, self.kept, self.files[0], self.other, self.files[1]
+        )
+
+    def export_to_json(self):
+        """Return a JSON representation of this class."""
+        return {
+            "section": self.section,
+            "identifier": self.identifier,
+            "field": self.field,
+            "kept": self.kept,
+            "other": self.other,
+            "files": self.files
+        }
+
+
+class PTSMerger(object):
+    """Merges IR documents by identifier.
+
+    Attributes:
+        document: The merged document.
+        conflicts: A list of PTSConflict instances, in the order found.
+        count: The number of documents merged.
+    """
+
+    def __init__(self):
+        """Initialise the PTSMerger class."""
+        self.document = {
+            "specification": {"name": "ThreatSpec", "version": "0.1.0"},
+            "document": {},
+            "boundaries": {},
+            "components": {},
+            "threats": {},
+            "dfd": {},
+            "projects": {}
+        }
+        self.conflicts = []
+        self.count = 0
+        self._origins = {}
+        self._elements = {}
+
+    def add(self, document, name=None):
+        """Merge a document.
+
+        Args:
+            document: A JSON IR document.
+            name: The name of the document used in conflicts, such as its file name.
+                Defaults to its position in the merge.
+
+        Returns:
+            Nothing.
+        """
+        self.count += 1
+        if name is None:
+            name = "#{}".format(self.count)
+
+        self._merge_times(document.get("document", {}))
+        merged = self.document
+        for boundary_id, rep in document.get("boundaries", {}).items():
+            self._merge_value(merged["boundaries"], "boundaries", [boundary_id], rep, name)
+        for boundary_id, components in document.get("components", {}).items():
+            merged_components = merged["components"].setdefault(boundary_id, {})
+            for component_id, rep in components.items():
+                self._merge_value(merged_components, "components", [boundary_id, component_id], rep, name)
+        for threat_id, rep in document.get("threats", {}).items():
+            self._merge_value(merged["threats"], "threats", [threat_id], rep, name)
+
+        for source_boundary_id, source_components in document.get("dfd", {}).items():
+            for source_component_id, dest_boundaries in source_components.items():
+                for dest_boundary_id, dest_components in dest_boundaries.items():
+                    edges = merged["dfd"].setdefault(source_boundary_id, {}).setdefault(source_component_id, {}).setdefault(dest_boundary_id, {})
+                    for dest_component_id, details in dest_components.items():
+                        identifier = [source_boundary_id, source_component_id, dest_boundary_id, dest_component_id]
+                        self._merge_value(edges, "dfd", identifier, details, name, ("source",))
+
+        for project, details in document.get("projects", {}).items():
+            self._merge_project(project, details)
+
+    def _merge_times(self, times):
+        merged = self.document["document"]
+        if "created" in times:
+            merged["created"] = min(merged.get("created", times["created"]), times["created"])
+        if "updated" in times:
+            merged["updated"] = max(merged.get("updated", times["updated"]), times["updated"])
+
+    def _merge_value(self, table, section, identifier, rep, name, ignored=()):
+        """Merge the rep for an identifier into a table, recording any conflicts.
+
+        Members named in ignored may differ without a conflict, such as the source of a
+        DFD edge found in two places. The document each member was first filled in from
+        is recorded, as members can come from different documents.
+        """
+        key = identifier[-1]
+        existing = table.get(key)
+        origins = self._origins.setdefault((section,) + tuple(identifier), {})
+        if existing is None:
+            existing = table[key] = {}
+        for field, value in rep.items():
+            if field not in existing:
+                existing[field] = value
+                origins[field] = name
+            elif existing[field] != value and field not in ignored:
+                self.conflicts.append(PTSConflict(section, identifier, field, existing[field], value, [origins[field], name]))
+
+    def _merge_project(self, project, details):
+        merged = self.document["projects"].setdefault(project, dict((kind, {}) for kind in ts.ELEMENT_KINDS))
+        for kind, groups in details.items():
+            merged_groups = merged.setdefault(kind, {})
+            for element_id, elements in groups.items():
+                merged_elements = merged_groups.get(element_id)
+                if merged_elements is None:
+                    merged_elements = merged_groups[element_id] = []
+                seen = self._elements.setdefault((project, kind, element_id), set())
+                for element in elements:
+                    text = ts.canonical_dumps(element)
+                    if text not in seen:
+                        seen.add(text)
+                        merged_elements.append(element)
+
+    def export_to_json(self):
+        """Return the merged document."""
+        return self.document
+
+
+def iter_documents(filenames, workers=4):
+    """Load documents on a pool of threads and yield them in order.
+
+    At most workers documents are loaded ahead of the one being yielded.
+
+    Args:
+        filenames: A list of JSON or binary IR file names, which may be compressed.
+        workers: The number of threads loading files.
+
+    Yields:
+        Tuples of (file name, document).
+    """
+    pool = ThreadPool(workers)
+    try:
+        pending = deque()
+        for filename in filenames:
+            pending.append((filename, pool.apply_async(load_document, (filename,))))
+            if len(pending) > workers:
+                filename, result = pending.popleft()
+                yield filename, result.get()
+        while pending:
+            filename, result = pending.popleft()
+            yield filename, result.get()
+    finally:
+        pool.terminate()
+
+
+def merge_files(filenames, workers=4):
+    """Merge IR files.
+
+    Args:
+        filenames: A list of JSON or binary IR file names, which may be compressed.
+        workers: The number of threads loading files.
+
+    Returns:
+        The PTSMerger, with the merged document and any conflicts.
+    """
+    merger = PTSMerger()
+    for filename, document in iter_documents(filenames, workers):
+        merger.add(document, filename)
+    return merger
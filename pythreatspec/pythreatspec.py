@@ -23,6 +23,25 @@ import time
 import ast
 import os
 import re
+import json
+import hashlib
+import itertools
+import fnmatch
+import posixpath
+
+from . import stream
+
+ELEMENT_KINDS = ['mitigations', 'exposures', 'acceptances', 'transfers', 'reviews']
+ELEMENT_TEXT = {
+    'mitigations': 'mitigation',
+    'exposures': 'exposure',
+    'acceptances': 'acceptance',
+    'transfers': 'transfer',
+    'reviews': 'review'
+}
+
+TAG_NAMES = ['alias', 'describe', 'connects', 'review', 'mitigates', 'exposes', 'transfers', 'accepts']
+COMMENT_MARKERS = ['//', '/*', '#', '"""', '\'\'\'']
 
 
 def current_milli_time():
@@ -30,6 +49,44 @@ def current_milli_time():
     return int(round(time.time() * 1000))
 
 
+def source_date_milli_time(source_date=None):
+    """Return a fixed time in milliseconds for canonical output.
+
+    Args:
+        source_date: Seconds since the epoch. If this is None, the SOURCE_DATE_EPOCH
+            environment variable is used, as for reproducible builds, or 0 if it is not set.
+
+    Returns:
+        The time in milliseconds.
+    """
+    if source_date is None:
+        source_date = os.environ.get("SOURCE_DATE_EPOCH", 0)
+    return int(source_date) * 1000
+
+
+def canonical_dumps(value):
+    """Return the canonical JSON text of a value, with sorted keys and no whitespace."""
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+
+def content_digest(document):
+    """Return the digest of a document's content.
+
+    The document member, which holds the timestamps and the digest itself, is left
+    out, so two documents with the same model have the same digest whenever they were
+    written. The document should be canonical, as from PyThreatspecReporter with
+    canonical set.
+
+    Args:
+        document: A ThreatSpec JSON document.
+
+    Returns:
+        A string such as "sha256:9f86d0...".
+    """
+    content = dict((key, value) for key, value in document.items() if key != "document")
+    return "sha256:" + hashlib.sha256(canonical_dumps(content).encode("utf-8")).hexdigest()
+
+
 def is_identifier(text):
     """Check whether a string is an identifier.
 
@@ -63,6 +120,24 @@ def text_to_identifier(text):
         return "@" + re.sub('[^a-z0-9_]+', '_', text.strip().lower().replace('-','')).strip('_')
 
 
+def universal_tag_regex():
+    """Build the tag regular expression used for line based parsing.
+
+    The universal parser reads source files line by line rather than through a
+    language AST, so ThreatSpec tags may be preceded by a comment marker from
+    any of the supported languages, for example:
+
+        // @mitigates @web:@server against xss with output encoding
+
+    Returns:
+        A regular expression string suitable for PyThreatspecParser.tag_regex.
+    """
+    return r"^\s*(?:{})*\s*(@(?:{})).*$".format(
+        '|'.join([re.escape(c) for c in COMMENT_MARKERS]),
+        '|'.join([re.escape(t) for t in TAG_NAMES])
+    )
+
+
 def remove_excessive_space(text):
     """Remove exessive spacing.
 
@@ -77,6 +152,134 @@ def remove_excessive_space(text):
     return re.sub('\s+', ' ', text).strip()
 
 
+class PTSSymbolTable(object):
+    """A table of dense integer ids for identifiers.
+
+    Identifiers such as @cwe_319_cleartext_transmission are repeated in every element,
+    DFD edge and nested dict that refers to them. The parser passes every identifier
+    through this table so that each one is stored once, as a single shared string, and
+    is given a dense integer id. Indexes, caches and matrices can then key on the
+    integer ids, which are smaller and faster to hash and compare than the strings,
+    and turn them back into identifiers only when exporting.
+
+    Attributes:
+        symbols: A list of identifier strings, indexed by symbol id.
+    """
+
+    __slots__ = ("symbols", "_ids")
+
+    def __init__(self):
+        """Initialise the PTSSymbolTable class."""
+        self.symbols = []
+        self._ids = {}
+
+    def id_of(self, identifier):
+        """Return the symbol id of an identifier, adding it to the table if needed."""
+        symbol_id = self._ids.get(identifier)
+        if symbol_id is None:
+            symbol_id = len(self.symbols)
+            self.symbols.append(identifier)
+            self._ids[identifier] = symbol_id
+        return symbol_id
+
+    def get(self, identifier, default=None):
+        """Return the symbol id of an identifier without adding it to the table."""
+        return self._ids.get(identifier, default)
+
+    def intern(self, identifier):
+        """Return the shared copy of an identifier, adding it to the table if needed."""
+        return self.symbols[self.id_of(identifier)]
+
+    def lookup(self, symbol_id):
+        """Return the identifier for a symbol id."""
+        return self.symbols[symbol_id]
+
+    def __contains__(self, identifier):
+        return identifier in self._ids
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def export_to_json(self):
+        """Return a JSON representation of this class."""
+        return list(self.symbols)
+
+
+class PTSSourceTable(object):
+    """A table of the source file and function names seen by a parser.
+
+    Every tag creates a PTSSource, and there are usually many tags per file and per
+    function. Rather than each source holding its own copy of the file and function
+    names, the names are stored once in this table and sources only keep their
+    index into it. A source can therefore be shipped around compactly as a
+    (file index, line, function index) tuple and expanded again using the table.
+
+    Attributes:
+        files: A list of file name strings, indexed by file index.
+        functions: A list of function name strings, indexed by function index.
+    """
+
+    __slots__ = ("files", "functions", "_file_index", "_function_index")
+
+    def __init__(self):
+        """Initialise the PTSSourceTable class."""
+        self.files = []
+        self.functions = []
+        self._file_index = {}
+        self._function_index = {}
+
+    def file_index(self, fname):
+        """Return the index of a file name, adding it to the table if needed."""
+        index = self._file_index.get(fname)
+        if index is None:
+            index = len(self.files)
+            self.files.append(fname)
+            self._file_index[fname] = index
+        return index
+
+    def get_file_index(self, fname, default=None):
+        """Return the index of a file name without adding it to the table."""
+        return self._file_index.get(fname, default)
+
+    def function_index(self, function):
+        """Return the index of a function name, adding it to the table if needed."""
+        index = self._function_index.get(function)
+        if index is None:
+            index = len(self.functions)
+            self.functions.append(function)
+            self._function_index[function] = index
+        return index
+
+    def source(self, fname="", lineno=0, function=""):
+        """Return a new PTSSource that uses this table."""
+        return PTSSource(fname, lineno, function, self)
+
+    def expand(self, record):
+        """Return a new PTSSource from a compact (file index, line, function index) tuple."""
+        source = PTSSource.__new__(PTSSource)
+        source.table = self
+        source.file_index, source.lineno, source.function_index = record
+        return source
+
+    def clear(self):
+        """Remove every file and function name from the table.
+
+        Sources already using the table hold indexes into it, so they must not be used
+        afterwards. This is meant for default_source_table in long running processes.
+        """
+        self.files = []
+        self.functions = []
+        self._file_index = {}
+        self._function_index = {}
+
+    def export_to_json(self):
+        """Return a JSON representation of this class."""
+        return {
+            "files": list(self.files),
+            "functions": list(self.functions)
+        }
+
+
 class PTSSource(object):
     """A container for source code metadata.
 
@@ -85,17 +288,48 @@ class PTSSource(object):
     components when used with a callgraph, or it can be used to report on exactly
     where migitations, exposures etc. have been found in the code.
 
+    The file and function names are held in a PTSSourceTable, normally the one owned
+    by the parser, and are only expanded to strings when accessed or exported.
+
     Attributes:
         fname: A string containing the current source file's file name.
         lineno: An integer with the current line number.
         function: A string that represents the current class, function or module.
+        table: The PTSSourceTable holding the file and function names.
+        file_index: The index of fname in the table.
+        function_index: The index of function in the table.
     """
 
-    def __init__(self, fname="", lineno=0, function=""):
+    __slots__ = ("table", "file_index", "lineno", "function_index")
+
+    def __init__(self, fname="", lineno=0, function="", table=None):
         """Initiate the PTSSource class."""
-        self.fname = fname
+        self.table = table if table is not None else default_source_table
+        self.file_index = self.table.file_index(fname)
         self.lineno = lineno
-        self.function = function
+        self.function_index = self.table.function_index(function)
+
+    @property
+    def fname(self):
+        """The file name string."""
+        return self.table.files[self.file_index]
+
+    @fname.setter
+    def fname(self, fname):
+        self.file_index = self.table.file_index(fname)
+
+    @property
+    def function(self):
+        """The class, function or module name string."""
+        return self.table.functions[self.function_index]
+
+    @function.setter
+    def function(self, function):
+        self.function_index = self.table.function_index(function)
+
+    def compact(self):
+        """Return the (file index, line, function index) tuple for this source."""
+        return (self.file_index, self.lineno, self.function_index)
 
     def export_to_json(self):
         """Return a JSON representation of this class."""
@@ -106,11 +340,26 @@ class PTSSource(object):
         }
         return rep
 
+    @classmethod
+    def from_json(cls, rep, table=None):
+        """Return a PTSSource from the JSON representation written by export_to_json."""
+        return cls(rep.get("file", ""), rep.get("line", 0), rep.get("function", ""), table)
+
     def __str__(self):
         """Return the string representation of this class."""
         return self.fname + "@" + str(self.lineno)
 
 
+def source_key(source):
+    """Return the (file, line, function) of a source, for ordering sources."""
+    return (source.fname, source.lineno, source.function)
+
+
+# Sources created without a table, for example outside of a parser, share this one.
+# Each parser has a table of its own, so this one only grows with sources made elsewhere.
+default_source_table = PTSSourceTable()
+
+
 class PTSProperty(object):
     """An abstract parent class
 
@@ -121,6 +370,8 @@ class PTSProperty(object):
         desc: An optional description of the property instance.
     """
 
+    __slots__ = ("name", "desc")
+
     def __init__(self, name, desc=""):
         """Initiate the PTSProperty class."""
         self.name = name
@@ -137,6 +388,11 @@ class PTSProperty(object):
         """Return a JSON representation of this class."""
         return self.inner_rep()
 
+    @classmethod
+    def from_json(cls, rep):
+        """Return a property from the JSON representation written by export_to_json."""
+        return cls(rep["name"], rep.get("description", ""))
+
 
 class PTSBoundary(PTSProperty):
     """A ThreatSpec boundary.
@@ -155,6 +411,9 @@ class PTSBoundary(PTSProperty):
 
     Attributes are inherited from PTSProperty.
     """
+
+    __slots__ = ()
+
     def __init__(self, name, desc=""):
         """Initiate the PTSBoundary class."""
         PTSProperty.__init__(self, name, desc)
@@ -182,6 +441,9 @@ class PTSComponent(PTSProperty):
 
     Attributes are inherited from PTSProperty.
     """
+
+    __slots__ = ()
+
     def __init__(self, name, desc=""):
         """Initiate the PTSComponent class."""
         PTSProperty.__init__(self, name, desc)
@@ -202,11 +464,38 @@ class PTSThreat(PTSProperty):
                 "name": "malicious requests"
             },
 
-    Attributes are inherited from PTSProperty.
+    Threats in libraries, such as the CWE and SFP libraries, can also have references
+    and a parent threat.
+
+    Attributes:
+        name: Same as PTSProperty.
+        desc: Same as PTSProperty.
+        refs: A list of reference strings, empty if there are none.
+        parent: The identifier of the parent threat, or None.
     """
-    def __init__(self, name, desc=""):
+
+    __slots__ = ("refs", "parent")
+
+    def __init__(self, name, desc="", refs=None, parent=None):
         """Initiate teh PTSThreat class."""
         PTSProperty.__init__(self, name, desc)
+        self.refs = refs if refs is not None else []
+        self.parent = parent
+
+    def inner_rep(self):
+        """Return the inner representation of this object."""
+        rep = PTSProperty.inner_rep(self)
+        if self.refs:
+            rep["references"] = self.refs
+        if self.parent is not None:
+            rep["parent"] = self.parent
+        return rep
+
+    @classmethod
+    def from_json(cls, rep):
+        """Return a threat from the JSON representation written by export_to_json."""
+        # Some threats in the bundled libraries have refs rather than references.
+        return cls(rep["name"], rep.get("description", ""), rep.get("references", rep.get("refs")), rep.get("parent"))
 
 
 # TODO - consider renaming Element to something more meaningful
@@ -238,6 +527,9 @@ class PTSElement(object):
         threat: A threat identifier string.
         refs: An optional array of references strings.
     """
+
+    __slots__ = ("boundary", "component", "threat", "refs", "source")
+
     def __init__(self, boundary, component, threat, refs=[]):
         """Initialise the PTSElement class."""
         self.boundary = boundary
@@ -274,6 +566,8 @@ class PTSReview(object):
         refs: An optional array of references strings.
     """
 
+    __slots__ = ("boundary", "component", "review", "refs", "source")
+
     def __init__(self, boundary, component, review, refs=[]):
         """Initialise the PTSReview class."""
         self.boundary = boundary
@@ -308,6 +602,8 @@ class PTSTransfer(PTSElement):
         refs: Same as PTSElement.
     """
 
+    __slots__ = ("transfer",)
+
     def __init__(self, boundary, component, threat, transfer, refs=[]):
         """Initialise the PTSTransfer class."""
         PTSElement.__init__(self, boundary, component, threat, refs)
@@ -331,6 +627,8 @@ class PTSAcceptance(PTSElement):
         refs: Same as PTSElement.
     """
 
+    __slots__ = ("acceptance",)
+
     def __init__(self, boundary, component, threat, acceptance, refs=[]):
         """Initialise the PTSAcceptance class."""
         PTSElement.__init__(self, boundary, component, threat, refs)
@@ -354,6 +652,8 @@ class PTSMitigation(PTSElement):
         refs: Same as PTSElement.
     """
 
+    __slots__ = ("mitigation",)
+
     def __init__(self, boundary, component, threat, mitigation, refs=[]):
         """Initialise the PTSMitigation class."""
         PTSElement.__init__(self, boundary, component, threat, refs)
@@ -377,6 +677,8 @@ class PTSExposure(PTSElement):
         refs: Same as PTSElement.
     """
 
+    __slots__ = ("exposure",)
+
     def __init__(self, boundary, component, threat, exposure, refs=[]):
         """Initialises the PTSExposure class."""
         PTSElement.__init__(self, boundary, component, threat, refs)
@@ -389,63 +691,222 @@ class PTSExposure(PTSElement):
         return rep
 
 
+ELEMENT_CLASSES = {
+    'mitigations': PTSMitigation,
+    'exposures': PTSExposure,
+    'acceptances': PTSAcceptance,
+    'transfers': PTSTransfer,
+    'reviews': PTSReview
+}
+
+
+def element_from_json(kind, rep, table=None):
+    """Create an element from the JSON representation written by its export_to_json.
+
+    Args:
+        kind: One of ELEMENT_KINDS, for example "mitigations".
+        rep: The element's JSON representation.
+        table: An optional PTSSourceTable for the element's source.
+
+    Returns:
+        A PTSElement or PTSReview instance.
+    """
+    if kind == 'reviews':
+        element = PTSReview(rep['boundary'], rep['component'], rep['review'], rep.get('refs', []))
+    else:
+        element = ELEMENT_CLASSES[kind](rep['boundary'], rep['component'], rep['threat'], rep[ELEMENT_TEXT[kind]], rep.get('refs', []))
+    if rep.get('source'):
+        element.source = PTSSource.from_json(rep['source'], table)
+    return element
+
+
 class PTSDfd(object):
-    """Contains the Data Flow Diagram (DFD) tree structure.
+    """Contains the Data Flow Diagram (DFD) graph.
 
     Data flow diagrams are a core part of threat modelling and ThreatSpec allows
     the creation of DFDs through code using @connects tags (and in future using
     language callgraphs). We basically store the connections (edges) between
     components plus a little bit of metadata.
 
-    The structure is a series of nested dicts with the following hierarchy:
+    Each boundary and component pair is a node with a dense integer id. Edges are kept
+    in an edge table, and every node has forward and reverse adjacency lists of edge
+    numbers, so finding the connections out of or into a component is proportional to
+    the number of connections rather than the size of the graph. More than one named
+    edge can connect the same pair of nodes.
 
-        source boundary -> source component -> destination boundary -> destination component -> details
+    Attributes:
+        nodes: A list of (boundary id, component id) tuples, indexed by node id.
+        edges: A list of PTSDfdEdge objects, indexed by edge number.
+        forward: A list, indexed by node id, of the edge numbers leaving each node.
+        reverse: A list, indexed by node id, of the edge numbers entering each node.
+        boundary_nodes: A dict of boundary id to a list of node ids in the boundary.
     """
 
     def __init__(self):
         """Initialise the PTSDfd class."""
-        self.tree = {}
-
-    def export_to_json(self):
-        """Return a JSON representation of this class."""
-        rep = {}
-        for source_boundary_id, source_obj in self.tree.items():
-            if source_boundary_id not in rep:
-                rep[source_boundary_id] = {}
-            for source_component_id, dest_obj in source_obj.items():
-                if source_component_id not in rep[source_boundary_id]:
-                    rep[source_boundary_id][source_component_id] = {}
-                for dest_boundary_id, dest_component_obj in dest_obj.items():
-                    if dest_boundary_id not in rep[source_boundary_id][source_component_id]:
-                        rep[source_boundary_id][source_component_id][dest_boundary_id] = {}
-                    for dest_component_id, edge_obj in dest_component_obj.items():
-                        rep[source_boundary_id][source_component_id][dest_boundary_id][dest_component_id] = {}
-                        rep[source_boundary_id][source_component_id][dest_boundary_id][dest_component_id]['type'] = edge_obj['type']
-                        rep[source_boundary_id][source_component_id][dest_boundary_id][dest_component_id]['name'] = edge_obj['name']
-                        rep[source_boundary_id][source_component_id][dest_boundary_id][dest_component_id]['source'] = edge_obj['source'].export_to_json()
-        return rep
+        self.nodes = []
+        self.edges = []
+        self.forward = []
+        self.reverse = []
+        self.boundary_nodes = {}
+        self._node_ids = {}
+        self._pairs = {}
+        self._earliest = {}
+
+    def node_id(self, boundary_id, component_id):
+        """Return the node id of a component, adding the node if needed."""
+        key = (boundary_id, component_id)
+        node_id = self._node_ids.get(key)
+        if node_id is None:
+            node_id = len(self.nodes)
+            self.nodes.append(key)
+            self.forward.append([])
+            self.reverse.append([])
+            self.boundary_nodes.setdefault(boundary_id, []).append(node_id)
+            self._node_ids[key] = node_id
+        return node_id
+
+    def get_node_id(self, boundary_id, component_id, default=None):
+        """Return the node id of a component without adding the node."""
+        return self._node_ids.get((boundary_id, component_id), default)
 
     def add_edge(self, edge):
-        """Add an DFD edge to the tree."""
+        """Add an DFD edge to the graph.
+
+        An edge with the same name and type as an existing edge between the same pair of
+        components is not added again. The first edge added is kept, but the duplicate
+        whose source comes first by file, line and function is remembered for
+        canonical_edges.
+
+        Returns:
+            The edge number.
+        """
 
         if not edge.source:
             raise ValueError("metadata has not been set")
         elif not isinstance(edge.source, PTSSource):
             raise ValueError("metadata is of incorrect type")
 
-        # TODO - consider a better representation of the data, e.g. something recursive
-        if edge.source_boundary_id not in self.tree:
-            self.tree[edge.source_boundary_id] = {}
-        if edge.source_component_id not in self.tree[edge.source_boundary_id]:
-            self.tree[edge.source_boundary_id][edge.source_component_id] = {}
-        if edge.dest_boundary_id not in self.tree[edge.source_boundary_id][edge.source_component_id]:
-            self.tree[edge.source_boundary_id][edge.source_component_id][edge.dest_boundary_id] = {}
-        if edge.dest_component_id not in self.tree[edge.source_boundary_id][edge.source_component_id][edge.dest_boundary_id]:
-            self.tree[edge.source_boundary_id][edge.source_component_id][edge.dest_boundary_id][edge.dest_component_id] = {
+        source_node = self.node_id(edge.source_boundary_id, edge.source_component_id)
+        dest_node = self.node_id(edge.dest_boundary_id, edge.dest_component_id)
+        pair = self._pairs.setdefault((source_node, dest_node), [])
+        for edge_number in pair:
+            existing = self.edges[edge_number]
+            if existing.name == edge.name and existing.connection_type == edge.connection_type:
+                earliest = self._earliest.get(edge_number, existing)
+                if source_key(edge.source) < source_key(earliest.source):
+                    self._earliest[edge_number] = edge
+                return edge_number
+
+        edge_number = len(self.edges)
+        self.edges.append(edge)
+        self.forward[source_node].append(edge_number)
+        self.reverse[dest_node].append(edge_number)
+        pair.append(edge_number)
+        return edge_number
+
+    def edge_nodes(self, edge_number):
+        """Return the (source node id, destination node id) of an edge."""
+        edge = self.edges[edge_number]
+        return (
+            self._node_ids[(edge.source_boundary_id, edge.source_component_id)],
+            self._node_ids[(edge.dest_boundary_id, edge.dest_component_id)]
+        )
+
+    def outgoing(self, boundary_id, component_id):
+        """Return the edges leaving a component."""
+        node_id = self.get_node_id(boundary_id, component_id)
+        return [self.edges[e] for e in self.forward[node_id]] if node_id is not None else []
+
+    def incoming(self, boundary_id, component_id):
+        """Return the edges entering a component."""
+        node_id = self.get_node_id(boundary_id, component_id)
+        return [self.edges[e] for e in self.reverse[node_id]] if node_id is not None else []
+
+    def edges_between(self, source_boundary_id, source_component_id, dest_boundary_id, dest_component_id):
+        """Return the edges from one component to another."""
+        source_node = self.get_node_id(source_boundary_id, source_component_id)
+        dest_node = self.get_node_id(dest_boundary_id, dest_component_id)
+        return [self.edges[e] for e in self._pairs.get((source_node, dest_node), [])]
+
+    def components_in(self, boundary_id):
+        """Return the (boundary id, component id) of the nodes in a boundary."""
+        return [self.nodes[n] for n in self.boundary_nodes.get(boundary_id, [])]
+
+    def first_edges(self):
+        """Iterate over the first edge between each pair of components, in the order added.
+
+        The intermediate representation holds a single edge per pair of components, which
+        is the first one found.
+        """
+        for edge_numbers in self._pairs.values():
+            if edge_numbers:
+                yield self.edges[edge_numbers[0]]
+
+    def canonical_edges(self):
+        """Iterate over one edge between each pair of components, whatever order they were added in.
+
+        Of the edges between a pair of components, the one with the lowest name, type and
+        source is chosen. Duplicates of an edge count with the source found earliest.
+        """
+        for edge_numbers in self._pairs.values():
+            if edge_numbers:
+                yield min((self._earliest.get(e, self.edges[e]) for e in edge_numbers), key=lambda edge: (
+                    edge.name, edge.connection_type
+                ) + source_key(edge.source))
+
+    @property
+    def tree(self):
+        """The edges as nested dicts, as used by earlier versions of this class.
+
+        The hierarchy is:
+
+            source boundary -> source component -> destination boundary -> destination component -> details
+        """
+        tree = {}
+        for edge in self.first_edges():
+            tree.setdefault(edge.source_boundary_id, {}).setdefault(edge.source_component_id, {}).setdefault(edge.dest_boundary_id, {})[edge.dest_component_id] = {
                 'name': edge.name,
                 'type': edge.connection_type,
                 'source': edge.source
             }
+        return tree
+
+    def export_to_json(self):
+        """Return a JSON representation of this class."""
+        rep = {}
+        for edge in self.first_edges():
+            rep.setdefault(edge.source_boundary_id, {}).setdefault(edge.source_component_id, {}).setdefault(edge.dest_boundary_id, {})[edge.dest_component_id] = {
+                'type': edge.connection_type,
+                'name': edge.name,
+                'source': edge.source.export_to_json()
+            }
+        return rep
+
+    @classmethod
+    def from_json(cls, rep, dfd=None, table=None):
+        """Load the JSON representation written by export_to_json.
+
+        Args:
+            rep: The "dfd" object of a ThreatSpec JSON document.
+            dfd: An optional PTSDfd to add the edges to. A new one is created if this is None.
+            table: An optional PTSSourceTable for the edge sources. Defaults to default_source_table.
+
+        Returns:
+            The PTSDfd.
+        """
+        if dfd is None:
+            dfd = cls()
+        for source_boundary_id, source_components in rep.items():
+            for source_component_id, dest_boundaries in source_components.items():
+                for dest_boundary_id, dest_components in dest_boundaries.items():
+                    for dest_component_id, details in dest_components.items():
+                        dfd.add_edge(PTSDfdEdge(
+                            source_boundary_id, source_component_id, dest_boundary_id, dest_component_id,
+                            details['type'], details.get('name', ''),
+                            PTSSource.from_json(details.get('source', {}), table)
+                        ))
+        return dfd
 
 
 class PTSDfdEdge(object):
@@ -465,6 +926,8 @@ class PTSDfdEdge(object):
         source: A PTSSource object.
     """
 
+    __slots__ = ("source_boundary_id", "source_component_id", "dest_boundary_id", "dest_component_id", "connection_type", "name", "source")
+
     UNI_DIRECTIONAL = "uni"
     BI_DIRECTIONAL = "bi"
 
@@ -488,11 +951,195 @@ class PTSReference(object):
     Attributes:
         ref: A string representing a reference
     """
+
+    __slots__ = ("ref",)
+
     def __init__(self, ref):
         """Initialise the PTSReference class"""
         self.ref = ref
 
 
+class PTSElementIndex(object):
+    """Secondary indexes over the parser's elements.
+
+    The parser stores elements by kind and then by the identifier of their text, which
+    is no help when asking what mitigates a threat, or what is exposed on a component.
+    This index is kept up to date by the parser as elements are added, and groups the
+    elements by threat, by boundary and component, by source file and by kind. Within
+    each group the elements are split by kind, so any lookup is a couple of dict gets.
+
+    Keys are integer ids from the parser's PTSSymbolTable and PTSSourceTable. Each
+    entry is a (kind, element_id, element) tuple.
+
+    Attributes:
+        symbols: The PTSSymbolTable used for identifiers.
+        source_table: The PTSSourceTable used for file names.
+        by_threat: A dict of threat symbol id to a dict of kind to entries.
+        by_component: A dict of (boundary, component) symbol ids to a dict of kind to entries.
+        by_file: A dict of file index to a dict of kind to entries.
+        by_kind: A dict of kind to entries.
+    """
+
+    def __init__(self, symbols, source_table):
+        """Initialise the PTSElementIndex class."""
+        self.symbols = symbols
+        self.source_table = source_table
+        self.by_threat = {}
+        self.by_component = {}
+        self.by_file = {}
+        self.by_kind = {}
+        self.count = 0
+
+    def _add(self, index, key, kind, entry):
+        """Add an entry to one of the keyed indexes."""
+        kinds = index.get(key)
+        if kinds is None:
+            kinds = index[key] = {}
+        entries = kinds.get(kind)
+        if entries is None:
+            entries = kinds[kind] = []
+        entries.append(entry)
+
+    def add_element(self, kind, element_id, element):
+        """Index an element. Called by the parser as each element is added."""
+        entry = (kind, element_id, element)
+        threat = getattr(element, "threat", None)
+        if threat is not None:
+            self._add(self.by_threat, self.symbols.id_of(threat), kind, entry)
+        self._add(self.by_component, (self.symbols.id_of(element.boundary), self.symbols.id_of(element.component)), kind, entry)
+        if element.source is not None:
+            self._add(self.by_file, self.source_table.file_index(element.source.fname), kind, entry)
+        self.by_kind.setdefault(kind, []).append(entry)
+        self.count += 1
+
+    def _lookup(self, index, key, kind):
+        """Return the entries for a key, optionally of a single kind."""
+        kinds = index.get(key)
+        if not kinds:
+            return []
+        if kind is not None:
+            return kinds.get(kind, [])
+        return [entry for kind in ELEMENT_KINDS for entry in kinds.get(kind, [])]
+
+    def threat(self, threat_id, kind=None):
+        """Return the entries for a threat identifier."""
+        symbol_id = self.symbols.get(threat_id)
+        return self._lookup(self.by_threat, symbol_id, kind) if symbol_id is not None else []
+
+    def component(self, boundary_id, component_id, kind=None):
+        """Return the entries for a boundary and component identifier."""
+        key = (self.symbols.get(boundary_id), self.symbols.get(component_id))
+        return self._lookup(self.by_component, key, kind) if None not in key else []
+
+    def file(self, fname, kind=None):
+        """Return the entries for a source file name."""
+        file_index = self.source_table.get_file_index(fname)
+        return self._lookup(self.by_file, file_index, kind) if file_index is not None else []
+
+    def kind(self, kind):
+        """Return the entries of a kind."""
+        return self.by_kind.get(kind, [])
+
+
+def normalise_path(path):
+    """Return a file name or directory with forward slashes and without a leading ./ or trailing slash."""
+    path = posixpath.normpath(path.replace(os.sep, "/"))
+    return "" if path == "." else path
+
+
+class PTSProjectMap(object):
+    """Maps source file names to project names.
+
+    One run of a parser can scan many services at once. A project map assigns each
+    element to a project by the file it was found in, so a single parser, with one
+    shared table of boundaries, components and threats, can be written out as a
+    multi-project intermediate representation. Each rule is either a directory prefix,
+    matching every file below it, or a glob pattern such as "*/payments/*.py". The first
+    matching rule wins.
+
+    Elements can also be assigned to a project one by one, as PTSLoader does when it
+    loads a multi-project document, in which case the file they were found in is not
+    used.
+
+    Attributes:
+        rules: A list of (pattern, project, is_glob) tuples, in the order they are tried.
+        projects: The names of the projects elements were assigned to, in order. They are
+            written out even if they have no elements.
+    """
+
+    def __init__(self, rules=None):
+        """Initialise the PTSProjectMap class.
+
+        Args:
+            rules: An optional list of (pattern, project) tuples.
+        """
+        self.rules = []
+        self.projects = []
+        self._projects = {}
+        self._elements = {}
+        for pattern, project in rules or []:
+            self.add(pattern, project)
+
+    @classmethod
+    def from_strings(cls, mappings):
+        """Return a map from strings of the form PATTERN=PROJECT, as given on the command line."""
+        rules = []
+        for mapping in mappings:
+            pattern, separator, project = mapping.rpartition("=")
+            if not separator or not pattern or not project:
+                raise ValueError("invalid project mapping {}, expected PATTERN=PROJECT".format(mapping))
+            rules.append((pattern, project))
+        return cls(rules)
+
+    def add(self, pattern, project):
+        """Add a rule for a directory prefix or glob pattern."""
+        is_glob = any(character in pattern for character in "*?[")
+        self.rules.append((pattern.replace(os.sep, "/") if is_glob else normalise_path(pattern), project, is_glob))
+        self._projects = {}
+
+    def add_project(self, project):
+        """Add a project name, if it is not already known."""
+        if project not in self.projects:
+            self.projects.append(project)
+
+    def assign(self, element, project):
+        """Assign an element to a project, whatever file it was found in."""
+        self.add_project(project)
+        # The element is kept with its project so that its id is not reused.
+        self._elements[id(element)] = (element, project)
+
+    def element_project(self, element):
+        """Return the project of an element, or None if it is not assigned and no rule matches its file."""
+        assigned = self._elements.get(id(element))
+        if assigned is not None:
+            return assigned[1]
+        if element.source is None:
+            return None
+        return self.project_of(element.source.fname)
+
+    def project_of(self, fname):
+        """Return the project of a source file name, or None if no rule matches it.
+
+        Files are usually the source of many elements, so the result is cached.
+        """
+        try:
+            return self._projects[fname]
+        except KeyError:
+            pass
+        path = normalise_path(fname)
+        project = None
+        for pattern, rule_project, is_glob in self.rules:
+            if is_glob:
+                matched = fnmatch.fnmatchcase(path, pattern)
+            else:
+                matched = pattern == "" or path == pattern or path.startswith(pattern + "/")
+            if matched:
+                project = rule_project
+                break
+        self._projects[fname] = project
+        return project
+
+
 class PyThreatspecReporter(object):
     """Represents the intermediate representation structure.
 
@@ -505,23 +1152,51 @@ class PyThreatspecReporter(object):
     multiple intermediate output files for multiple projects, bringing multiple
     threat reports into a single large-scale threat report.
 
+    In canonical mode the output only depends on the model, not on the order in which
+    files were parsed or when. Keys are sorted, the elements of each group are sorted,
+    the DFD holds the edge chosen by PTSDfd.canonical_edges, and the timestamps are
+    taken from the source date. The content digest is recorded in the document member,
+    so caches can compare digests instead of whole documents. Canonical output is built
+    in memory before it is written.
+
+    With a project map, the elements are split into a project for each name the map
+    gives their source files, and elements in files the map does not match go into the
+    project named by project. The boundaries, components, threats and DFD are shared.
+
     Attributes:
         parser: A PyThreatspecParser object
         project: Project name string
+        canonical: True for canonical output.
+        source_date: The seconds since the epoch used for the timestamps of canonical
+            output, or None to use SOURCE_DATE_EPOCH.
+        project_map: An optional PTSProjectMap for multi-project output.
     """
 
-    def __init__(self, parser, project):
+    def __init__(self, parser, project, canonical=False, source_date=None, project_map=None):
         """Initialise the PyThreatspecReporter class.
 
         Args:
             parser: A PyThreatspecParser instance.
             project: A string representing the current project name.
+            canonical: True for canonical output.
+            source_date: The seconds since the epoch for canonical timestamps.
+            project_map: An optional PTSProjectMap assigning elements to projects by source file.
 
         Returns:
             A PyThreatspecReporter object.
         """
         self.parser = parser
         self.project = project
+        self.canonical = canonical
+        self.source_date = source_date
+        self.project_map = project_map
+
+    def project_of(self, element):
+        """Return the name of the project an element is written to."""
+        if self.project_map is None:
+            return self.project
+        project = self.project_map.element_project(element)
+        return self.project if project is None else project
 
     def export_to_json(self):
         """Return a JSON representation of this class.
@@ -530,83 +1205,146 @@ class PyThreatspecReporter(object):
         This should be valid as per the specification and allows different projects from different
         languages to be merged into a single Threat Model.
         """
-        data = {
-            "specification": {
-                "name": "ThreatSpec",
-                "version": "0.1.0"
-            },
-            "document": {
-                "created": self.parser.creation_time,
-                "updated": self.parser.updated_time
-            },
-            "boundaries": {},
-            "components": {},
-            "threats": {},
-            "dfd": {},
-            "projects": {}
+        if self.canonical:
+            return self.canonical_json()
+        return stream.materialise(self.document())
+
+    def canonical_json(self):
+        """Return the canonical JSON representation, including its content digest."""
+        rep = stream.materialise(self.document())
+        for details in rep["projects"].values():
+            for groups in details.values():
+                for elements in groups.values():
+                    elements.sort(key=canonical_dumps)
+        timestamp = source_date_milli_time(self.source_date)
+        rep["document"] = {
+            "created": timestamp,
+            "updated": timestamp,
+            "digest": content_digest(rep)
         }
+        return rep
 
-        """Boundaries, components and threats are top-level and are shared across projects."""
-        for boundary_id, boundary in self.parser.boundaries.items():
-            if boundary_id not in data["boundaries"]:
-                data["boundaries"][boundary_id] = boundary.export_to_json()
-
-        for boundary_id, component_obj in self.parser.components.items():
-            if boundary_id not in data["components"]:
-                data["components"][boundary_id] = {}
-            for component_id, component in component_obj.items():
-                if component_id not in data["components"][boundary_id]:
-                    data["components"][boundary_id][component_id] = component.export_to_json()
-
-        for threat_id, threat in self.parser.threats.items():
-            if threat_id not in data["threats"]:
-                data["threats"][threat_id] = threat.export_to_json()
-
-        """As is the DFD."""
-        data["dfd"].update(self.parser.dfd.export_to_json())
-
-        """Project-specific mitigations, exposures etc. are managed below."""
-        project_details = {
-            "mitigations": {},
-            "exposures": {},
-            "acceptances": {},
-            "transfers": {},
-            "reviews": {}
-        }
+    def write_json(self, fh, indent=2):
+        """Write the intermediate representation to a file.
 
-        for review_id, reviews in self.parser.reviews.items():
-            if review_id not in project_details["reviews"]:
-                project_details["reviews"][review_id] = []
-            for review in reviews:
-                project_details["reviews"][review_id].append(review.export_to_json())
+        The output is the same as json.dump(self.export_to_json(), fh, indent=indent, separators=(',', ': ')),
+        but each element is encoded as it is reached, without building the whole document in memory.
+        Canonical output is written with sorted keys.
 
-        for mitigation_id, mitigations in self.parser.mitigations.items():
-            if mitigation_id not in project_details["mitigations"]:
-                project_details["mitigations"][mitigation_id] = []
-            for mitigation in mitigations:
-                project_details["mitigations"][mitigation_id].append(mitigation.export_to_json())
+        Args:
+            fh: A file object opened for writing.
+            indent: The number of spaces to indent each level by, or None for compact output.
 
-        for exposure_id, exposures in self.parser.exposures.items():
-            if exposure_id not in project_details["exposures"]:
-                project_details["exposures"][exposure_id] = []
-            for exposure in exposures:
-                project_details["exposures"][exposure_id].append(exposure.export_to_json())
+        Returns:
+            Nothing.
+        """
+        if self.canonical:
+            separators = stream.SEPARATORS if indent is not None else stream.COMPACT_SEPARATORS
+            json.dump(self.canonical_json(), fh, indent=indent, separators=separators, sort_keys=True)
+            return
+        stream.PTSJsonWriter(fh, indent).write(self.document())
 
-        for acceptance_id, acceptances in self.parser.acceptances.items():
-            if acceptance_id not in project_details["acceptances"]:
-                project_details["acceptances"][acceptance_id] = []
-            for acceptance in acceptances:
-                project_details["acceptances"][acceptance_id].append(acceptance.export_to_json())
+    def write_shards(self, directory, by="boundary", depth=1, indent=2, extension=".threatspec.json"):
+        """Write the intermediate representation as shards, with a manifest.
 
-        for transfer_id, transfers in self.parser.transfers.items():
-            if transfer_id not in project_details["transfers"]:
-                project_details["transfers"][transfer_id] = []
-            for transfer in transfers:
-                project_details["transfers"][transfer_id].append(transfer.export_to_json())
+        The boundaries, components, threats and DFD are written once to a shared file, and
+        the elements to a file per boundary, or per source directory prefix. See PTSShardWriter.
 
-        data["projects"][self.project] = project_details
+        Args:
+            directory: The directory to write to.
+            by: "boundary" or "directory".
+            depth: The number of directory levels in the prefix when sharding by directory.
+            indent: The number of spaces to indent each level by, or None for compact output.
+            extension: The file name extension, which can select compression, such as ".threatspec.json.gz".
 
-        return data
+        Returns:
+            The manifest.
+        """
+        # The shards module builds on this one, so it can only be imported once this module is loaded.
+        from .shards import PTSShardWriter
+        return PTSShardWriter(self, directory, by, depth, indent, extension).write()
+
+    def document(self):
+        """Return the intermediate representation as lazy PTSJsonObject and PTSJsonArray values."""
+        return stream.PTSJsonObject([
+            ("specification", {
+                "name": "ThreatSpec",
+                "version": "0.1.0"
+            }),
+            ("document", {
+                "created": self.parser.creation_time,
+                "updated": self.parser.updated_time
+            }),
+            # Boundaries, components, threats and the DFD are top-level and are shared across projects.
+            ("boundaries", self._properties(self.parser.boundaries)),
+            ("components", stream.PTSJsonObject(
+                (boundary_id, self._properties(components)) for boundary_id, components in self.parser.components.items()
+            )),
+            ("threats", self._properties(self.parser.threats)),
+            ("dfd", self._dfd()),
+            ("projects", stream.PTSJsonObject(self._projects()))
+        ])
+
+    def _properties(self, properties):
+        return stream.PTSJsonObject((key, value.export_to_json()) for key, value in properties.items())
+
+    def _dfd(self):
+        """Return the DFD, with the first edge between each pair of components as in PTSDfd.export_to_json, or the canonical edge."""
+        tree = {}
+        edges = self.parser.dfd.canonical_edges() if self.canonical else self.parser.dfd.first_edges()
+        for edge in edges:
+            tree.setdefault(edge.source_boundary_id, {}).setdefault(edge.source_component_id, {}).setdefault(edge.dest_boundary_id, {})[edge.dest_component_id] = edge
+        return self._dfd_level(tree, 3)
+
+    def _dfd_level(self, tree, depth):
+        if depth == 0:
+            return stream.PTSJsonObject(
+                (dest_component_id, {
+                    'type': edge.connection_type,
+                    'name': edge.name,
+                    'source': edge.source.export_to_json()
+                })
+                for dest_component_id, edge in tree.items()
+            )
+        return stream.PTSJsonObject((key, self._dfd_level(subtree, depth - 1)) for key, subtree in tree.items())
+
+    def _projects(self):
+        """Iterate over the (project name, project details) of the document."""
+        if self.project_map is None:
+            yield self.project, self._project_details(self.parser)
+            return
+
+        # Group the elements by project, keeping the parser's order within each project.
+        projects = dict((project, dict((kind, {}) for kind in ELEMENT_KINDS)) for project in self.project_map.projects)
+        for kind, element_id, element in self.parser.iter_elements():
+            project = self.project_of(element)
+            details = projects.get(project)
+            if details is None:
+                details = projects[project] = dict((element_kind, {}) for element_kind in ELEMENT_KINDS)
+            details[kind].setdefault(element_id, []).append(element)
+
+        for project, details in projects.items():
+            yield project, stream.PTSJsonObject(
+                (kind, stream.PTSJsonObject(
+                    (element_id, stream.PTSJsonArray(element.export_to_json() for element in elements))
+                    for element_id, elements in details[kind].items()
+                ))
+                for kind in ELEMENT_KINDS
+            )
+
+    def _project_details(self, parser):
+        """Return the project-specific mitigations, exposures etc. of a parser."""
+        return stream.PTSJsonObject((kind, stream.PTSJsonObject(self._element_groups(parser, kind))) for kind in ELEMENT_KINDS)
+
+    def _element_groups(self, parser, kind):
+        """Iterate over the (element identifier, elements) of one kind."""
+        if parser.store is None:
+            for element_id, elements in parser.element_tables[kind].items():
+                yield element_id, stream.PTSJsonArray(element.export_to_json() for element in elements)
+            return
+        # The store returns elements grouped by element identifier, in the order first seen.
+        for element_id, entries in itertools.groupby(parser.iter_elements([kind]), lambda entry: entry[1]):
+            yield element_id, stream.PTSJsonArray(entry[2].export_to_json() for entry in entries)
 
 
 class PyThreatspecParser(object):
@@ -616,8 +1354,16 @@ class PyThreatspecParser(object):
     implements the functions used in parsing.
     """
 
-    def __init__(self):
-        """Initiates the PyThreatspecParser class"""
+    def __init__(self, store=None):
+        """Initiates the PyThreatspecParser class
+
+        Args:
+            store: An optional element store, such as a PTSColumnarStore. If this is
+                set, elements are kept in the store instead of the mitigations,
+                exposures, acceptances, transfers and reviews dicts, and no
+                PTSElementIndex is kept as the store has its own filtering. The
+                parser uses the store's symbol and source tables, if it has them.
+        """
         thetime = current_milli_time()
         self.creation_time = thetime
         self.updated_time = thetime
@@ -628,12 +1374,25 @@ class PyThreatspecParser(object):
         self.exposures = {}
         self.acceptances = {}
         self.transfers = {}
+        self.store = store
+        self.listeners = []
+        self.index = None
         self.tag_regex = r'^\s*(@(?:alias|describe|connects|review|mitigates|exposes|transfers|accepts)).*$'
 
         self.boundaries = {}
         self.components = {}
         self.threats = {}
         self.dfd = PTSDfd()
+        self.source_table = getattr(store, "source_table", None)
+        if self.source_table is None:
+            self.source_table = PTSSourceTable()
+        self.symbols = getattr(store, "symbols", None)
+        if self.symbols is None:
+            self.symbols = PTSSymbolTable()
+
+        if store is None:
+            self.index = PTSElementIndex(self.symbols, self.source_table)
+            self.listeners.append(self.index)
 
         self.alias_table = {}
         self.alias_table["boundary"] = self.add_boundary
@@ -645,6 +1404,13 @@ class PyThreatspecParser(object):
         self.pclass_table["component"] = self.components
         self.pclass_table["threat"] = self.threats
 
+        self.element_tables = {}
+        self.element_tables["mitigations"] = self.mitigations
+        self.element_tables["exposures"] = self.exposures
+        self.element_tables["acceptances"] = self.acceptances
+        self.element_tables["transfers"] = self.transfers
+        self.element_tables["reviews"] = self.reviews
+
         self.parse_table = {}
         self.parse_table["@alias"] = self._parse_alias
         self.parse_table["@describe"] = self._parse_describe
@@ -690,13 +1456,14 @@ class PyThreatspecParser(object):
             raise ValueError("boundary_id has been set, but boundary contains an identifier")
 
         if not boundary_id and is_identifier(boundary):
-            return boundary
+            return self.symbols.intern(boundary)
 
         if not boundary_id:
             boundary_id = text_to_identifier(boundary)
 
+        boundary_id = self.symbols.intern(boundary_id)
         if boundary_id not in self.boundaries:
-            self.boundaries[boundary_id] = PTSBoundary(boundary)
+            self.set_property("boundary", boundary_id, PTSBoundary(boundary))
         return boundary_id
 
     def add_component(self, boundary_id, component, component_id=None):
@@ -723,15 +1490,15 @@ class PyThreatspecParser(object):
             raise ValueError("component_id has been set, but component contains an identifier")
 
         if not component_id and is_identifier(component):
-            return component
+            return self.symbols.intern(component)
 
         if not component_id:
             component_id = text_to_identifier(component)
 
-        if boundary_id not in self.components:
-            self.components[boundary_id] = {}
-        if component_id not in self.components[boundary_id]:
-            self.components[boundary_id][component_id] = PTSComponent(component)
+        boundary_id = self.symbols.intern(boundary_id)
+        component_id = self.symbols.intern(component_id)
+        if component_id not in self.components.get(boundary_id, {}):
+            self.set_property("component", component_id, PTSComponent(component), boundary_id)
         return component_id
 
     def add_threat(self, threat, threat_id=None):
@@ -757,15 +1524,148 @@ class PyThreatspecParser(object):
             raise ValueError("threat_id has been set, but threat contains an identifier")
 
         if not threat_id and is_identifier(threat):
-            return threat
+            return self.symbols.intern(threat)
 
         if not threat_id:
             threat_id = text_to_identifier(threat)
 
+        threat_id = self.symbols.intern(threat_id)
         if threat_id not in self.threats:
-            self.threats[threat_id] = PTSThreat(threat)
+            self.set_property("threat", threat_id, PTSThreat(threat))
         return threat_id
 
+    def set_property(self, pclass, identifier, prop, boundary_id=None):
+        """Store a boundary, component or threat.
+
+        Listeners with an add_property method are called with the same arguments, both when
+        a property is added and when it is given a description with @describe.
+
+        Args:
+            pclass: One of "boundary", "component" or "threat".
+            identifier: The identifier of the property.
+            prop: A PTSBoundary, PTSComponent or PTSThreat instance.
+            boundary_id: The boundary identifier, for components only.
+
+        Returns:
+            Nothing.
+        """
+        if pclass == "component":
+            self.components.setdefault(self.symbols.intern(boundary_id), {})[self.symbols.intern(identifier)] = prop
+        else:
+            self.pclass_table[pclass][self.symbols.intern(identifier)] = prop
+        self._notify("add_property", pclass, identifier, prop, boundary_id)
+
+    def add_edge(self, edge):
+        """Add a DFD edge.
+
+        Listeners with an add_edge method are called with the edge if it is not a duplicate
+        of one already in the DFD.
+
+        Args:
+            edge: A PTSDfdEdge instance.
+
+        Returns:
+            The edge number in the DFD.
+        """
+        edge_count = len(self.dfd.edges)
+        edge_number = self.dfd.add_edge(edge)
+        if edge_number == edge_count:
+            self._notify("add_edge", edge)
+        return edge_number
+
+    def _notify(self, event, *args):
+        """Call the event method of each listener that has one."""
+        for listener in self.listeners:
+            handler = getattr(listener, event, None)
+            if handler is not None:
+                handler(*args)
+
+    def new_source(self, fname="", lineno=0, function=""):
+        """Create a source.
+
+        Sources created by the parser share its PTSSourceTable, so file and function
+        names are only stored once however many tags are found.
+
+        Args:
+            fname: String containing the filename.
+            lineno: Integer line number.
+            function: String containing the class, function or module name.
+
+        Returns:
+            A PTSSource object.
+        """
+        return self.source_table.source(fname, lineno, function)
+
+    def add_element(self, kind, element_id, element):
+        """Add an element.
+
+        Elements are the mitigations, exposures, acceptances, transfers and reviews found
+        by the tag parsers. They are grouped by kind, then by the identifier of their text.
+        Once stored, each of the parser's listeners is told about the new element by
+        calling its add_element method with the same arguments. Every listener must
+        have an add_element method, while add_property and add_edge are optional.
+
+        Args:
+            kind: One of ELEMENT_KINDS, for example "mitigations".
+            element_id: The identifier of the element text.
+            element: A PTSElement or PTSReview instance.
+
+        Returns:
+            Nothing.
+        """
+        if kind not in self.element_tables:
+            raise ValueError("unknown element kind {}".format(kind))
+
+        if self.store is not None:
+            self.store.add_element(kind, element_id, element)
+        else:
+            table = self.element_tables[kind]
+            if element_id not in table:
+                table[element_id] = []
+            table[element_id].append(element)
+
+        for listener in self.listeners:
+            listener.add_element(kind, element_id, element)
+
+    def iter_elements(self, kinds=None):
+        """Iterate over the elements, grouped by kind and then by element identifier.
+
+        Args:
+            kinds: An optional list of element kinds to include. Defaults to ELEMENT_KINDS.
+
+        Returns:
+            An iterator of (kind, element_id, element) tuples.
+        """
+        if self.store is not None:
+            for item in self.store.iter_elements(kinds):
+                yield item
+            return
+
+        for kind in kinds or ELEMENT_KINDS:
+            for element_id, elements in self.element_tables[kind].items():
+                for element in elements:
+                    yield kind, element_id, element
+
+    def element_key(self, element):
+        """Return the symbol ids of an element's boundary, component and threat.
+
+        The identifiers are only looked up, so the symbol table is not changed.
+
+        Args:
+            element: A PTSElement or PTSReview instance. Reviews do not have a threat,
+                so the threat symbol id is -1.
+
+        Returns:
+            A (boundary, component, threat) tuple of integer symbol ids, with None for
+            an identifier that is not in the symbol table.
+        """
+        threat = getattr(element, "threat", None)
+        return (
+            self.symbols.get(element.boundary),
+            self.symbols.get(element.component),
+            self.symbols.get(threat) if threat is not None else -1
+        )
+
     def _parse_alias(self, alias, source):
         """Parse an alias string.
 
@@ -846,6 +1746,7 @@ class PyThreatspecParser(object):
                     raise ValueError("unknown {} identifier {} in {}".format(pclass, describe_id, source))
 
                 self.pclass_table[pclass][boundary_id][describe_id].desc = text
+                self._notify("add_property", pclass, describe_id, self.pclass_table[pclass][boundary_id][describe_id], boundary_id)
             else:
                 boundary_id = None
                 describe_id = text_to_identifier(remove_excessive_space(match[0][1]))
@@ -855,6 +1756,7 @@ class PyThreatspecParser(object):
                     raise ValueError("unknown {} identifier {} in {}".format(pclass, describe_id, source))
 
                 self.pclass_table[pclass][describe_id].desc = text
+                self._notify("add_property", pclass, describe_id, self.pclass_table[pclass][describe_id], None)
         else:
             raise ValueError("@describe line contains an invalid pattern: {}".format(source))
 
@@ -882,23 +1784,23 @@ class PyThreatspecParser(object):
 
         match = re.findall(self.parse_patterns["connects"], connects, re.M | re.I)
         if match:
-            source_boundary_id = text_to_identifier(remove_excessive_space(match[0][0]))
-            source_component_id = text_to_identifier(remove_excessive_space(match[0][1]))
+            source_boundary_id = self.symbols.intern(text_to_identifier(remove_excessive_space(match[0][0])))
+            source_component_id = self.symbols.intern(text_to_identifier(remove_excessive_space(match[0][1])))
 
             if remove_excessive_space(match[0][2]) == "to":
                 connection_type = PTSDfdEdge.UNI_DIRECTIONAL
             else:
                 connection_type = PTSDfdEdge.BI_DIRECTIONAL
 
-            dest_boundary_id = text_to_identifier(remove_excessive_space(match[0][3]))
-            dest_component_id = text_to_identifier(remove_excessive_space(match[0][4]))
+            dest_boundary_id = self.symbols.intern(text_to_identifier(remove_excessive_space(match[0][3])))
+            dest_component_id = self.symbols.intern(text_to_identifier(remove_excessive_space(match[0][4])))
 
             if match[0][5]:
                 name = remove_excessive_space(match[0][5])
             else:
                 name = ""
 
-            self.dfd.add_edge(PTSDfdEdge(source_boundary_id, source_component_id, dest_boundary_id, dest_component_id, connection_type, name, source))
+            self.add_edge(PTSDfdEdge(source_boundary_id, source_component_id, dest_boundary_id, dest_component_id, connection_type, name, source))
         else:
             raise ValueError("@connects line contains an invalid pattern: {}".format(source))
 
@@ -934,14 +1836,11 @@ class PyThreatspecParser(object):
 
             boundary_id = self.add_boundary(boundary)
             component_id = self.add_component(boundary_id, component)
-            review_id = text_to_identifier(text)
-
-            if review_id not in self.reviews:
-                self.reviews[review_id] = []
+            review_id = self.symbols.intern(text_to_identifier(text))
 
             review = PTSReview(boundary_id, component_id, text, [])
             review.source = source
-            self.reviews[review_id].append(review)
+            self.add_element("reviews", review_id, review)
         else:
             raise ValueError("@review line contains an invalid pattern: {}".format(source))
 
@@ -975,14 +1874,11 @@ class PyThreatspecParser(object):
             component_id = self.add_component(boundary_id, component)
             threat_id = self.add_threat(threat)
 
-            mitigation_id = text_to_identifier(mitigation_text)
-
-            if mitigation_id not in self.mitigations:
-                self.mitigations[mitigation_id] = []
+            mitigation_id = self.symbols.intern(text_to_identifier(mitigation_text))
 
             mitigation = PTSMitigation(boundary_id, component_id, threat_id, mitigation_text, [])
             mitigation.source = source 
-            self.mitigations[mitigation_id].append(mitigation)
+            self.add_element("mitigations", mitigation_id, mitigation)
         else:
             raise ValueError("@mitigates line contains an invalid pattern: {}".format(source))
 
@@ -1015,14 +1911,11 @@ class PyThreatspecParser(object):
             boundary_id = self.add_boundary(boundary)
             component_id = self.add_component(boundary_id, component)
             threat_id = self.add_threat(threat)
-            exposure_id = text_to_identifier(exposes_text)
-
-            if exposure_id not in self.exposures:
-                self.exposures[exposure_id] = []
+            exposure_id = self.symbols.intern(text_to_identifier(exposes_text))
 
             exposure = PTSExposure(boundary_id, component_id, threat_id, exposes_text, [])
             exposure.source = source 
-            self.exposures[exposure_id].append(exposure)
+            self.add_element("exposures", exposure_id, exposure)
         else:
             raise ValueError("@exposes line contains an invalid pattern: {}".format(source))
 
@@ -1055,14 +1948,11 @@ class PyThreatspecParser(object):
             boundary_id = self.add_boundary(boundary)
             component_id = self.add_component(boundary_id, component)
             threat_id = self.add_threat(threat)
-            transfer_id = text_to_identifier(transfer_text)
-
-            if transfer_id not in self.transfers:
-                self.transfers[transfer_id] = []
+            transfer_id = self.symbols.intern(text_to_identifier(transfer_text))
 
             transfer = PTSTransfer(boundary_id, component_id, threat_id, transfer_text, [])
             transfer.source = source
-            self.transfers[transfer_id].append(transfer)
+            self.add_element("transfers", transfer_id, transfer)
         else:
             raise ValueError("@transfers line contains an invalid pattern: {}".format(source))
 
@@ -1095,14 +1985,11 @@ class PyThreatspecParser(object):
             boundary_id = self.add_boundary(boundary)
             component_id = self.add_component(boundary_id, component)
             threat_id = self.add_threat(threat)
-            accept_id = text_to_identifier(acceptance_text)
-
-            if accept_id not in self.acceptances:
-                self.acceptances[accept_id] = []
+            accept_id = self.symbols.intern(text_to_identifier(acceptance_text))
 
             accept = PTSAcceptance(boundary_id, component_id, threat_id, acceptance_text, [])
             accept.source = source
-            self.acceptances[accept_id].append(accept)
+            self.add_element("acceptances", accept_id, accept)
         else:
             raise ValueError("@accepts line contains an invalid pattern: {}".format(source))
 
@@ -1124,7 +2011,7 @@ class PyThreatspecParser(object):
             return
 
         for tag in re.findall(self.tag_regex, comment, re.M | re.I):  # multiline and ignore case
-            self.parse_table[tag](comment, source)
+            self.parse_table[tag.lower()](comment, source)
 
     def _parse_globals(self, module, filename):
         """Parse the global module.
@@ -1138,7 +2025,7 @@ class PyThreatspecParser(object):
         Returns:
             Nothing.
         """
-        self._parse_comment(ast.get_docstring(module), PTSSource(filename, 0, "module"))
+        self._parse_comment(ast.get_docstring(module), self.new_source(filename, 0, "module"))
 
     def _parse_classes(self, module, filename):
         """Parse classes.
@@ -1155,7 +2042,7 @@ class PyThreatspecParser(object):
 
         class_definitions = [node for node in module.body if isinstance(node, ast.ClassDef)]
         for class_def in class_definitions:
-            self._parse_comment(ast.get_docstring(class_def), PTSSource(filename, class_def.lineno, class_def.name))
+            self._parse_comment(ast.get_docstring(class_def), self.new_source(filename, class_def.lineno, class_def.name))
             self._parse_methods(class_def, filename)
 
     def _parse_methods(self, classmodule, filename):
@@ -1172,7 +2059,7 @@ class PyThreatspecParser(object):
         """
         for node in ast.iter_child_nodes(classmodule):
             if isinstance(node, ast.FunctionDef):
-                self._parse_comment(ast.get_docstring(node), PTSSource(filename, node.lineno, node.name))
+                self._parse_comment(ast.get_docstring(node), self.new_source(filename, node.lineno, node.name))
 
     def _parse_functions(self, module, filename):
         """Parse the global functions.
@@ -1189,7 +2076,7 @@ class PyThreatspecParser(object):
 
         function_definitions = [node for node in module.body if isinstance(node, ast.FunctionDef)]
         for func in function_definitions:
-            self._parse_comment(ast.get_docstring(func), PTSSource(filename, func.lineno, func.name))
+            self._parse_comment(ast.get_docstring(func), self.new_source(filename, func.lineno, func.name))
 
     def parse(self, filename):
         """Parse the source file.
@@ -1198,6 +2085,9 @@ class PyThreatspecParser(object):
 
         Args:
             filename: String containing the filename as given on the command line.
+
+        Returns:
+            The parsed AST module, which can be reused by PTSCallGraph.
         """
         ast_filename = os.path.splitext(filename)[0] + '.py'
         with open(ast_filename, 'r') as fd:
@@ -1207,6 +2097,7 @@ class PyThreatspecParser(object):
         self._parse_globals(module, filename)
         self._parse_classes(module, filename)
         self._parse_functions(module, filename)
+        return module
 
     def export(self):
         """Exports the internal data structures."""
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""Query API over a parsed ThreatSpec model.
+
+Report tools and dashboards mostly ask questions like "what mitigates threat X" or
+"what is exposed on component Y". PTSQuery answers these from the PTSElementIndex that
+PyThreatspecParser maintains as elements are added, so each question is a dict lookup
+followed by iteration over the matching elements, rather than a scan of every list in
+parser.mitigations and parser.exposures. For example:
+
+    query = PTSQuery(parser)
+    for mitigation in query.mitigations_of("@cwe_319_cleartext_transmission"):
+        print(mitigation.mitigation, mitigation.source)
+
+Copyright (c) 2017 the ThreatSpec contributors
+
+This software may be modified and distributed under the terms
+of the MIT license.  See the LICENSE file for details.
+"""
+
+from . import pythreatspec as ts
+
+
+class PTSQuery(object):
+    """Answers questions about the elements of a parsed model.
+
+    The methods returning entries return (kind, element_id, element) tuples, while the
+    convenience methods for a single kind return just the elements.
+
+    Attributes:
+        parser: The PyThreatspecParser being queried.
+        index: The parser's PTSElementIndex.
+    """
+
+    def __init__(self, parser):
+        """Initialise the PTSQuery class.
+
+        Args:
+            parser: A PyThreatspecParser instance. It must maintain an index, which is the
+                case unless it was created with an element store.
+        """
+        if parser.index is None:
+            raise ValueError("parser does not maintain an element index")
+        self.parser = parser
+        self.index = parser.index
+
+    def _elements(self, entries):
+        return [entry[2] for entry in entries]
+
+    def by_threat(self, threat_id, kind=None):
+        """Return the entries for a threat, optionally of a single kind."""
+        return self.index.threat(threat_id, kind)
+
+    def by_component(self, boundary_id, component_id, kind=None):
+        """Return the entries for a boundary and component, optionally of a single kind."""
+        return self.index.component(boundary_id, component_id, kind)
+
+    def by_file(self, fname, kind=None):
+        """Return the entries found in a source file, optionally of a single kind."""
+        return self.index.file(fname, kind)
+
+    def by_kind(self, kind):
+        """Return the entries of a single kind."""
+        if kind not in ts.ELEMENT_KINDS:
+            raise ValueError("unknown element kind {}".format(kind))
+        return self.index.kind(kind)
+
+    def mitigations_of(self, threat_id):
+        """Return the mitigations of a threat."""
+        return self._elements(self.index.threat(threat_id, "mitigations"))
+
+    def exposures_to(self, threat_id):
+        """Return the exposures to a threat."""
+        return self._elements(self.index.threat(threat_id, "exposures"))
+
+    def mitigations_on(self, boundary_id, component_id):
+        """Return the mitigations on a component."""
+        return self._elements(self.index.component(boundary_id, component_id, "mitigations"))
+
+    def exposures_on(self, boundary_id, component_id):
+        """Return the exposures on a component."""
+        return self._elements(self.index.component(boundary_id, component_id, "exposures"))
+
+    def threats_on(self, boundary_id, component_id):
+        """Return the identifiers of the threats referenced on a component, in the order first seen."""
+        threats = []
+        seen = set()
+        for kind, element_id, element in self.index.component(boundary_id, component_id):
+            threat = getattr(element, "threat", None)
+            if threat is not None and threat not in seen:
+                seen.add(threat)
+                threats.append(threat)
+        return threats
+
+    def components_for(self, threat_id, kind=None):
+        """Return the (boundary, component) identifiers that reference a threat, in the order first seen."""
+        components = []
+        seen = set()
+        for entry_kind, element_id, element in self.index.threat(threat_id, kind):
+            key = (element.boundary, element.component)
+            if key not in seen:
+                seen.add(key)
+                components.append(key)
+        return components
+
+    def count(self, kind=None, threat_id=None, boundary_id=None, component_id=None):
+        """Count the elements matching a kind, threat or component.
+
+        At most one of threat_id and the boundary_id and component_id pair can be given.
+        """
+        if threat_id is not None:
+            return len(self.index.threat(threat_id, kind))
+        if boundary_id is not None or component_id is not None:
+            return len(self.index.component(boundary_id, component_id, kind))
+        if kind is not None:
+            return len(self.index.kind(kind))
+        return self.index.count
@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+"""Render the DFD as Mermaid or Graphviz DOT.
+
+PTSDfdRenderer draws a PTSDfd with one subgraph per trust boundary. Edges within a
+boundary are drawn inside its subgraph, and edges crossing boundaries are drawn in bold
+afterwards. Optionally the exposures, mitigations, transfers, acceptances and reviews
+of each component are attached to it as notes. For example:
+
+    renderer = PTSDfdRenderer.from_parser(parser, elements=True)
+    print(renderer.render("mermaid"))
+
+Each boundary's subgraph is rendered from its name, its components, the edges within
+it and the notes on its components. A hash of those is kept in the cache with the
+rendered text, and the text is only regenerated when the hash changes, so rendering
+a large model again after a small change only redraws the boundaries that changed.
+The cache is a plain dict of strings, so it can be saved between runs as JSON.
+
+For large models, boundaries can be collapsed into single nodes, with the edges
+between them aggregated, while other boundaries are drawn in full.
+
+Nodes are given generated IDs such as n0 and n1, numbered in the order the boundaries
+and components are first drawn, and identifiers only appear in the quoted labels. This keeps
+identifiers such as @web-app or @db.v2 out of the IDs, and keeps @a_b:@c and @a:@b_c
+apart.
+
+Copyright (c) 2017 the ThreatSpec contributors
+
+This software may be modified and distributed under the terms
+of the MIT license.  See the LICENSE file for details.
+"""
+
+import hashlib
+import textwrap
+
+from . import pythreatspec as ts
+
+FORMATS = ["mermaid", "dot"]
+
+KIND_COLOURS = [
+    ("exposures", "#e74c3c"),
+    ("mitigations", "#2ecc71"),
+    ("transfers", "#9b59b6"),
+    ("acceptances", "#f39c12"),
+    ("reviews", "#3498db"),
+]
+
+KIND_LABELS = {
+    "exposures": "Exposed to {threat} with {text}",
+    "mitigations": "Mitigated against {threat} with {text}",
+    "transfers": "Transfers {threat} with {text}",
+    "acceptances": "Accepts {threat} with {text}",
+    "reviews": "Review {text}",
+}
+
+
+def default_name(identifier):
+    """Return a readable name for an identifier that has no name defined."""
+    return identifier.lstrip("@").replace("_", " ")
+
+
+def wrap(text, width=40):
+    """Wrap a Mermaid label over several lines."""
+    return "<br/>".join(textwrap.wrap(text, width)) or text
+
+
+class PTSDfdRenderer(object):
+    """Renders a PTSDfd.
+
+    Attributes:
+        dfd: The PTSDfd to render.
+        boundaries: A dict of boundary identifier to name.
+        components: A dict of boundary identifier to a dict of component identifier to name.
+        threats: A dict of threat identifier to name.
+        notes: A dict of (boundary, component) to a list of (kind, threat identifier, text) tuples.
+        cache: A dict of "format:boundary" to [hash, rendered text].
+        node_ids: A dict of (boundary,) or (boundary, component) to the generated node ID.
+    """
+
+    def __init__(self, dfd, boundaries=None, components=None, threats=None, cache=None):
+        """Initialise the PTSDfdRenderer class."""
+        self.dfd = dfd
+        self.boundaries = boundaries if boundaries is not None else {}
+        self.components = components if components is not None else {}
+        self.threats = threats if threats is not None else {}
+        self.notes = {}
+        self.cache = cache if cache is not None else {}
+        self.node_ids = {}
+
+    @classmethod
+    def from_parser(cls, parser, elements=False, cache=None):
+        """Create a renderer for a parser's DFD, taking names from the parser's properties.
+
+        Args:
+            parser: A PyThreatspecParser.
+            elements: Whether to draw the elements of each component as notes.
+            cache: An optional cache from an earlier renderer.
+        """
+        renderer = cls(
+            parser.dfd,
+            dict((k, v.name) for k, v in parser.boundaries.items()),
+            dict((b, dict((k, v.name) for k, v in components.items())) for b, components in parser.components.items()),
+            dict((k, v.name) for k, v in parser.threats.items()),
+            cache
+        )
+        if elements:
+            for kind, element_id, element in parser.iter_elements():
+                renderer.add_note(kind, element.boundary, element.component, getattr(element, "threat", None), getattr(element, ts.ELEMENT_TEXT[kind]))
+        return renderer
+
+    @classmethod
+    def from_json(cls, documents, elements=False, cache=None):
+        """Create a renderer from one or more ThreatSpec JSON documents.
+
+        Names, DFD edges and elements are combined from all the documents, so a threat
+        library can be given along with the project documents that use it.
+
+        Args:
+            documents: A list of loaded ThreatSpec JSON documents.
+            elements: Whether to draw the elements of each component as notes.
+            cache: An optional cache from an earlier renderer.
+        """
+        renderer = cls(ts.PTSDfd(), cache=cache)
+        table = ts.PTSSourceTable()
+        for data in documents:
+            ts.PTSDfd.from_json(data.get("dfd", {}), renderer.dfd, table)
+            for boundary_id, boundary in data.get("boundaries", {}).items():
+                renderer.boundaries[boundary_id] = boundary["name"]
+            for boundary_id, components in data.get("components", {}).items():
+                for component_id, component in components.items():
+                    renderer.components.setdefault(boundary_id, {})[component_id] = component["name"]
+            for threat_id, threat in data.get("threats", {}).items():
+                renderer.threats[threat_id] = threat["name"]
+            if elements:
+                for project in data.get("projects", {}).values():
+                    for kind in ts.ELEMENT_KINDS:
+                        for element_id, items in project.get(kind, {}).items():
+                            for item in items:
+                                renderer.add_note(kind, item["boundary"], item["component"], item.get("threat"), item[ts.ELEMENT_TEXT[kind]])
+        return renderer
+
+    def add_note(self, kind, boundary_id, component_id, threat_id, text):
+        """Attach an element to a component, to be drawn as a note."""
+        self.notes.setdefault((boundary_id, component_id), []).append((kind, threat_id, text))
+
+    def boundary_name(self, boundary_id):
+        return self.boundaries.get(boundary_id) or default_name(boundary_id)
+
+    def component_name(self, boundary_id, component_id):
+        return self.components.get(boundary_id, {}).get(component_id) or default_name(component_id)
+
+    def note_label(self, kind, threat_id, text):
+        threat = self.threats.get(threat_id) or default_name(threat_id or "")
+        return KIND_LABELS[kind].format(threat=threat, text=text)
+
+    def boundary_ids(self):
+        """Return the boundaries to draw, in the order they were defined and then first used."""
+        boundary_ids = list(self.components)
+        seen = set(boundary_ids)
+        for boundary_id, component_id in self.dfd.nodes + list(self.notes):
+            if boundary_id not in seen:
+                seen.add(boundary_id)
+                boundary_ids.append(boundary_id)
+        return boundary_ids
+
+    def component_index(self):
+        """Return a dict of boundary identifier to its components, in the order they were defined and then first used."""
+        index = dict((boundary_id, list(components)) for boundary_id, components in self.components.items())
+        seen = set((boundary_id, component_id) for boundary_id, component_ids in index.items() for component_id in component_ids)
+        for key in self.dfd.nodes + list(self.notes):
+            if key not in seen:
+                seen.add(key)
+                index.setdefault(key[0], []).append(key[1])
+        return index
+
+    def component_ids(self, boundary_id):
+        """Return the components of a boundary, in the order they were defined and then first used."""
+        return self.component_index().get(boundary_id, [])
+
+    def node_id(self, *identifiers):
+        """Return the generated node ID for a boundary, or a boundary and component, for example "n0"."""
+        if identifiers not in self.node_ids:
+            self.node_ids[identifiers] = "n{}".format(len(self.node_ids))
+        return self.node_ids[identifiers]
+
+    def _number_nodes(self, component_index):
+        """Number any new nodes in drawing order.
+
+        Nodes keep their IDs between renders, so adding a component only changes the
+        subgraph of its own boundary.
+        """
+        for boundary_id in self.boundary_ids():
+            self.node_id(boundary_id)
+            for component_id in component_index.get(boundary_id, []):
+                self.node_id(boundary_id, component_id)
+
+    def _collapsed(self, collapse, boundary_id):
+        if collapse is True:
+            return True
+        return bool(collapse) and boundary_id in collapse
+
+    def _endpoint(self, collapse, boundary_id, component_id):
+        if self._collapsed(collapse, boundary_id):
+            return self.node_id(boundary_id)
+        return self.node_id(boundary_id, component_id)
+
+    def _internal_edges(self):
+        """Return a dict of boundary identifier to the edges within it, as (source, dest, name, type) tuples."""
+        internal = {}
+        for e in self.dfd.first_edges():
+            if e.source_boundary_id == e.dest_boundary_id:
+                internal.setdefault(e.source_boundary_id, []).append((e.source_component_id, e.dest_component_id, e.name, e.connection_type))
+        return internal
+
+    def _boundary_content(self, boundary_id, edges, component_ids):
+        """Return everything a boundary's subgraph is drawn from, including the node IDs, as a hashable tuple."""
+        components = tuple((self.node_id(boundary_id, c), self.component_name(boundary_id, c)) for c in component_ids)
+        edges = tuple((self.node_id(boundary_id, source), self.node_id(boundary_id, dest), name, connection_type) for source, dest, name, connection_type in edges)
+        notes = tuple(
+            (self.node_id(boundary_id, c), kind, threat_id, self.note_label(kind, threat_id, text))
+            for c in component_ids for kind, threat_id, text in self.notes.get((boundary_id, c), [])
+        )
+        return (self.node_id(boundary_id), self.boundary_name(boundary_id), components, edges, notes)
+
+    def _subgraph(self, fmt, boundary_id, writer, internal, component_index):
+        """Return a boundary's rendered subgraph, from the cache if its content has not changed."""
+        content = self._boundary_content(boundary_id, internal.get(boundary_id, []), component_index.get(boundary_id, []))
+        digest = hashlib.sha1(repr(content).encode("utf-8")).hexdigest()
+        key = "{}:{}".format(fmt, boundary_id)
+        cached = self.cache.get(key)
+        if cached is None or cached[0] != digest:
+            cached = self.cache[key] = [digest, writer(boundary_id, content)]
+        return cached[1]
+
+    def _cross_edges(self, collapse):
+        """Return the edges drawn outside the subgraphs as (source, dest, label, type) tuples.
+
+        Edges between expanded boundaries are drawn individually. Edges to or from collapsed
+        boundaries are aggregated per pair of nodes, and labelled with the number of flows
+        if there is more than one.
+        """
+        edges = []
+        aggregated = {}
+        for edge in self.dfd.first_edges():
+            source_collapsed = self._collapsed(collapse, edge.source_boundary_id)
+            dest_collapsed = self._collapsed(collapse, edge.dest_boundary_id)
+            if edge.source_boundary_id == edge.dest_boundary_id and not source_collapsed:
+                continue
+            source = self._endpoint(collapse, edge.source_boundary_id, edge.source_component_id)
+            dest = self._endpoint(collapse, edge.dest_boundary_id, edge.dest_component_id)
+            if not source_collapsed and not dest_collapsed:
+                edges.append((source, dest, edge.name, edge.connection_type))
+            elif source != dest:
+                key = (source, dest)
+                if key not in aggregated:
+                    aggregated[key] = [source, dest, [], set()]
+                    edges.append(aggregated[key])
+                aggregated[key][2].append(edge.name)
+                aggregated[key][3].add(edge.connection_type)
+
+        rendered = []
+        for edge in edges:
+            if isinstance(edge, list):
+                source, dest, names, types = edge
+                label = names[0] if len(names) == 1 else "{} flows".format(len(names))
+                connection_type = ts.PTSDfdEdge.BI_DIRECTIONAL if types == set([ts.PTSDfdEdge.BI_DIRECTIONAL]) else ts.PTSDfdEdge.UNI_DIRECTIONAL
+                rendered.append((source, dest, label, connection_type))
+            else:
+                rendered.append(edge)
+        return rendered
+
+    def render(self, fmt="mermaid", collapse=None):
+        """Render the DFD.
+
+        Args:
+            fmt: The output format, one of FORMATS.
+            collapse: True to collapse every boundary into a single node, or a collection
+                of the boundary identifiers to collapse.
+
+        Returns:
+            A string containing the diagram.
+        """
+        if fmt == "mermaid":
+            return self.mermaid(collapse)
+        elif fmt == "dot":
+            return self.dot(collapse)
+        raise ValueError("unknown format {}".format(fmt))
+
+    def mermaid(self, collapse=None):
+        """Render the DFD as a Mermaid flowchart."""
+        lines = ["graph LR"]
+        for kind, colour in KIND_COLOURS:
+            lines.append("    classDef {} fill:{},stroke:#333,stroke-width:2px;".format(kind, colour))
+        lines.append("")
+        internal = self._internal_edges()
+        component_index = self.component_index()
+        self._number_nodes(component_index)
+        for boundary_id in self.boundary_ids():
+            if self._collapsed(collapse, boundary_id):
+                lines.append('    {}[["{}"]]'.format(self.node_id(boundary_id), self._mermaid_text(self.boundary_name(boundary_id))))
+            else:
+                lines.append(self._subgraph("mermaid", boundary_id, self._mermaid_subgraph, internal, component_index))
+            lines.append("")
+        for source, dest, name, connection_type in self._cross_edges(collapse):
+            lines.append("    " + self._mermaid_edge(source, dest, name, connection_type, "=="))
+        return "\n".join(lines) + "\n"
+
+    def _mermaid_text(self, text):
+        return text.replace('"', "#quot;")
+
+    def _mermaid_edge(self, source, dest, name, connection_type, line):
+        end = line[0] * 3 if connection_type == ts.PTSDfdEdge.BI_DIRECTIONAL else line + ">"
+        if name:
+            return '{} {} "{}" {} {}'.format(source, line, self._mermaid_text(name), end, dest)
+        return "{} {} {}".format(source, end, dest)
+
+    def _mermaid_subgraph(self, boundary_id, content):
+        node, name, components, edges, notes = content
+        lines = ['    subgraph {}["{}"]'.format(node, self._mermaid_text(name))]
+        for component_node, component_name in components:
+            lines.append('        {}("{}")'.format(component_node, self._mermaid_text(component_name)))
+        for source, dest, edge_name, connection_type in edges:
+            lines.append("        " + self._mermaid_edge(source, dest, edge_name, connection_type, "--"))
+        lines.append("    end")
+        for number, (component_node, kind, threat_id, label) in enumerate(notes):
+            note = "{}_{}_{}".format(component_node, kind, number)
+            lines.append('    {}>"{}"]'.format(note, self._mermaid_text(wrap(label))))
+            lines.append("    class {} {}".format(note, kind))
+            lines.append("    {}-.-{}".format(note, component_node))
+        return "\n".join(lines)
+
+    def dot(self, collapse=None):
+        """Render the DFD as a Graphviz DOT digraph."""
+        lines = ["digraph dfd {", "    rankdir=LR;", "    node [shape=box, style=rounded];", ""]
+        internal = self._internal_edges()
+        component_index = self.component_index()
+        self._number_nodes(component_index)
+        for boundary_id in self.boundary_ids():
+            if self._collapsed(collapse, boundary_id):
+                lines.append('    {} [label="{}", shape=box3d, style=""];'.format(self.node_id(boundary_id), self._dot_text(self.boundary_name(boundary_id))))
+            else:
+                lines.append(self._subgraph("dot", boundary_id, self._dot_subgraph, internal, component_index))
+            lines.append("")
+        for source, dest, name, connection_type in self._cross_edges(collapse):
+            lines.append("    " + self._dot_edge(source, dest, name, connection_type, ["style=bold"]))
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+    def _dot_text(self, text):
+        return text.replace("\\", "\\\\").replace('"', '\\"')
+
+    def _dot_edge(self, source, dest, name, connection_type, attributes):
+        attributes = list(attributes)
+        if name:
+            attributes.insert(0, 'label="{}"'.format(self._dot_text(name)))
+        if connection_type == ts.PTSDfdEdge.BI_DIRECTIONAL:
+            attributes.append("dir=both")
+        if attributes:
+            return "{} -> {} [{}];".format(source, dest, ", ".join(attributes))
+        return "{} -> {};".format(source, dest)
+
+    def _dot_subgraph(self, boundary_id, content):
+        node, name, components, edges, notes = content
+        colours = dict(KIND_COLOURS)
+        lines = ["    subgraph cluster_{} {{".format(node), '        label="{}";'.format(self._dot_text(name))]
+        for component_node, component_name in components:
+            lines.append('        {} [label="{}"];'.format(component_node, self._dot_text(component_name)))
+        for source, dest, edge_name, connection_type in edges:
+            lines.append("        " + self._dot_edge(source, dest, edge_name, connection_type, []))
+        for number, (component_node, kind, threat_id, label) in enumerate(notes):
+            note = "{}_{}_{}".format(component_node, kind, number)
+            lines.append('        {} [label="{}", shape=note, style=filled, fillcolor="{}"];'.format(note, "\\n".join(self._dot_text(line) for line in textwrap.wrap(label, 40)), colours[kind]))
+            lines.append("        {} -> {} [style=dashed, arrowhead=none];".format(note, component_node))
+        lines.append("    }")
+        return "\n".join(lines)
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+"""Sharded intermediate representation output.
+
+A single IR file for a large monorepo makes every consumer load every team's
+elements. PTSShardWriter instead writes a directory with:
+
+    shared.threatspec.json      the boundaries, components, threats and DFD, written once
+    PROJECT.KEY.threatspec.json one shard per project and boundary, or per project and
+                                source directory prefix, holding just those elements,
+                                with projects from the reporter's project map if it has one
+    manifest.json               the shards, with their SHA-256 hashes, element counts and
+                                the range of identifiers in each
+
+Each shard is a valid IR document on its own, with a single project and no shared
+tables, which are referenced through the manifest instead. PTSShardManifest selects
+shards by project, key or identifier, checks their hashes and merges them with the
+shared tables into a single document, so readers can load only the shards they need
+or hand shards to parallel workers.
+
+Copyright (c) 2017 the ThreatSpec contributors
+
+This software may be modified and distributed under the terms
+of the MIT license.  See the LICENSE file for details.
+"""
+
+import hashlib
+import json
+import os
+import re
+
+from . import pythreatspec as ts
+from . import stream
+from .files import open_file
+
+MANIFEST = "manifest.json"
+SHARD_BY = ["boundary", "directory"]
+RANGES = ["boundary", "component", "threat", "element"]
+
+
+class PTSDigestWriter(object):
+    """A file object wrapper that keeps the SHA-256 hash of the text written.
+
+    Attributes:
+        fh: The file object written to.
+        sha256: The hashlib object.
+    """
+
+    def __init__(self, fh):
+        """Initialise the PTSDigestWriter class."""
+        self.fh = fh
+        self.sha256 = hashlib.sha256()
+
+    def write(self, text):
+        """Write text to the file and add it to the hash."""
+        self.fh.write(text)
+        self.sha256.update(text.encode("utf-8"))
+
+    def hexdigest(self):
+        """Return the hash of everything written so far."""
+        return self.sha256.hexdigest()
+
+
+def file_name_part(text):
+    """Return text with anything but letters, digits, dots, underscores and dashes replaced."""
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', text.lstrip('@')).strip('._') or '_'
+
+
+class PTSShardWriter(object):
+    """Writes a reporter's intermediate representation as shards.
+
+    Attributes:
+        reporter: The PyThreatspecReporter to write.
+        directory: The directory to write to. It is created if needed.
+        by: "boundary" for a shard per project and boundary, or "directory" for a shard
+            per project and source directory prefix.
+        depth: The number of directory levels in the prefix when sharding by directory.
+        indent: The number of spaces to indent each level by, or None for compact output.
+        extension: The file name extension of the shards, such as ".threatspec.json.gz".
+    """
+
+    def __init__(self, reporter, directory, by="boundary", depth=1, indent=2, extension=".threatspec.json"):
+        """Initialise the PTSShardWriter class."""
+        if by not in SHARD_BY:
+            raise ValueError("unknown shard type {}".format(by))
+        self.reporter = reporter
+        self.directory = directory
+        self.by = by
+        self.depth = depth
+        self.indent = indent
+        self.extension = extension
+        self._file_names = set()
+
+    def shard_key(self, element):
+        """Return the boundary identifier or directory prefix that places an element in a shard."""
+        if self.by == "boundary":
+            return element.boundary
+        directory = os.path.dirname(element.source.fname) if element.source is not None else ""
+        parts = [part for part in directory.replace(os.sep, "/").split("/") if part not in ("", ".")]
+        return "/".join(parts[:self.depth])
+
+    def write(self):
+        """Write the shared tables, the shards and the manifest.
+
+        Returns:
+            The manifest, as written to manifest.json.
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        reporter = self.reporter
+        document = self._document_member()
+        manifest = {
+            "specification": {"name": "ThreatSpec", "version": "0.1.0"},
+            "document": document,
+            "sharding": {"by": self.by, "depth": self.depth},
+            "shared": self._write_shared(document),
+            "shards": []
+        }
+
+        # Elements are grouped by project and shard first, so that each shard can be written in one go.
+        shards = {}
+        for kind, element_id, element in reporter.parser.iter_elements():
+            shards.setdefault((reporter.project_of(element), self.shard_key(element)), []).append((kind, element_id, element))
+
+        for project, key in (sorted(shards) if reporter.canonical else shards):
+            manifest["shards"].append(self._write_shard(project, key, shards[(project, key)], document))
+
+        with open(os.path.join(self.directory, MANIFEST), "w") as fh:
+            json.dump(manifest, fh, indent=2, separators=stream.SEPARATORS, sort_keys=reporter.canonical)
+        return manifest
+
+    def _document_member(self):
+        if self.reporter.canonical:
+            timestamp = ts.source_date_milli_time(self.reporter.source_date)
+            return {"created": timestamp, "updated": timestamp}
+        parser = self.reporter.parser
+        return {"created": parser.creation_time, "updated": parser.updated_time}
+
+    def _file_name(self, *parts):
+        name = ".".join(file_name_part(part) for part in parts)
+        candidate = name
+        count = 1
+        while candidate in self._file_names:
+            count += 1
+            candidate = "{}.{}".format(name, count)
+        self._file_names.add(candidate)
+        return candidate + self.extension
+
+    def _write(self, file_name, rep):
+        """Write a document and return its hash."""
+        with open_file(os.path.join(self.directory, file_name), "w") as fh:
+            writer = PTSDigestWriter(fh)
+            if self.reporter.canonical:
+                separators = stream.SEPARATORS if self.indent is not None else stream.COMPACT_SEPARATORS
+                json.dump(stream.materialise(rep), writer, indent=self.indent, separators=separators, sort_keys=True)
+            else:
+                stream.PTSJsonWriter(writer, self.indent).write(rep)
+        return writer.hexdigest()
+
+    def _write_shared(self, document):
+        reporter = self.reporter
+        rep = stream.PTSJsonObject([
+            ("specification", {"name": "ThreatSpec", "version": "0.1.0"}),
+            ("document", document),
+            ("boundaries", reporter._properties(reporter.parser.boundaries)),
+            ("components", stream.PTSJsonObject(
+                (boundary_id, reporter._properties(components)) for boundary_id, components in reporter.parser.components.items()
+            )),
+            ("threats", reporter._properties(reporter.parser.threats)),
+            ("dfd", reporter._dfd())
+        ])
+        file_name = self._file_name("shared")
+        return {"file": file_name, "sha256": self._write(file_name, rep)}
+
+    def _write_shard(self, project, key, entries, document):
+        details = dict((kind, {}) for kind in ts.ELEMENT_KINDS)
+        ranges = {}
+        for kind, element_id, element in entries:
+            details[kind].setdefault(element_id, []).append(element.export_to_json())
+            threat = getattr(element, "threat", None)
+            for name, identifier in zip(RANGES, [element.boundary, element.component, threat, element_id]):
+                if identifier is None:
+                    continue
+                bounds = ranges.get(name)
+                if bounds is None:
+                    ranges[name] = [identifier, identifier]
+                else:
+                    bounds[0] = min(bounds[0], identifier)
+                    bounds[1] = max(bounds[1], identifier)
+
+        if self.reporter.canonical:
+            for groups in details.values():
+                for elements in groups.values():
+                    elements.sort(key=ts.canonical_dumps)
+
+        rep = {
+            "specification": {"name": "ThreatSpec", "version": "0.1.0"},
+            "document": document,
+            "projects": {project: details}
+        }
+        file_name = self._file_name(project, key or "root")
+        return {
+            "file": file_name,
+            "project": project,
+            "key": key,
+            "sha256": self._write(file_name, rep),
+            "elements": len(entries),
+            "ranges": ranges
+        }
+
+
+class PTSShardManifest(object):
+    """Reads sharded output through its manifest.
+
+    Attributes:
+        manifest: The manifest.
+        directory: The directory holding the manifest and shards.
+    """
+
+    def __init__(self, manifest, directory):
+        """Initialise the PTSShardManifest class."""
+        self.manifest = manifest
+        self.directory = directory
+
+    @classmethod
+    def from_file(cls, filename):
+        """Load a manifest.json file, or the manifest in a directory."""
+        if os.path.isdir(filename):
+            filename = os.path.join(filename, MANIFEST)
+        with open(filename) as fh:
+            return cls(json.load(fh), os.path.dirname(filename))
+
+    @property
+    def shards(self):
+        """The shard entries of the manifest."""
+        return self.manifest["shards"]
+
+    def select(self, project=None, key=None, boundary=None, component=None, threat=None, element=None):
+        """Return the shards that may hold elements matching all of the given values.
+
+        A shard is only left out if its project or key differ, or an identifier is
+        outside of its range, so the selected shards may still hold no matching elements.
+        """
+        identifiers = {"boundary": boundary, "component": component, "threat": threat, "element": element}
+        selected = []
+        for shard in self.shards:
+            if project is not None and shard["project"] != project:
+                continue
+            if key is not None and shard["key"] != key:
+                continue
+            if any(value is not None and not self._in_range(shard, name, value) for name, value in identifiers.items()):
+                continue
+            selected.append(shard)
+        return selected
+
+    def _in_range(self, shard, name, value):
+        bounds = shard["ranges"].get(name)
+        return bounds is not None and bounds[0] <= value <= bounds[1]
+
+    def load(self, entry, verify=True):
+        """Load the document of a shard or shared entry.
+
+        Args:
+            entry: A shard entry, or the shared entry of the manifest.
+            verify: If True, raise ValueError if the file does not match its hash.
+
+        Returns:
+            The document.
+        """
+        with open_file(os.path.join(self.directory, entry["file"]), "rb") as fh:
+            data = fh.read()
+        if verify and hashlib.sha256(data).hexdigest() != entry["sha256"]:
+            raise ValueError("{} does not match its hash in the manifest".format(entry["file"]))
+        return json.loads(data.decode("utf-8"))
+
+    def document(self, shards=None, verify=True):
+        """Return a single document with the shared tables and the elements of some shards.
+
+        Args:
+            shards: The shard entries to include. Defaults to all of them.
+            verify: If True, check the hash of each file loaded.
+
+        Returns:
+            A document in the same form as PyThreatspecReporter.export_to_json.
+        """
+        rep = self.load(self.manifest["shared"], verify)
+        projects = rep["projects"] = {}
+        for shard in self.shards if shards is None else shards:
+            for project, details in self.load(shard, verify)["projects"].items():
+                merged = projects.setdefault(project, dict((kind, {}) for kind in ts.ELEMENT_KINDS))
+                for kind, groups in details.items():
+                    for element_id, elements in groups.items():
+                        merged.setdefault(kind, {}).setdefault(element_id, []).extend(elements)
+        return rep
@@ -0,0 +1,498 @@
+#!/usr/bin/env python
+"""SQLite storage for threat models.
+
+In-memory dicts and JSON files suit a single project, but a portfolio of hundreds of
+projects is better kept in a database that can answer ad hoc questions, such as all
+acceptances on @data components across every team, without loading everything.
+PTSSqliteStore keeps models in a normalised SQLite schema:
+
+    identifiers   each boundary, component, threat and element identifier, stored once
+    projects      the project names, with their created and updated times
+    boundaries    the boundaries, components and threats, shared by all projects as in
+    components    the IR, keyed on identifier ids
+    threats
+    sources       the source file, line and function of each element and edge
+    elements      one row per mitigation, exposure, acceptance, transfer and review,
+                  with its project, kind, element, boundary, component and threat ids
+    edges         the DFD edges of each project
+
+The elements are indexed by project, threat, component and identifier, and the
+element_details view joins them with their identifiers and sources for hand written
+SQL. Models are added per project from IR documents, files or parsers. Adding a project
+again replaces its elements and edges, and the boundaries, components and threats are
+upserted, so a portfolio database can be kept up to date one project at a time. Each
+project is written with executemany inside a single transaction.
+
+    store = PTSSqliteStore("portfolio.db")
+    store.add_file("payments.threatspec.json")
+    rows = store.select(kind="acceptances", component="@data*")
+
+Copyright (c) 2017 the ThreatSpec contributors
+
+This software may be modified and distributed under the terms
+of the MIT license.  See the LICENSE file for details.
+"""
+
+import json
+import sqlite3
+
+from . import pythreatspec as ts
+from .files import load_document
+from .loader import PTSLoader
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS identifiers (
+    id INTEGER PRIMARY KEY,
+    identifier TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS projects (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    created INTEGER,
+    updated INTEGER
+);
+CREATE TABLE IF NOT EXISTS boundaries (
+    boundary INTEGER PRIMARY KEY,
+    name TEXT,
+    description TEXT
+);
+CREATE TABLE IF NOT EXISTS components (
+    boundary INTEGER NOT NULL,
+    component INTEGER NOT NULL,
+    name TEXT,
+    description TEXT,
+    PRIMARY KEY (boundary, component)
+);
+CREATE TABLE IF NOT EXISTS threats (
+    threat INTEGER PRIMARY KEY,
+    name TEXT,
+    description TEXT,
+    refs TEXT,
+    parent INTEGER
+);
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    project INTEGER NOT NULL,
+    file TEXT,
+    line INTEGER,
+    function TEXT
+);
+CREATE TABLE IF NOT EXISTS elements (
+    id INTEGER PRIMARY KEY,
+    project INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    element INTEGER NOT NULL,
+    boundary INTEGER NOT NULL,
+    component INTEGER NOT NULL,
+    threat INTEGER,
+    text TEXT,
+    refs TEXT,
+    source INTEGER
+);
+CREATE TABLE IF NOT EXISTS edges (
+    id INTEGER PRIMARY KEY,
+    project INTEGER NOT NULL,
+    source_boundary INTEGER NOT NULL,
+    source_component INTEGER NOT NULL,
+    dest_boundary INTEGER NOT NULL,
+    dest_component INTEGER NOT NULL,
+    type TEXT,
+    name TEXT,
+    source INTEGER
+);
+CREATE INDEX IF NOT EXISTS elements_project ON elements (project, kind);
+CREATE INDEX IF NOT EXISTS elements_threat ON elements (threat, kind);
+CREATE INDEX IF NOT EXISTS elements_boundary ON elements (boundary, component, kind);
+CREATE INDEX IF NOT EXISTS elements_component ON elements (component, kind);
+CREATE INDEX IF NOT EXISTS elements_element ON elements (element);
+CREATE INDEX IF NOT EXISTS sources_project ON sources (project);
+CREATE INDEX IF NOT EXISTS sources_file ON sources (file);
+CREATE INDEX IF NOT EXISTS edges_project ON edges (project);
+CREATE INDEX IF NOT EXISTS edges_source ON edges (source_boundary, source_component);
+CREATE INDEX IF NOT EXISTS edges_dest ON edges (dest_boundary, dest_component);
+CREATE VIEW IF NOT EXISTS element_details AS
+    SELECT projects.name AS project, elements.kind AS kind, element_ids.identifier AS element,
+           boundary_ids.identifier AS boundary, component_ids.identifier AS component,
+           threat_ids.identifier AS threat, elements.text AS text, elements.refs AS refs,
+           sources.file AS file, sources.line AS line, sources.function AS function
+    FROM elements
+    JOIN projects ON projects.id = elements.project
+    JOIN identifiers AS element_ids ON element_ids.id = elements.element
+    JOIN identifiers AS boundary_ids ON boundary_ids.id = elements.boundary
+    JOIN identifiers AS component_ids ON component_ids.id = elements.component
+    LEFT JOIN identifiers AS threat_ids ON threat_ids.id = elements.threat
+    LEFT JOIN sources ON sources.id = elements.source;
+"""
+
+COLUMNS = ["project", "kind", "element", "boundary", "component", "threat", "text", "refs", "file", "line", "function"]
+
+# The filters of select, and the elements column each one is matched against.
+FILTERS = {
+    "element": "elements.element",
+    "boundary": "elements.boundary",
+    "component": "elements.component",
+    "threat": "elements.threat"
+}
+
+
+def is_pattern(value):
+    """Return True if a value is a GLOB pattern rather than a single identifier."""
+    return any(character in value for character in "*?[")
+
+
+class PTSSqliteStore(object):
+    """Stores threat models in a SQLite database.
+
+    Attributes:
+        connection: The sqlite3 connection.
+    """
+
+    def __init__(self, filename=":memory:"):
+        """Initialise the PTSSqliteStore class.
+
+        Args:
+            filename: The database file name, which is created if needed. Defaults to an in-memory database.
+        """
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(SCHEMA)
+        self._identifiers = None
+
+    def close(self):
+        """Close the database."""
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _intern(self, identifiers):
+        """Return a dict of identifiers to their ids, adding any new ones in one executemany."""
+        if self._identifiers is None:
+            self._identifiers = dict(self.connection.execute("SELECT identifier, id FROM identifiers"))
+        known = self._identifiers
+        new = []
+        next_id = max(known.values()) + 1 if known else 1
+        for identifier in identifiers:
+            if identifier is not None and identifier not in known:
+                known[identifier] = next_id
+                new.append((next_id, identifier))
+                next_id += 1
+        self.connection.executemany("INSERT INTO identifiers (id, identifier) VALUES (?, ?)", new)
+        return known
+
+    def projects(self):
+        """Return the names of the projects in the store."""
+        return [name for name, in self.connection.execute("SELECT name FROM projects ORDER BY id")]
+
+    def add_document(self, document, projects=None):
+        """Add the projects of an IR document, replacing any already in the store.
+
+        The boundaries, components and threats of the document are added or updated.
+
+        Args:
+            document: A JSON IR document.
+            projects: An optional list of the project names to add. Defaults to all projects.
+
+        Returns:
+            A list of the names of the projects added.
+        """
+        added = []
+        try:
+            with self.connection:
+                self._add_properties(document)
+                times = document.get("document", {})
+                for name, details in document.get("projects", {}).items():
+                    if projects is not None and name not in projects:
+                        continue
+                    self._add_project(name, details, document.get("dfd", {}), times)
+                    added.append(name)
+        except Exception:
+            # The transaction was rolled back, so the cached identifiers may be ahead of the table.
+            self._identifiers = None
+            raise
+        return added
+
+    def add_file(self, filename, projects=None):
+        """Add the projects of a JSON or binary IR file, which may be compressed."""
+        return self.add_document(load_document(filename), projects)
+
+    def add_parser(self, parser, project):
+        """Add the model of a parser as a project, replacing it if it is already in the store."""
+        return self.add_document(ts.PyThreatspecReporter(parser, project).export_to_json())
+
+    def _add_properties(self, document):
+        boundaries = document.get("boundaries", {})
+        components = document.get("components", {})
+        threats = document.get("threats", {})
+        identifiers = set(boundaries) | set(components) | set(threats)
+        for boundary_components in components.values():
+            identifiers.update(boundary_components)
+        identifiers.update(rep.get("parent") for rep in threats.values())
+        ids = self._intern(identifiers)
+
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO boundaries (boundary, name, description) VALUES (?, ?, ?)",
+            ((ids[boundary_id], rep.get("name"), rep.get("description")) for boundary_id, rep in boundaries.items())
+        )
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO components (boundary, component, name, description) VALUES (?, ?, ?, ?)",
+            ((ids[boundary_id], ids[component_id], rep.get("name"), rep.get("description"))
+             for boundary_id, boundary_components in components.items()
+             for component_id, rep in boundary_components.items())
+        )
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO threats (threat, name, description, refs, parent) VALUES (?, ?, ?, ?, ?)",
+            ((ids[threat_id], rep.get("name"), rep.get("description"),
+              json.dumps(rep["references"]) if rep.get("references") else None, ids.get(rep.get("parent")))
+             for threat_id, rep in threats.items())
+        )
+
+    def _add_project(self, name, details, dfd, times):
+        connection = self.connection
+        row = connection.execute("SELECT id FROM projects WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            project_id = connection.execute(
+                "INSERT INTO projects (name, created, updated) VALUES (?, ?, ?)", (name, times.get("created"), times.get("updated"))
+            ).lastrowid
+        else:
+            project_id = row[0]
+            connection.execute("UPDATE projects SET created = ?, updated = ? WHERE id = ?", (times.get("created"), times.get("updated"), project_id))
+            for table in ["elements", "edges", "sources"]:
+                connection.execute("DELETE FROM {} WHERE project = ?".format(table), (project_id,))
+
+        sources = {}
+        source_rows = []
+        next_source = (connection.execute("SELECT MAX(id) FROM sources").fetchone()[0] or 0) + 1
+
+        def source_id(rep):
+            if not rep:
+                return None
+            key = (rep.get("file"), rep.get("line"), rep.get("function"))
+            number = sources.get(key)
+            if number is None:
+                number = sources[key] = next_source + len(source_rows)
+                source_rows.append((number, project_id) + key)
+            return number
+
+        elements = []
+        identifiers = set()
+        for kind in ts.ELEMENT_KINDS:
+            field = ts.ELEMENT_TEXT[kind]
+            for element_id, reps in details.get(kind, {}).items():
+                identifiers.add(element_id)
+                for rep in reps:
+                    identifiers.update((rep["boundary"], rep["component"], rep.get("threat")))
+                    elements.append((kind, element_id, rep, rep.get(field)))
+
+        edges = []
+        for source_boundary_id, source_components in dfd.items():
+            for source_component_id, dest_boundaries in source_components.items():
+                for dest_boundary_id, dest_components in dest_boundaries.items():
+                    for dest_component_id, edge in dest_components.items():
+                        identifiers.update((source_boundary_id, source_component_id, dest_boundary_id, dest_component_id))
+                        edges.append((source_boundary_id, source_component_id, dest_boundary_id, dest_component_id, edge))
+
+        ids = self._intern(identifiers)
+        element_rows = [
+            (project_id, kind, ids[element_id], ids[rep["boundary"]], ids[rep["component"]], ids.get(rep.get("threat")),
+             text, json.dumps(rep["refs"]) if rep.get("refs") else None, source_id(rep.get("source")))
+            for kind, element_id, rep, text in elements
+        ]
+        edge_rows = [
+            (project_id, ids[source_boundary_id], ids[source_component_id], ids[dest_boundary_id], ids[dest_component_id],
+             edge.get("type"), edge.get("name", ""), source_id(edge.get("source")))
+            for source_boundary_id, source_component_id, dest_boundary_id, dest_component_id, edge in edges
+        ]
+
+        connection.executemany("INSERT INTO sources (id, project, file, line, function) VALUES (?, ?, ?, ?, ?)", source_rows)
+        connection.executemany(
+            "INSERT INTO elements (project, kind, element, boundary, component, threat, text, refs, source) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            element_rows
+        )
+        connection.executemany(
+            "INSERT INTO edges (project, source_boundary, source_component, dest_boundary, dest_component, type, name, source) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            edge_rows
+        )
+
+    def remove_project(self, name):
+        """Remove a project's elements and edges. The shared boundaries, components and threats are kept."""
+        with self.connection:
+            row = self.connection.execute("SELECT id FROM projects WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                raise KeyError(name)
+            for table in ["elements", "edges", "sources"]:
+                self.connection.execute("DELETE FROM {} WHERE project = ?".format(table), row)
+            self.connection.execute("DELETE FROM projects WHERE id = ?", row)
+
+    def _identifier_ids(self, value):
+        """Return the ids of the identifiers equal to, or matching the GLOB pattern in, value."""
+        if is_pattern(value):
+            return [identifier_id for identifier_id, in self.connection.execute("SELECT id FROM identifiers WHERE identifier GLOB ?", (value,))]
+        return [identifier_id for identifier_id, in self.connection.execute("SELECT id FROM identifiers WHERE identifier = ?", (value,))]
+
+    def _where(self, kind=None, project=None, file=None, **identifiers):
+        """Return the WHERE clause and parameters for the filters of select."""
+        clauses = []
+        parameters = []
+        if kind is not None:
+            if kind not in ts.ELEMENT_KINDS:
+                raise ValueError("unknown element kind {}".format(kind))
+            clauses.append("elements.kind = ?")
+            parameters.append(kind)
+        if project is not None:
+            clauses.append("projects.name GLOB ?" if is_pattern(project) else "projects.name = ?")
+            parameters.append(project)
+        if file is not None:
+            clauses.append("sources.file GLOB ?" if is_pattern(file) else "sources.file = ?")
+            parameters.append(file)
+        for name, value in identifiers.items():
+            if name not in FILTERS:
+                raise ValueError("unknown filter {}".format(name))
+            if value is None:
+                continue
+            ids = self._identifier_ids(value)
+            clauses.append("{} IN ({})".format(FILTERS[name], ", ".join("?" * len(ids))) if ids else "0")
+            parameters.extend(ids)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), parameters
+
+    _FROM = """
+        FROM elements
+        JOIN projects ON projects.id = elements.project
+        JOIN identifiers AS element_ids ON element_ids.id = elements.element
+        JOIN identifiers AS boundary_ids ON boundary_ids.id = elements.boundary
+        JOIN identifiers AS component_ids ON component_ids.id = elements.component
+        LEFT JOIN identifiers AS threat_ids ON threat_ids.id = elements.threat
+        LEFT JOIN sources ON sources.id = elements.source
+    """
+
+    _SELECT_COLUMNS = {
+        "project": "projects.name",
+        "kind": "elements.kind",
+        "element": "element_ids.identifier",
+        "boundary": "boundary_ids.identifier",
+        "component": "component_ids.identifier",
+        "threat": "threat_ids.identifier",
+        "text": "elements.text",
+        "refs": "elements.refs",
+        "file": "sources.file",
+        "line": "sources.line",
+        "function": "sources.function"
+    }
+
+    def select(self, kind=None, project=None, file=None, element=None, boundary=None, component=None, threat=None):
+        """Return the elements matching all of the given values.
+
+        Identifiers, project names and file names may be GLOB patterns, such as "@data*".
+
+        Returns:
+            A list of dicts with a member for each of COLUMNS, in the order the elements were added.
+        """
+        where, parameters = self._where(kind, project, file, element=element, boundary=boundary, component=component, threat=threat)
+        sql = "SELECT {}{}{} ORDER BY elements.id".format(", ".join(self._SELECT_COLUMNS[column] for column in COLUMNS), self._FROM, where)
+        return [dict(zip(COLUMNS, row)) for row in self.connection.execute(sql, parameters)]
+
+    def count_by(self, column, kind=None, project=None, file=None, element=None, boundary=None, component=None, threat=None):
+        """Count the elements matching all of the given values by one of COLUMNS.
+
+        Returns:
+            A list of (value, count) tuples, largest first.
+        """
+        if column not in self._SELECT_COLUMNS:
+            raise ValueError("unknown column {}".format(column))
+        where, parameters = self._where(kind, project, file, element=element, boundary=boundary, component=component, threat=threat)
+        sql = "SELECT {0}, COUNT(*) AS total{1}{2} GROUP BY {0} ORDER BY total DESC, {0}".format(self._SELECT_COLUMNS[column], self._FROM, where)
+        return list(self.connection.execute(sql, parameters))
+
+    def execute(self, sql, parameters=()):
+        """Run a SQL query and return the column names and rows."""
+        cursor = self.connection.execute(sql, parameters)
+        return [description[0] for description in cursor.description or []], cursor.fetchall()
+
+    def document(self, projects=None):
+        """Return the IR document of some projects.
+
+        Args:
+            projects: An optional list of project names. Defaults to all projects.
+
+        Returns:
+            A document in the same form as PyThreatspecReporter.export_to_json, with all
+            boundaries, components and threats, and the DFD edges and elements of the projects.
+        """
+        connection = self.connection
+        names = dict((identifier_id, identifier) for identifier, identifier_id in connection.execute("SELECT identifier, id FROM identifiers"))
+        project_rows = [row for row in connection.execute("SELECT id, name, created, updated FROM projects ORDER BY id")
+                        if projects is None or row[1] in projects]
+
+        rep = {
+            "specification": {"name": "ThreatSpec", "version": "0.1.0"},
+            "document": {},
+            "boundaries": {},
+            "components": {},
+            "threats": {},
+            "dfd": {},
+            "projects": {}
+        }
+        created = [row[2] for row in project_rows if row[2] is not None]
+        updated = [row[3] for row in project_rows if row[3] is not None]
+        if created:
+            rep["document"]["created"] = min(created)
+        if updated:
+            rep["document"]["updated"] = max(updated)
+
+        for boundary, name, description in connection.execute("SELECT boundary, name, description FROM boundaries"):
+            rep["boundaries"][names[boundary]] = property_rep(name, description)
+        for boundary, component, name, description in connection.execute("SELECT boundary, component, name, description FROM components"):
+            rep["components"].setdefault(names[boundary], {})[names[component]] = property_rep(name, description)
+        for threat, name, description, refs, parent in connection.execute("SELECT threat, name, description, refs, parent FROM threats"):
+            threat_rep = property_rep(name, description)
+            if refs:
+                threat_rep["references"] = json.loads(refs)
+            if parent is not None:
+                threat_rep["parent"] = names[parent]
+            rep["threats"][names[threat]] = threat_rep
+
+        project_ids = [row[0] for row in project_rows]
+        sources = {}
+        for project_id in project_ids:
+            for source_id, fname, line, function in connection.execute("SELECT id, file, line, function FROM sources WHERE project = ?", (project_id,)):
+                sources[source_id] = {"file": fname, "line": line, "function": function}
+
+        for project_id in project_ids:
+            query = "SELECT source_boundary, source_component, dest_boundary, dest_component, type, name, source FROM edges WHERE project = ? ORDER BY id"
+            for source_boundary, source_component, dest_boundary, dest_component, edge_type, name, source in connection.execute(query, (project_id,)):
+                edges = rep["dfd"].setdefault(names[source_boundary], {}).setdefault(names[source_component], {}).setdefault(names[dest_boundary], {})
+                if names[dest_component] not in edges:
+                    edges[names[dest_component]] = {"type": edge_type, "name": name, "source": sources.get(source, {})}
+
+        for project_id, project_name, created, updated in project_rows:
+            details = rep["projects"][project_name] = dict((kind, {}) for kind in ts.ELEMENT_KINDS)
+            query = "SELECT kind, element, boundary, component, threat, text, refs, source FROM elements WHERE project = ? ORDER BY id"
+            for kind, element, boundary, component, threat, text, refs, source in connection.execute(query, (project_id,)):
+                element_rep = {"boundary": names[boundary], "component": names[component]}
+                if kind != "reviews":
+                    element_rep["threat"] = names[threat]
+                element_rep[ts.ELEMENT_TEXT[kind]] = text
+                element_rep["refs"] = json.loads(refs) if refs else []
+                element_rep["source"] = sources.get(source, {})
+                details[kind].setdefault(names[element], []).append(element_rep)
+        return rep
+
+    def parser(self, projects=None, parser=None, project_map=None):
+        """Return a PyThreatspecParser loaded with some projects, as by PTSLoader.
+
+        The elements of each project are assigned to it in project_map, if one is given,
+        for writing them back out with PyThreatspecReporter.
+        """
+        loader = PTSLoader(parser, project_map)
+        loader.add(self.document(projects))
+        return loader.load()
+
+
+def property_rep(name, description):
+    """Return the JSON representation of a boundary, component or threat as in PTSProperty.inner_rep."""
+    rep = {"name": name}
+    if description:
+        rep["description"] = description
+    return rep
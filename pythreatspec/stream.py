@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""Streaming JSON output.
+
+The intermediate representation of a large model can be several times the size of the
+parser's own structures once it has been built up as nested dicts. The classes here let
+a document be described lazily instead: PTSJsonObject and PTSJsonArray wrap iterables
+of members, which are only produced as PTSJsonWriter reaches them. The writer encodes
+each small value as it is produced and writes the output in chunks, so the extra memory
+needed is bounded by the chunk size and the largest single value, rather than the size
+of the document.
+
+The output is exactly what json.dump(document, fh, indent=indent, separators=(',', ': '))
+writes for the equivalent nested dicts, or with an indent of None what
+json.dump(document, fh, separators=(',', ':')) writes, and materialise returns those
+dicts when they are needed.
+
+Copyright (c) 2017 the ThreatSpec contributors
+
+This software may be modified and distributed under the terms
+of the MIT license.  See the LICENSE file for details.
+"""
+
+import json
+
+SEPARATORS = (',', ': ')
+COMPACT_SEPARATORS = (',', ':')
+
+
+class PTSJsonObject(object):
+    """A JSON object whose members are produced lazily.
+
+    Attributes:
+        items: An iterable of (key, value) pairs. Values can themselves be lazy.
+    """
+
+    __slots__ = ("items",)
+
+    def __init__(self, items):
+        """Initialise the PTSJsonObject class."""
+        self.items = items
+
+
+class PTSJsonArray(object):
+    """A JSON array whose values are produced lazily.
+
+    Attributes:
+        values: An iterable of values. Values can themselves be lazy.
+    """
+
+    __slots__ = ("values",)
+
+    def __init__(self, values):
+        """Initialise the PTSJsonArray class."""
+        self.values = values
+
+
+def materialise(value):
+    """Return the plain dicts and lists for a value that may contain lazy objects and arrays."""
+    if isinstance(value, PTSJsonObject):
+        rep = {}
+        for key, member in value.items:
+            rep[key] = materialise(member)
+        return rep
+    elif isinstance(value, PTSJsonArray):
+        return [materialise(member) for member in value.values]
+    return value
+
+
+class PTSJsonWriter(object):
+    """Writes a JSON document, which may contain lazy objects and arrays, to a file.
+
+    Attributes:
+        fh: The file object written to.
+        indent: The number of spaces to indent each level by, or None for compact output
+            without any whitespace.
+        chunk_size: The number of characters buffered before each write to fh.
+    """
+
+    def __init__(self, fh, indent=2, chunk_size=65536):
+        """Initialise the PTSJsonWriter class."""
+        self.fh = fh
+        self.indent = indent
+        self.separators = SEPARATORS if indent is not None else COMPACT_SEPARATORS
+        self.chunk_size = chunk_size
+        self._chunks = []
+        self._size = 0
+
+    def write(self, value):
+        """Write a complete document and flush it to the file."""
+        self._value(value, 0)
+        self.flush()
+
+    def flush(self):
+        """Write any buffered output to the file."""
+        if self._chunks:
+            self.fh.write("".join(self._chunks))
+            self._chunks = []
+            self._size = 0
+
+    def _emit(self, text):
+        self._chunks.append(text)
+        self._size += len(text)
+        if self._size >= self.chunk_size:
+            self.flush()
+
+    def _value(self, value, level):
+        if isinstance(value, PTSJsonObject):
+            self._container(value.items, level, "{", "}", True)
+        elif isinstance(value, PTSJsonArray):
+            self._container(value.values, level, "[", "]", False)
+        else:
+            text = json.dumps(value, indent=self.indent, separators=self.separators)
+            if level and self.indent is not None:
+                # Newlines within strings are escaped, so these are all line breaks between members.
+                text = text.replace("\n", "\n" + " " * (self.indent * level))
+            self._emit(text)
+
+    def _container(self, members, level, start, end, keyed):
+        if self.indent is None:
+            separator = closing = ""
+        else:
+            separator = "\n" + " " * (self.indent * (level + 1))
+            closing = "\n" + " " * (self.indent * level)
+        empty = True
+        for member in members:
+            self._emit((start if empty else ",") + separator)
+            empty = False
+            if keyed:
+                key, member = member
+                self._emit(json.dumps(key) + self.separators[1])
+            self._value(member, level + 1)
+        if empty:
+            self._emit(start + end)
+        else:
+            self._emit(closing + end)
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+"""Record the data flows observed between tagged components at runtime.
+
+@connects tags are written by hand and drift from what the code actually does.
+PTSTracer installs a profile function, for example during staging test runs, and
+counts the calls from functions tagged with one component to functions tagged with
+another. The observed flows can then be added to the DFD as edges, in the same way as
+PTSCallGraph adds the static ones.
+
+    tracer = PTSTracer(parser, sample=10)
+    with tracer:
+        run_load_test()
+    tracer.merge()
+
+The overhead is kept low in a few ways. Where sys.monitoring is available, PY_START
+events are used instead of a profile function, and are turned off for each untagged
+code object the first time it runs, so untagged calls cost nothing after that.
+Otherwise the code objects of tagged functions are looked up in a dict built up front
+from the parser's sources, and every other code object is remembered as untagged the
+first time it is seen, so most calls cost one dict lookup. The caller is only looked for, by walking back up to max_depth frames to
+the nearest tagged function, when a tagged function is called, and with sample set to
+N only one in N of those calls is recorded. Counts are kept in a fixed-size, open
+addressed table of arrays, so memory does not grow with the length of the run. Pairs
+that do not fit are counted in dropped rather than growing the table.
+
+Copyright (c) 2017 the ThreatSpec contributors
+
+This software may be modified and distributed under the terms
+of the MIT license.  See the LICENSE file for details.
+"""
+
+import dis
+import os
+import sys
+import threading
+from array import array
+
+from . import pythreatspec as ts
+
+MAX_PROBES = 8
+
+MONITORING = getattr(sys, "monitoring", None)
+
+
+def _thread_profile():
+    """Return the profile function set for threads started afterwards."""
+    getprofile = getattr(threading, "getprofile", None)
+    return getprofile() if getprofile else threading._profile_hook
+
+
+class PTSTracer(object):
+    """Counts calls between tagged functions using a profile function.
+
+    Attributes:
+        parser: The PyThreatspecParser whose elements tag functions with components and whose DFD is extended.
+        functions: A list of (PTSSource, list of (boundary, component) tuples) for each tagged function.
+        sample: Record one in this many calls of tagged functions.
+        max_depth: The number of frames searched for a tagged caller.
+        keys: Array of the (caller, callee) pair stored in each slot of the counter table, or 0 if empty.
+        counts: Array of the calls recorded in each slot of the counter table.
+        dropped: The number of calls not recorded because the counter table was full.
+    """
+
+    def __init__(self, parser, sample=1, size=65536, max_depth=8):
+        """Initialise the PTSTracer class.
+
+        Args:
+            parser: A PyThreatspecParser that has parsed the traced code.
+            sample: Record one in this many calls of tagged functions.
+            size: The number of slots in the counter table.
+            max_depth: The number of frames searched for a tagged caller.
+        """
+        if sample < 1 or size < 1:
+            raise ValueError("sample and size must be positive")
+        self.parser = parser
+        self.sample = sample
+        self.max_depth = max_depth
+        self.functions = []
+        self.keys = array('l', [0] * size)
+        self.counts = array('l', [0] * size)
+        self.dropped = 0
+        self._locations = {}
+        self._names = {}
+        self._function_locations()
+        self._codes = {}
+        self._ticks = [0]
+        self._previous = None
+
+    def _function_locations(self):
+        """Index the tagged functions by (absolute file name, line number) and by (absolute file name, name)."""
+        for kind, element_id, element in self.parser.iter_elements():
+            source = element.source
+            if source is None or not source.lineno:
+                continue
+            fname = os.path.realpath(os.path.splitext(source.fname)[0] + '.py')
+            location = (fname, source.lineno)
+            index = self._locations.get(location)
+            if index is None:
+                index = self._locations[location] = len(self.functions)
+                self.functions.append((source, []))
+                self._names.setdefault((fname, source.function), []).append((source.lineno, index))
+            component = (element.boundary, element.component)
+            if component not in self.functions[index][1]:
+                self.functions[index][1].append(component)
+
+    def function_index(self, code):
+        """Return the index of the tagged function for a code object, or -1 if it is not tagged.
+
+        The parser gives the line of the def statement, while co_firstlineno is the line of
+        the first decorator, so a decorated function is matched by its name and a def
+        line between its first decorator and its body.
+        """
+        index = self._codes.get(code)
+        if index is None:
+            fname = os.path.realpath(code.co_filename)
+            index = self._locations.get((fname, code.co_firstlineno), -1)
+            if index < 0 and (fname, code.co_name) in self._names:
+                body = min([lineno for offset, lineno in dis.findlinestarts(code)
+                            if lineno is not None and lineno > code.co_firstlineno] or [code.co_firstlineno])
+                for lineno, candidate in self._names[(fname, code.co_name)]:
+                    if code.co_firstlineno <= lineno <= body:
+                        index = candidate
+                        break
+            self._codes[code] = index
+        return index
+
+    def record(self, caller, callee, calls=1):
+        """Add to the count of calls from one tagged function to another."""
+        size = len(self.keys)
+        key = caller * len(self.functions) + callee + 1
+        slot = key % size
+        for probe in range(min(MAX_PROBES, size)):
+            if self.keys[slot] == key or self.keys[slot] == 0:
+                self.keys[slot] = key
+                self.counts[slot] += calls
+                return
+            slot = (slot + 1) % size
+        self.dropped += calls
+
+    def _profiler(self):
+        """Return the profile function and the sys.monitoring PY_START callback, with the state they need bound as locals."""
+        codes = self._codes
+        function_index = self.function_index
+        record = self.record
+        ticks = self._ticks
+        sample = self.sample
+        max_depth = self.max_depth
+        disable = MONITORING.DISABLE if MONITORING else None
+
+        def called(callee, frame):
+            ticks[0] += 1
+            if ticks[0] % sample:
+                return
+            caller_frame = frame.f_back
+            depth = 0
+            while caller_frame is not None and depth < max_depth:
+                caller = codes.get(caller_frame.f_code)
+                if caller is None:
+                    caller = function_index(caller_frame.f_code)
+                if caller >= 0:
+                    record(caller, callee, sample)
+                    return
+                caller_frame = caller_frame.f_back
+                depth += 1
+
+        def profile(frame, event, arg):
+            if event != "call":
+                return
+            callee = codes.get(frame.f_code)
+            if callee is None:
+                callee = function_index(frame.f_code)
+            if callee >= 0:
+                called(callee, frame)
+
+        def py_start(code, offset):
+            callee = codes.get(code)
+            if callee is None:
+                callee = function_index(code)
+            if callee < 0:
+                return disable
+            called(callee, sys._getframe(1))
+
+        return profile, py_start
+
+    def start(self):
+        """Start recording calls in the current thread and in threads started afterwards.
+
+        sys.monitoring is used when it is available and its profiler tool is free,
+        otherwise a profile function is installed.
+        """
+        profile, py_start = self._profiler()
+        tool = MONITORING.PROFILER_ID if MONITORING else None
+        if MONITORING and MONITORING.get_tool(tool) is None:
+            MONITORING.use_tool_id(tool, "pythreatspec")
+            MONITORING.register_callback(tool, MONITORING.events.PY_START, py_start)
+            MONITORING.set_events(tool, MONITORING.events.PY_START)
+            MONITORING.restart_events()
+            self._previous = tool
+            return
+        self._previous = (sys.getprofile(), _thread_profile())
+        threading.setprofile(profile)
+        sys.setprofile(profile)
+
+    def stop(self):
+        """Stop recording calls, restoring any profile functions set before start."""
+        if self._previous is None:
+            return
+        if isinstance(self._previous, tuple):
+            sys.setprofile(self._previous[0])
+            threading.setprofile(self._previous[1])
+        else:
+            MONITORING.set_events(self._previous, 0)
+            MONITORING.register_callback(self._previous, MONITORING.events.PY_START, None)
+            MONITORING.free_tool_id(self._previous)
+        self._previous = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def calls(self):
+        """Return the recorded calls as a list of (caller index, callee index, count) tuples."""
+        calls = []
+        for slot, key in enumerate(self.keys):
+            if key:
+                caller, callee = divmod(key - 1, len(self.functions))
+                calls.append((caller, callee, self.counts[slot]))
+        return sorted(calls)
+
+    def component_edges(self):
+        """Return the observed calls between components.
+
+        Returns:
+            A list of (source component, destination component, count, caller source) tuples,
+            where caller source is the PTSSource of the first calling function found.
+        """
+        edges = {}
+        order = []
+        for caller, callee, count in self.calls():
+            caller_source, sources = self.functions[caller]
+            dests = self.functions[callee][1]
+            for source in sources:
+                for dest in dests:
+                    if source == dest:
+                        continue
+                    key = (source, dest)
+                    if key in edges:
+                        edges[key][2] += count
+                    else:
+                        edges[key] = [source, dest, count, caller_source]
+                        order.append(key)
+        return [tuple(edges[key]) for key in order]
+
+    def merge(self, name="observed"):
+        """Add an edge to the parser's DFD for each pair of components seen calling each other.
+
+        Returns:
+            The number of edges added.
+        """
+        dfd = self.parser.dfd
+        before = len(dfd.edges)
+        for source, dest, count, caller_source in self.component_edges():
+            self.parser.add_edge(ts.PTSDfdEdge(
+                source[0], source[1], dest[0], dest[1],
+                ts.PTSDfdEdge.UNI_DIRECTIONAL,
+                name,
+                self.parser.new_source(caller_source.fname, caller_source.lineno, caller_source.function)
+            ))
+        return len(dfd.edges) - before
+
+    def export_to_json(self):
+        """Return a JSON representation of the observed calls between components."""
+        return [
+            {"source": "{}:{}".format(*source), "destination": "{}:{}".format(*dest), "count": count}
+            for source, dest, count, caller_source in self.component_edges()
+        ]
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import logging
+from cli.log import LoggingApp
+from pythreatspec import pythreatspec as ts
+from pythreatspec.render import PTSDfdRenderer, FORMATS
+from pythreatspec.files import load_document
+
+class RenderDfdApp(LoggingApp):
+    def main(self):
+        self.log.level = logging.INFO
+
+        documents = []
+        for filename in self.params.files:
+            self.log.info("Loading file {}".format(filename))
+            documents.append(load_document(filename))
+
+        cache = {}
+        if self.params.cache and os.path.exists(self.params.cache):
+            with open(self.params.cache) as fh:
+                cache = json.load(fh)
+
+        collapse = self.params.collapse
+        if collapse and "all" in collapse:
+            collapse = True
+
+        # Canonical documents carry a content digest, so an unchanged diagram need not be rebuilt at all.
+        digests = [document.get("document", {}).get("digest") for document in documents]
+        key = None
+        if all(digests):
+            key = "{}:{}".format(self.params.format, ts.canonical_dumps([digests, self.params.elements, collapse]))
+        cached = cache.get("document")
+        if key is not None and cached is not None and cached[0] == key:
+            self.log.info("Documents are unchanged, using the cached DFD")
+            diagram = cached[1]
+        else:
+            renderer = PTSDfdRenderer.from_json(documents, self.params.elements, cache)
+            diagram = renderer.render(self.params.format, collapse)
+            cache = renderer.cache
+            if key is not None:
+                cache["document"] = [key, diagram]
+
+        if self.params.out:
+            self.log.info("Writing {} DFD to {}".format(self.params.format, self.params.out))
+            with open(self.params.out, "w") as fh:
+                fh.write(diagram)
+        else:
+            sys.stdout.write(diagram)
+
+        if self.params.cache:
+            with open(self.params.cache, "w") as fh:
+                json.dump(cache, fh)
+
+if __name__ == "__main__":
+    app = RenderDfdApp(
+        name="render_dfd.py",
+        description="ThreatSpec DFD renderer. Draw the data flow diagram as Mermaid or Graphviz DOT.",
+        message_format = '%(asctime)s %(levelname)s: %(message)s',
+        stream=sys.stderr
+    )
+    app.add_param("-f", "--format", default="mermaid", choices=FORMATS, help="output format (default: mermaid)")
+    app.add_param("-o", "--out", default=None, help="output file (default: stdout)")
+    app.add_param("-e", "--elements", action="store_true", help="draw the exposures, mitigations etc. of each component")
+    app.add_param("-c", "--collapse", default=None, action="append", help="draw this boundary as a single node, or all to collapse every boundary")
+    app.add_param("--cache", default=None, help="keep rendered boundaries in this file, to only redraw those that changed")
+    app.add_param("files", action="append", help="threatspec json files to draw, including any libraries they use")
+    app.run()
@@ -1,31 +1,27 @@
 #!/usr/bin/env python
 
 import sys
-import json
 import logging
 from cli.log import LoggingApp
 from pprint import pprint
+from pythreatspec.loader import load_parser
 
 class SfpReportApp(LoggingApp):
     def main(self):
         self.log.level = logging.INFO
 
-        data = {}
-
-        for filename in self.params.files:
-            with open(filename) as fh:
-                data.update(json.load(fh))
+        parser = load_parser(self.params.files, sections=["threats"])
 
         sfp_map = {}
-        for threat_id, threat in data["threats"].items():
-            if "parent" in threat:
-                if threat["parent"] not in sfp_map:
-                    sfp_map[threat["parent"]] = {}
-                sfp_map[threat["parent"]][threat_id] = threat
+        for threat_id, threat in parser.threats.items():
+            if threat.parent is not None:
+                if threat.parent not in sfp_map:
+                    sfp_map[threat.parent] = {}
+                sfp_map[threat.parent][threat_id] = threat
 
         for threat_id, threat in sfp_map["@sfp"].items():
             print(threat_id)
-            for subthreat_id, subthreat in threat.items():
+            for subthreat_id, subthreat in sfp_map.get(threat_id, {}).items():
                 print(("  %s" % subthreat_id))
 
 
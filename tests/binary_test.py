@@ -0,0 +1,112 @@
+import io
+import json
+import os
+import tempfile
+
+from nose.tools import *
+from pythreatspec.pythreatspec import *
+from pythreatspec.binary import *
+from pythreatspec import binary
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+TAGS = [
+    "@alias boundary @web to Web",
+    "@alias threat @xss to Cross-site scripting",
+    "@describe threat @xss as cross-site scripting",
+    "@exposes @web:@server to @xss with raw \"templates\"",
+    "@mitigates @web:@server against @xss with output encoding",
+    "@accepts @sqli to @db:@mysql with legacy schema",
+    "@review @db:@mysql check the grants",
+    "@connects @web:@server to @db:@mysql as SQL",
+]
+
+
+def document():
+    parser = PyThreatspecParser()
+    for lineno, tag in enumerate(TAGS, 1):
+        parser._parse_comment(tag, parser.new_source("app.py", lineno, "handler"))
+    return PyThreatspecReporter(parser, "default").export_to_json()
+
+
+def encode(doc):
+    fh = io.BytesIO()
+    binary.dump(doc, fh)
+    return fh.getvalue()
+
+
+def roundtrip(doc):
+    return binary.load(io.BytesIO(encode(doc)))
+
+
+class TestBinaryRoundTrip:
+    def test_reporter_document(self):
+        doc = document()
+        assert roundtrip(doc) == doc
+
+    def test_libraries(self):
+        for filename in ["sfp_library.threatspec.json", "examples/simple_web.threatspec.json"]:
+            with open(os.path.join(ROOT, filename)) as fh:
+                doc = json.load(fh)
+            assert roundtrip(doc) == doc
+
+    def test_irregular_members(self):
+        doc = {
+            "specification": {"name": "ThreatSpec", "version": "0.1.0"},
+            "threats": {"@t": {"name": None, "references": [1], "custom": {"x": 1}}},
+            "components": {"@empty": {}},
+            "dfd": {"@a": {"@b": {}}, "@c": {"@d": {"@e": {"@f": {"type": "uni", "source": {"file": "f", "line": 1 << 40, "function": "g"}}}}}},
+            "projects": {
+                "p": {"mitigations": {"@m": []}, "reviews": {"@r": [{"review": "text", "extra": True}]}, "notes": "kept"},
+                "q": {}
+            }
+        }
+        assert roundtrip(doc) == doc
+
+    def test_strings_stored_once(self):
+        doc = document()
+        data = encode(doc)
+        assert data.count(b"@server") == 1
+
+    @raises(ValueError)
+    def test_invalid_document(self):
+        encode({"threats": []})
+
+
+class TestPTSBinaryReader:
+    def setup(self):
+        self.doc = document()
+        self.doc["projects"]["other"] = {"mitigations": {}, "exposures": {}, "transfers": {}, "acceptances": {}, "reviews": {}}
+        self.reader = PTSBinaryReader(encode(self.doc))
+
+    def test_collections(self):
+        assert self.reader.threats() == self.doc["threats"]
+        assert self.reader.components() == self.doc["components"]
+        assert self.reader.dfd() == self.doc["dfd"]
+        assert self.reader.meta()["specification"] == self.doc["specification"]
+
+    def test_project(self):
+        assert self.reader.projects() == ["default", "other"]
+        assert self.reader.project("default") == self.doc["projects"]["default"]
+
+    def test_iter_elements(self):
+        elements = list(self.reader.iter_elements("default", ["reviews"]))
+        assert elements == [("reviews", "@check_the_grants", self.doc["projects"]["default"]["reviews"]["@check_the_grants"][0])]
+
+    def test_memory_mapped(self):
+        fd, filename = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                binary.dump(self.doc, fh)
+            with PTSBinaryReader.open(filename) as reader:
+                assert reader.document() == self.doc
+        finally:
+            os.remove(filename)
+
+    @raises(ValueError)
+    def test_not_binary(self):
+        PTSBinaryReader(b"{\"specification\": {}}")
+
+    def test_is_binary(self):
+        assert is_binary(encode(self.doc))
+        assert not is_binary(b"{}")
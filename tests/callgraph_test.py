@@ -0,0 +1,125 @@
+import ast
+import textwrap
+
+from nose.tools import *
+from pythreatspec.pythreatspec import *
+from pythreatspec.callgraph import *
+
+MODULES = {
+    "app/__init__.py": """
+        from .db import query
+    """,
+    "app/db.py": """
+        def query(sql):
+            '''@exposes @db:@mysql to @sqli with raw queries'''
+            return run(sql)
+
+        def run(sql):
+            return sql
+    """,
+    "app/views.py": """
+        import app
+        from . import db as database
+        from app.auth import Session
+
+        class Handler(object):
+            '''@mitigates @web:@server against @xss with templates'''
+
+            def get(self):
+                self.render()
+                return database.query("select")
+
+            def render(self):
+                def helper():
+                    return app.query("update")
+                Session()
+                return helper()
+
+        def unrelated():
+            return len([]) + unknown.call()
+    """,
+    "app/auth.py": """
+        class Session(object):
+            def __init__(self):
+                '''@mitigates @auth:@sessions against @fixation with rotation'''
+                self.user = None
+    """,
+}
+
+
+def build(modules):
+    parser = PyThreatspecParser()
+    callgraph = PTSCallGraph(parser)
+    for filename in sorted(modules):
+        module = ast.parse(textwrap.dedent(modules[filename]))
+        parser._parse_globals(module, filename)
+        parser._parse_classes(module, filename)
+        parser._parse_functions(module, filename)
+        callgraph.add_file(filename, module)
+    return parser, callgraph
+
+
+class TestModuleName:
+    def test_module_name(self):
+        assert module_name("app/db.py") == "app.db"
+        assert module_name("./app/db/__init__.py") == "app.db"
+        assert module_name("main.py") == "main"
+
+
+class TestPTSCallGraph:
+    def setup(self):
+        self.parser, self.callgraph = build(MODULES)
+
+    def test_definitions(self):
+        assert "app.views.Handler.get" in self.callgraph.functions
+        assert "app.views.Handler.render.helper" in self.callgraph.functions
+        assert "app.auth.Session" in self.callgraph.classes
+        assert self.callgraph.imports["app.views"]["database"] == "app.db"
+        assert self.callgraph.imports["app"]["query"] == "app.db.query"
+
+    def test_resolve(self):
+        resolve = self.callgraph.resolve
+        assert resolve("app.views.Handler.get", "self.render") == "app.views.Handler.render"
+        assert resolve("app.views.Handler.get", "database.query") == "app.db.query"
+        assert resolve("app.views.Handler.render", "helper") == "app.views.Handler.render.helper"
+        assert resolve("app.views.Handler.render", "Session") == "app.auth.Session.__init__"
+        assert resolve("app.views.Handler.render.helper", "app.query") == "app.db.query"
+        assert resolve("app.db.query", "run") == "app.db.run"
+        assert resolve("app.views.unrelated", "len") is None
+        assert resolve("app.views.unrelated", "unknown.call") is None
+
+    def test_resolve_memoized(self):
+        self.callgraph.resolve("app.views.Handler.get", "database.query")
+        assert self.callgraph._resolved[("app.views", "database.query")] == "app.db.query"
+
+    def test_function_components(self):
+        components = self.callgraph.function_components()
+        assert components["app.db.query"] == [("@db", "@mysql")]
+        assert components["app.views.Handler.get"] == [("@web", "@server")]
+        assert components["app.auth.Session.__init__"] == [("@auth", "@sessions")]
+        assert "app.db.run" not in components
+        assert "app.views.Handler.render.helper" not in components
+
+    def test_component_edges(self):
+        edges = sorted((e[0], e[1], e[3]) for e in self.callgraph.component_edges())
+        assert edges == [
+            (("@web", "@server"), ("@auth", "@sessions"), "app.auth.Session.__init__"),
+            (("@web", "@server"), ("@db", "@mysql"), "app.db.query"),
+        ]
+
+    def test_merge(self):
+        assert self.callgraph.merge() == 2
+        assert self.parser.dfd.edges_between("@web", "@server", "@db", "@mysql")[0].source.export_to_json() == {
+            "file": "app/views.py", "line": 11, "function": "get"
+        }
+        assert "@db" in self.parser.dfd.tree["@web"]["@server"]
+        assert self.callgraph.merge() == 0
+
+    def test_export_to_json(self):
+        assert {"source": "app.db.query", "destination": "app.db.run"} in self.callgraph.export_to_json()
+
+    def test_unresolved_later_file(self):
+        parser, callgraph = build({"a.py": "def f():\n    import b\n    return b.g()\n"})
+        assert list(callgraph.iter_calls()) == []
+        callgraph.add_file("b.py", ast.parse("def g():\n    return 1\n"))
+        assert list(callgraph.iter_calls()) == [("a.f", "b.g", 3)]
@@ -0,0 +1,85 @@
+from nose.tools import *
+import json
+import sys
+from pythreatspec.pythreatspec import *
+from pythreatspec.columnar import *
+
+TAGS = [
+    "@mitigates @web:@server against xss with output encoding",
+    "@exposes @web:@server to @xss with raw templates",
+    "@exposes @web:@server to sqli with string concatenation",
+    "@mitigates @db:@mysql against sqli with output encoding",
+    "@accepts sqli to @db:@mysql with legacy schema",
+    "@transfers @xss to @external:@browser with content security policy",
+    "@review @web:@server check the session handling",
+]
+
+
+def parse(parser):
+    for lineno, tag in enumerate(TAGS, 1):
+        parser._parse_comment(tag, parser.new_source("app.py", lineno, "handler"))
+    return parser
+
+
+class TestPTSColumnarStore:
+    def setup(self):
+        self.parser = parse(PTSColumnarStore.new_parser())
+        self.store = self.parser.store
+
+    def test_new_parser(self):
+        assert self.store.symbols is self.parser.symbols
+        assert self.store.source_table is self.parser.source_table
+        assert len(self.store) == len(TAGS)
+        assert self.parser.mitigations == {}
+        assert self.parser.index is None
+        assert self.parser.listeners == []
+
+    def test_export_matches_default_storage(self):
+        parser = parse(PyThreatspecParser())
+        parser.creation_time = self.parser.creation_time = 0
+        parser.updated_time = self.parser.updated_time = 0
+        expected = json.dumps(PyThreatspecReporter(parser, "project").export_to_json())
+        export = json.dumps(PyThreatspecReporter(self.parser, "project").export_to_json())
+        assert export == expected
+
+    def test_iter_elements(self):
+        parser = parse(PyThreatspecParser())
+        expected = [(kind, element_id, element.export_to_json()) for kind, element_id, element in parser.iter_elements()]
+        elements = [(kind, element_id, element.export_to_json()) for kind, element_id, element in self.parser.iter_elements()]
+        # The parser's dicts are only ordered on Python 3.7 and later.
+        if sys.version_info >= (3, 7):
+            assert elements == expected
+        key = lambda entry: json.dumps(entry, sort_keys=True)
+        assert sorted(elements, key=key) == sorted(expected, key=key)
+
+    def test_element(self):
+        element = self.store.element(0)
+        assert isinstance(element, PTSMitigation)
+        assert element.threat == "@xss"
+        assert element.mitigation == "output encoding"
+        assert str(element.source) == "app.py@1"
+
+    def test_select(self):
+        assert self.store.select(kind="exposures") == [1, 2]
+        assert self.store.select(boundary="@web", component="@server") == [0, 1, 2, 6]
+        assert self.store.select(kind="mitigations", threat="@sqli") == [3]
+        assert self.store.select(threat="@unknown") == []
+
+    def test_count_by(self):
+        assert self.store.count_by("kind") == {"mitigations": 2, "exposures": 2, "acceptances": 1, "transfers": 1, "reviews": 1}
+        assert self.store.count_by("threat", self.store.select(kind="exposures")) == {"@xss": 1, "@sqli": 1}
+
+    def test_refs_and_foreign_source(self):
+        store = PTSColumnarStore()
+        element = PTSExposure("@web", "@server", "@xss", "raw templates", ["CWE-79"])
+        element.source = PTSSource("other.py", 5, "view")
+        row = store.add_element("exposures", "@raw_templates", element)
+        assert store.element(row).refs == ["CWE-79"]
+        assert store.element(row).source.table is store.source_table
+        assert store.export_to_json()["exposures"]["@raw_templates"][0] == element.export_to_json()
+
+    @raises(ValueError)
+    def test_export_no_source(self):
+        store = PTSColumnarStore()
+        store.add_element("exposures", "@raw_templates", PTSExposure("@web", "@server", "@xss", "raw templates"))
+        store.export_to_json()
@@ -0,0 +1,84 @@
+from nose.tools import *
+from pythreatspec.pythreatspec import *
+from pythreatspec.coverage import *
+
+TAGS = [
+    "@exposes @web:@server to @xss with raw templates",
+    "@exposes @web:@server to sqli with string concatenation",
+    "@mitigates @web:@server against sqli with prepared statements",
+    "@exposes @db:@mysql to sqli with stored procedures",
+    "@accepts sqli to @db:@mysql with legacy schema",
+    "@exposes @web:@client to @xss with inline scripts",
+    "@transfers @xss to @web:@client with content security policy",
+    "@review @db:@mysql check the grants",
+]
+
+
+def parse(tags):
+    parser = PyThreatspecParser()
+    for lineno, tag in enumerate(tags, 1):
+        parser._parse_comment(tag, parser.new_source("app.py", lineno, "handler"))
+    return parser
+
+
+class TestCoverageStatus:
+    def test_coverage_status(self):
+        assert coverage_status(EXPOSED) == "unmitigated"
+        assert coverage_status(EXPOSED | ACCEPTED) == "accepted"
+        assert coverage_status(EXPOSED | ACCEPTED | TRANSFERRED) == "transferred"
+        assert coverage_status(EXPOSED | TRANSFERRED | MITIGATED) == "mitigated"
+        assert coverage_status(MITIGATED) == "mitigated"
+
+
+class TestPTSCoverage:
+    def setup(self):
+        self.parser = parse(TAGS)
+        self.coverage = PTSCoverage.from_parser(self.parser)
+
+    def test_status(self):
+        assert self.coverage.status("@web", "@server", "@xss") == "unmitigated"
+        assert self.coverage.status("@web", "@server", "@sqli") == "mitigated"
+        assert self.coverage.status("@db", "@mysql", "@sqli") == "accepted"
+        assert self.coverage.status("@web", "@client", "@xss") == "transferred"
+        assert self.coverage.status("@db", "@mysql", "@xss") is None
+
+    def test_unmitigated(self):
+        assert self.coverage.unmitigated() == [("@web", "@server", "@xss")]
+
+    def test_incremental(self):
+        self.parser._parse_comment("@mitigates @web:@server against @xss with output encoding", PTSSource())
+        assert self.coverage.unmitigated() == []
+        assert self.coverage.status("@web", "@server", "@xss") == "mitigated"
+
+    def test_summary(self):
+        assert self.coverage.summary() == {
+            "total": 4,
+            "exposed": 4,
+            "unexposed": 0,
+            "unmitigated": 1,
+            "mitigated": 1,
+            "accepted": 1,
+            "transferred": 1
+        }
+
+    def test_summary_unexposed(self):
+        self.parser._parse_comment("@mitigates @db:@mysql against @xss with escaping", PTSSource())
+        summary = self.coverage.summary()
+        assert (summary["total"], summary["exposed"], summary["unexposed"]) == (5, 4, 1)
+        assert summary["mitigated"] == 1
+
+    def test_export_to_json(self):
+        rep = self.coverage.export_to_json()
+        assert rep["coverage"]["@db"]["@mysql"]["@sqli"] == "accepted"
+        assert rep["unmitigated"] == {
+            "@web": {"@server": {"@xss": [
+                {"exposure": "raw templates", "source": {"file": "app.py", "line": 1, "function": "handler"}}
+            ]}}
+        }
+
+    def test_from_json(self):
+        self.parser.creation_time = self.parser.updated_time = 0
+        data = PyThreatspecReporter(self.parser, "project").export_to_json()
+        coverage = PTSCoverage.from_json(data)
+        assert coverage.export_to_json() == self.coverage.export_to_json()
+        assert PTSCoverage.from_json(data, projects=["other"]).flags == {}
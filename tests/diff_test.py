@@ -0,0 +1,78 @@
+from nose.tools import *
+from pythreatspec.pythreatspec import *
+from pythreatspec.diff import *
+
+OLD = [
+    "@alias threat @xss to Cross-site scripting",
+    "@exposes @web:@server to @xss with raw templates",
+    "@mitigates @web:@server against @xss with output encoding",
+    "@connects @web:@server to @db:@mysql as SQL",
+    "@review @db:@mysql check the grants",
+]
+
+NEW = [
+    "@alias threat @xss to XSS",
+    "@alias threat @sqli to SQL injection",
+    "@exposes @web:@server to @xss with raw templates",
+    "@exposes @db:@mysql to @sqli with string queries",
+    "@connects @web:@server to @db:@mysql as SQL",
+    "@review @db:@mysql check the grants",
+]
+
+
+def export(tags, offset=0, fname="app.py"):
+    parser = PyThreatspecParser()
+    for lineno, tag in enumerate(tags, 1 + offset):
+        parser._parse_comment(tag, parser.new_source(fname, lineno, "handler"))
+    return PyThreatspecReporter(parser, "default").export_to_json()
+
+
+class TestPTSDiff:
+    def test_same(self):
+        diff = PTSDiff(export(OLD), export(OLD))
+        assert not diff
+        assert diff.summary() == []
+
+    def test_added_and_removed(self):
+        diff = PTSDiff(export(OLD), export(NEW), ignore_lines=True)
+        assert diff
+        assert diff.added["threats"] == [("@sqli",)]
+        assert diff.changed["threats"] == [(("@xss",), ("Cross-site scripting", None), ("XSS", None))]
+        assert diff.added["elements"] == [("exposures", "@db", "@mysql", "@sqli", "string queries", None, None)]
+        assert diff.removed["elements"] == [("mitigations", "@web", "@server", "@xss", "output encoding", None, None)]
+        assert diff.added["dfd"] == diff.removed["dfd"] == []
+        assert diff.counts()["elements"] == {"added": 1, "removed": 1, "changed": 0}
+
+    def test_lines(self):
+        diff = PTSDiff(export(OLD), export(OLD, 10))
+        assert len(diff.added["elements"]) == len(diff.removed["elements"]) == 3
+        assert not PTSDiff(export(OLD), export(OLD, 10), ignore_lines=True)
+
+    def test_moved_file(self):
+        diff = PTSDiff(export(OLD), export(OLD, fname="web.py"))
+        assert diff.added["elements"][0][5:] == ("web.py", 2)
+        assert diff.removed["elements"][0][5:] == ("app.py", 2)
+        assert not PTSDiff(export(OLD), export(OLD, 10, "web.py"), ignore_lines=True)
+
+    def test_dfd(self):
+        diff = PTSDiff(export(OLD), export(OLD[:3] + ["@connects @web:@server to @db:@mysql as HTTP"]), ignore_lines=True)
+        assert diff.added["dfd"] == [("@web", "@server", "@db", "@mysql", "uni", "HTTP")]
+        assert diff.removed["dfd"] == [("@web", "@server", "@db", "@mysql", "uni", "SQL")]
+
+    def test_duplicates(self):
+        diff = PTSDiff(export(OLD), export(OLD + OLD[1:2]), ignore_lines=True)
+        assert diff.added["elements"] == [("exposures", "@web", "@server", "@xss", "raw templates", None, None)]
+
+    def test_summary(self):
+        lines = PTSDiff(export(OLD), export(NEW), ignore_lines=True).summary()
+        assert "+ threats @sqli" in lines
+        assert "~ threats @xss 'Cross-site scripting' -> 'XSS'" in lines
+        assert "- elements mitigations @web:@server against @xss 'output encoding'" in lines
+        assert "- elements mitigations @web:@server against @xss 'output encoding' at app.py:3" in PTSDiff(export(OLD), export(NEW)).summary()
+
+    def test_export_to_json(self):
+        rep = PTSDiff(export(OLD), export(NEW)).export_to_json()
+        assert rep["added"]["threats"] == [{"threat": "@sqli"}]
+        assert rep["changed"]["threats"][0]["new"] == {"name": "XSS", "description": None}
+        assert rep["removed"]["elements"][-1]["kind"] == "reviews"
+        assert rep["removed"]["elements"][-1]["threat"] is None
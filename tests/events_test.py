@@ -0,0 +1,104 @@
+import json
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from nose.tools import *
+from pythreatspec.pythreatspec import *
+from pythreatspec.columnar import PTSColumnarStore
+from pythreatspec.events import *
+
+TAGS = [
+    "@alias boundary @web to Web",
+    "@alias threat @xss to Cross-site scripting",
+    "@exposes @web:@server to @xss with raw \"templates\"",
+    "@describe threat @xss as cross-site scripting",
+    "@mitigates @web:@server against @xss with output encoding",
+    "@mitigates @db:@mysql against @sqli with prepared statements",
+    "@accepts @sqli to @db:@mysql with legacy schema",
+    "@transfers @sqli to @db:@mysql with the DBA",
+    "@review @db:@mysql check the grants",
+    "@connects @web:@server to @db:@mysql as SQL",
+    "@connects @web:@server to @db:@mysql as SQL",
+    "@connects @external:@user with @web:@server",
+]
+
+
+def parse(parser, tags):
+    for lineno, tag in enumerate(tags, 1):
+        parser._parse_comment(tag, parser.new_source("app.py", lineno, "handler"))
+    return parser
+
+
+def records(fh):
+    return [json.loads(line) for line in fh.getvalue().splitlines()]
+
+
+class TestPTSEventWriter:
+    def setup(self):
+        self.fh = StringIO()
+        self.parser = PyThreatspecParser()
+        PTSEventWriter(self.fh, "default").attach(self.parser)
+
+    def test_records_as_found(self):
+        self.parser._parse_comment("@mitigates Web:Server against XSS with output encoding", self.parser.new_source("app.py", 3, "handler"))
+        assert [record["event"] for record in records(self.fh)] == ["document", "boundary", "component", "threat", "element"]
+        element = records(self.fh)[-1]
+        assert element["kind"] == "mitigations"
+        assert element["id"] == "@output_encoding"
+        assert element["source"] == {"file": "app.py", "line": 3, "function": "handler"}
+
+    def test_one_record_per_line(self):
+        parse(self.parser, TAGS)
+        lines = self.fh.getvalue().splitlines()
+        assert json.loads(lines[0])["event"] == "document"
+        assert all(json.loads(line)["event"] for line in lines)
+
+    def test_duplicate_edges_written_once(self):
+        parse(self.parser, TAGS)
+        assert len([record for record in records(self.fh) if record["event"] == "edge"]) == 2
+
+    def test_describe(self):
+        parse(self.parser, TAGS)
+        threats = [record for record in records(self.fh) if record["event"] == "threat" and record["id"] == "@xss"]
+        assert "description" not in threats[0]
+        assert threats[-1]["description"] == "cross-site scripting"
+
+    def test_attach_existing(self):
+        parser = parse(PyThreatspecParser(), TAGS)
+        fh = StringIO()
+        PTSEventWriter(fh, "default").attach(parser)
+        assert len([record for record in records(fh) if record["event"] == "element"]) == 6
+
+
+class TestLoadEvents:
+    def check(self, parser):
+        fh = StringIO()
+        PTSEventWriter(fh, "events").attach(parser)
+        parse(parser, TAGS)
+        fh.seek(0)
+        loaded, project = load_events(fh)
+        assert project == "events"
+        assert loaded.creation_time == parser.creation_time
+        expected = PyThreatspecReporter(parser, "events").export_to_json()
+        actual = PyThreatspecReporter(loaded, "events").export_to_json()
+        del expected["document"], actual["document"]
+        assert actual == expected
+        return loaded
+
+    def test_default_storage(self):
+        loaded = self.check(PyThreatspecParser())
+        assert len(loaded.index.threat("@sqli")) == 3
+
+    def test_columnar_storage(self):
+        self.check(PTSColumnarStore.new_parser())
+
+    def test_blank_lines(self):
+        parser, project = load_events(StringIO('\n{"event": "boundary", "id": "@web", "name": "Web"}\n\n'))
+        assert project is None
+        assert parser.boundaries["@web"].name == "Web"
+
+    @raises(ValueError)
+    def test_unknown_event(self):
+        load_events(StringIO('{"event": "unknown"}\n'))
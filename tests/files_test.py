@@ -0,0 +1,68 @@
+import json
+import os
+import shutil
+import tempfile
+
+from nose.tools import *
+from pythreatspec.pythreatspec import *
+from pythreatspec.files import *
+from pythreatspec import binary
+from pythreatspec import files
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+LIBRARY = os.path.join(ROOT, "examples", "simple_web.threatspec.json")
+
+
+class TestFiles:
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        with open(LIBRARY) as fh:
+            self.document = json.load(fh)
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_compressor(self):
+        assert compressor("a.threatspec.json") is None
+        assert compressor("a.threatspec.json.gz") is not None
+        assert compressor("a.threatspec.json.gz") is not compressor("a.threatspec.json.bz2")
+
+    def test_xz(self):
+        if files.lzma is not None:
+            assert compressor("a.threatspec.json.xz") is files.lzma
+            return
+        try:
+            compressor("a.threatspec.json.xz")
+        except ValueError as e:
+            assert "lzma" in str(e)
+        else:
+            assert False
+
+    def test_round_trip(self):
+        names = ["ir.json", "ir.json.gz", "ir.json.bz2"] + (["ir.json.xz"] if files.lzma is not None else [])
+        for name in names:
+            with open_file(self.path(name), "w") as fh:
+                json.dump(self.document, fh)
+            assert load_document(self.path(name)) == self.document
+
+    def test_compressed(self):
+        with open_file(self.path("ir.json.gz"), "w") as fh:
+            json.dump(self.document, fh, indent=2)
+        assert os.path.getsize(self.path("ir.json.gz")) < os.path.getsize(LIBRARY) / 3
+        with open(self.path("ir.json.gz"), "rb") as fh:
+            assert fh.read(2) == b"\x1f\x8b"
+
+    def test_detected_from_contents(self):
+        with open_file(self.path("ir.json.bz2"), "w") as fh:
+            json.dump(self.document, fh)
+        os.rename(self.path("ir.json.bz2"), self.path("ir.json"))
+        with open_file(self.path("ir.json")) as fh:
+            assert json.load(fh) == self.document
+
+    def test_binary(self):
+        with open_file(self.path("ir.bin.bz2"), "wb") as fh:
+            binary.dump(self.document, fh)
+        assert load_document(self.path("ir.bin.bz2")) == self.document
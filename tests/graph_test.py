@@ -0,0 +1,92 @@
+from nose.tools import *
+from pythreatspec.pythreatspec import *
+from pythreatspec.coverage import *
+from pythreatspec.graph import *
+
+TAGS = [
+    "@connects @external:@user to @web:@server as HTTPS",
+    "@connects @web:@server to @web:@app as WSGI",
+    "@connects @web:@app with @db:@mysql as SQL",
+    "@connects @db:@backup to @db:@mysql as replication",
+    "@connects @web:@app to @web:@server as responses",
+    "@exposes @db:@mysql to @sqli with string concatenation",
+    "@exposes @web:@server to @xss with raw templates",
+    "@mitigates @web:@server against @xss with output encoding",
+]
+
+
+def parse(tags):
+    parser = PyThreatspecParser()
+    for lineno, tag in enumerate(tags, 1):
+        parser._parse_comment(tag, parser.new_source("app.py", lineno, "handler"))
+    return parser
+
+
+class TestPTSDfdAnalysis:
+    def setup(self):
+        self.parser = parse(TAGS)
+        self.analysis = PTSDfdAnalysis(self.parser.dfd, PTSCoverage.from_parser(self.parser))
+
+    def test_reachable_from(self):
+        assert self.analysis.reachable_from("@external") == [
+            ("@web", "@server"), ("@web", "@app"), ("@db", "@mysql")
+        ]
+        assert self.analysis.reachable_from("@unknown") == []
+
+    def test_bidirectional(self):
+        assert ("@web", "@app") in self.analysis.reachable_from("@db")
+        assert ("@db", "@backup") not in self.analysis.reachable_from("@web")
+
+    def test_shortest_path(self):
+        path = self.analysis.shortest_path(("@external", "@user"), ("@db", "@mysql"))
+        assert [edge.name for edge in path] == ["HTTPS", "WSGI", "SQL"]
+        assert self.analysis.shortest_path(("@web", "@server"), ("@external", "@user")) is None
+        assert self.analysis.shortest_path(("@web", "@server"), ("@web", "@server")) == []
+
+    @raises(ValueError)
+    def test_shortest_path_unknown(self):
+        self.analysis.shortest_path(("@external", "@user"), ("@nowhere", "@nothing"))
+
+    def test_boundary_crossings(self):
+        assert [edge.name for edge in self.analysis.boundary_crossings()] == ["HTTPS", "SQL"]
+
+    def test_can_reach(self):
+        assert self.analysis.can_reach(("@external", "@user"), ("@db", "@mysql"))
+        assert self.analysis.can_reach(("@db", "@mysql"), ("@web", "@server"))
+        assert self.analysis.can_reach(("@web", "@server"), ("@web", "@server"))
+        assert not self.analysis.can_reach(("@web", "@server"), ("@external", "@user"))
+        assert not self.analysis.can_reach(("@db", "@mysql"), ("@db", "@backup"))
+
+    def test_reachability_matches_bfs(self):
+        reach = self.analysis.reachability()
+        for node_id in range(len(self.parser.dfd.nodes)):
+            bits = sum(1 << n for n in self.analysis._bfs([node_id]))
+            assert reach[node_id] == bits
+
+    def test_reachability_recomputed(self):
+        assert not self.analysis.can_reach(("@db", "@mysql"), ("@external", "@user"))
+        self.parser._parse_connects("@connects @db:@mysql to @external:@user as email", PTSSource())
+        assert self.analysis.can_reach(("@db", "@mysql"), ("@external", "@user"))
+
+    def test_attack_paths(self):
+        paths = self.analysis.attack_paths("@external")
+        assert [path["target"] for path in paths] == [("@web", "@server"), ("@web", "@app"), ("@db", "@mysql")]
+        hops = paths[2]["hops"]
+        assert [(hop["from"], hop["to"]) for hop in hops] == [
+            (("@external", "@user"), ("@web", "@server")),
+            (("@web", "@server"), ("@web", "@app")),
+            (("@web", "@app"), ("@db", "@mysql")),
+        ]
+        assert [hop["unmitigated"] for hop in hops] == [[], [], ["@sqli"]]
+
+    def test_without_coverage(self):
+        analysis = PTSDfdAnalysis(self.parser.dfd)
+        assert analysis.unmitigated_exposures(("@db", "@mysql")) == []
+        assert self.analysis.unmitigated_exposures(("@db", "@mysql")) == ["@sqli"]
+
+    def test_export_to_json(self):
+        rep = self.analysis.export_to_json()
+        assert rep[0] == {
+            "target": "@web:@server",
+            "hops": [{"from": "@external:@user", "to": "@web:@server", "name": "HTTPS", "type": "uni", "unmitigated": []}]
+        }
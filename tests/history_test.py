@@ -0,0 +1,73 @@
+import os
+import shutil
+import subprocess
+import tempfile
+
+from nose.tools import *
+from pythreatspec.history import *
+
+COMMITS = [
+    (DAY, {"web.py": "# @exposes @web:@server to @xss with raw templates\n", "README": "@connects somewhere\n"}),
+    (DAY + 60, {"db.py": "# @exposes @db:@mysql to @sqli with string queries\n"}),
+    (3 * DAY, {"web.py": "# @exposes @web:@server to @xss with raw templates\n# @mitigates @web:@server against @xss with output encoding\n"}),
+    (4 * DAY, {"db.py": None, "copy.py": "# @exposes @web:@server to @xss with raw templates\n"}),
+]
+
+
+class TestPTSHistory:
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        self.git("init", "-q")
+        for timestamp, files in COMMITS:
+            for name, text in files.items():
+                if text is None:
+                    self.git("rm", "-q", name)
+                    continue
+                with open(os.path.join(self.directory, name), "w") as fh:
+                    fh.write(text)
+                self.git("add", name)
+            self.git("commit", "-q", "-m", "change", date="@{} +0000".format(timestamp))
+        self.repository = PTSGitRepository(self.directory)
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def git(self, *args, **kwargs):
+        env = dict(os.environ, GIT_AUTHOR_NAME="test", GIT_AUTHOR_EMAIL="test@example.com",
+                   GIT_COMMITTER_NAME="test", GIT_COMMITTER_EMAIL="test@example.com")
+        if "date" in kwargs:
+            env["GIT_AUTHOR_DATE"] = env["GIT_COMMITTER_DATE"] = kwargs["date"]
+        subprocess.check_call(["git", "-C", self.directory] + list(args), env=env)
+
+    def test_revisions(self):
+        revisions = self.repository.revisions()
+        assert [timestamp for revision, timestamp in revisions] == [DAY, DAY + 60, 3 * DAY, 4 * DAY]
+        assert [timestamp for revision, timestamp in sample(revisions, DAY)] == [DAY + 60, 3 * DAY, 4 * DAY]
+
+    def test_run(self):
+        series = PTSHistory(self.repository).run(self.repository.revisions())
+        assert len(series) == 4
+        assert series.column("exposures") == [1, 2, 2, 2]
+        assert series.column("mitigations") == [0, 0, 1, 1]
+        assert series.column("unmitigated") == [1, 2, 1, 0]
+        assert series.column("files") == [2, 3, 3, 3]
+        assert series.column("errors") == [1, 1, 1, 1]
+
+    def test_mixed_case_tags(self):
+        with open(os.path.join(self.directory, "api.py"), "w") as fh:
+            fh.write("# @Exposes @api:@handler to @xss with raw templates\n# @EXPOSES nothing\n")
+        self.git("add", "api.py")
+        self.git("commit", "-q", "-m", "change", date="@{} +0000".format(5 * DAY))
+        series = PTSHistory(self.repository).run(self.repository.revisions())
+        assert series.column("exposures")[-1] == 3
+        assert series.column("errors")[-1] == 2
+
+    def test_shared_blobs(self):
+        PTSHistory(self.repository).run(self.repository.revisions())
+        # README, web.py twice and db.py. copy.py has the same contents as the first web.py.
+        assert self.repository.blobs_read == 4
+
+    def test_include(self):
+        series = PTSHistory(self.repository, ["web.py"]).run(self.repository.revisions(), WEEK)
+        assert series.export_to_json()["rows"][0][COLUMNS.index("files")] == 1
+        assert len(series) == 1
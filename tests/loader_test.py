@@ -0,0 +1,133 @@
+import json
+import os
+import shutil
+import tempfile
+
+from nose.tools import *
+from pythreatspec.pythreatspec import *
+from pythreatspec.loader import *
+from pythreatspec import binary
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+TAGS = [
+    "@alias boundary @web to Web",
+    "@alias component @web:@server to Server",
+    "@alias threat @xss to Cross-site scripting",
+    "@describe threat @xss as cross-site scripting",
+    "@exposes @web:@server to @xss with raw templates",
+    "@mitigates @web:@server against @xss with output encoding",
+    "@accepts @sqli to @db:@mysql with legacy schema",
+    "@transfers @sqli to @db:@mysql with the DBA",
+    "@review @db:@mysql check the grants",
+    "@connects @web:@server to @db:@mysql as SQL",
+]
+
+
+def parse(tags, fname="app.py"):
+    parser = PyThreatspecParser()
+    for lineno, tag in enumerate(tags, 1):
+        parser._parse_comment(tag, parser.new_source(fname, lineno, "handler"))
+    return parser
+
+
+def export(parser, project="default"):
+    return PyThreatspecReporter(parser, project).export_to_json()
+
+
+class TestPTSLoader:
+    def setup(self):
+        self.document = export(parse(TAGS))
+
+    def test_round_trip(self):
+        loader = PTSLoader()
+        loader.add(self.document)
+        parser = loader.load()
+        assert loader.projects == ["default"]
+        assert export(parser) == self.document
+
+    def test_parser_state(self):
+        loader = PTSLoader()
+        loader.add(self.document)
+        parser = loader.load()
+        element = parser.mitigations["@output_encoding"][0]
+        assert isinstance(element.source, PTSSource)
+        assert element.source.table is parser.source_table
+        assert str(element.source) == "app.py@6"
+        assert parser.threats["@xss"].desc == "cross-site scripting"
+        assert len(parser.index.threat("@sqli")) == 2
+        assert parser.dfd.edges_between("@web", "@server", "@db", "@mysql")[0].name == "SQL"
+
+    def test_lazy_sections(self):
+        loader = PTSLoader()
+        loader.add(self.document)
+        parser = loader.load(["threats"])
+        assert "@xss" in parser.threats
+        assert parser.boundaries == {}
+        assert parser.mitigations == {}
+        assert loader.pending() == ["boundaries", "components", "dfd", "projects"]
+        loader.load()
+        assert "@output_encoding" in parser.mitigations
+        assert loader.pending() == []
+
+    def test_merge_and_parse_more(self):
+        loader = PTSLoader()
+        loader.add(self.document)
+        loader.add(export(parse(["@mitigates @db:@mysql against @sqli with prepared statements"], "db.py"), "db"))
+        parser = loader.load()
+        parser._parse_comment("@exposes @web:@server to @xss with raw templates", parser.new_source("new.py", 1, "handler"))
+        assert loader.projects == ["default", "db"]
+        assert len(parser.exposures["@raw_templates"]) == 2
+        assert "@prepared_statements" in parser.mitigations
+
+    def test_projects(self):
+        loader = PTSLoader()
+        loader.add(self.document, ["other"])
+        parser = loader.load()
+        assert parser.mitigations == {}
+        assert "@web" in parser.boundaries
+
+    def test_multiple_projects(self):
+        document = export(parse(TAGS[:6]), "web")
+        document["projects"].update(export(parse(TAGS[6:]), "db")["projects"])
+        document["projects"]["empty"] = dict((kind, {}) for kind in ELEMENT_KINDS)
+        loader = PTSLoader()
+        loader.add(document)
+        parser = loader.load()
+        assert loader.project_map.projects == ["web", "db", "empty"]
+        assert PyThreatspecReporter(parser, "default", project_map=loader.project_map).export_to_json()["projects"] == document["projects"]
+
+    def test_times(self):
+        first = dict(self.document, document={"created": 5, "updated": 10})
+        second = dict(self.document, document={"created": 3, "updated": 7})
+        loader = PTSLoader()
+        loader.add(first)
+        loader.add(second)
+        assert (loader.parser.creation_time, loader.parser.updated_time) == (3, 10)
+
+    @raises(ValueError)
+    def test_unknown_section(self):
+        PTSLoader().load(["unknown"])
+
+
+class TestLoadParser:
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def test_files(self):
+        document = export(parse(TAGS))
+        json_file = os.path.join(self.directory, "ir.threatspec.json")
+        binary_file = os.path.join(self.directory, "ir.threatspec.bin")
+        with open(json_file, "w") as fh:
+            json.dump(document, fh)
+        with open(binary_file, "wb") as fh:
+            binary.dump(document, fh)
+        assert export(load_parser([json_file])) == document
+        assert export(load_parser([binary_file])) == document
+
+    def test_library(self):
+        parser = load_parser([os.path.join(ROOT, "sfp_library.threatspec.json")], sections=["threats"])
+        assert parser.threats["@unrestricted_consumption"].parent == "@resource_management"
@@ -0,0 +1,161 @@
+from nose.tools import *
+import io
+import json
+from pythreatspec.lsp import *
+
+LIBRARY = """
+// @alias boundary @web to Web
+// @alias component @web:@server to Web Server
+// @alias threat @xss to Cross-site Scripting
+"""
+
+CODE = """
+def handler():
+    # @mitigates @web:@server against @xss with output encoding
+    # @exposes @web:@srver to @xss with raw templates
+    pass
+"""
+
+class TestPTSDocumentParser:
+    def test_parse_text_definitions(self):
+        parser = PTSDocumentParser("file:///library.go")
+        parser.parse_text(LIBRARY)
+        assert ("boundary", "@web", "Web", 2) in parser.definitions
+        assert ("component", ("@web", "@server"), "Web Server", 3) in parser.definitions
+        assert ("threat", "@xss", "Cross-site Scripting", 4) in parser.definitions
+        assert parser.diagnostics == []
+
+    def test_parse_text_mixed_case(self):
+        parser = PTSDocumentParser("file:///code.py")
+        parser.parse_text("# @Exposes Web:Server to XSS with x\n")
+        assert parser.diagnostics == []
+        assert ("threat", "@xss", "XSS", 1) in parser.definitions
+
+    def test_parse_text_diagnostics(self):
+        parser = PTSDocumentParser("file:///bad.go")
+        parser.parse_text("x = 1\n// @describe boundary @nothing as nothing\n")
+        assert len(parser.diagnostics) == 1
+        assert parser.diagnostics[0][0] == 2
+        assert parser.diagnostics[0][1] == SEVERITY_ERROR
+        assert "unknown boundary identifier @nothing" in parser.diagnostics[0][2]
+
+
+class TestPTSWorkspace:
+    def setup(self):
+        self.workspace = PTSWorkspace()
+        self.workspace.update("file:///library.go", LIBRARY)
+        self.workspace.update("file:///code.py", CODE)
+
+    def test_diagnostics_unknown_identifier(self):
+        diagnostics = self.workspace.diagnostics("file:///code.py")
+        assert diagnostics == [(4, SEVERITY_WARNING, "unknown component identifier @web:@srver")]
+
+    def test_describe_uses_other_documents(self):
+        self.workspace.update("file:///describe.py", "# @describe threat @xss as script injection\n")
+        assert self.workspace.diagnostics("file:///describe.py") == []
+
+    def test_update_replaces_symbols(self):
+        self.workspace.update("file:///library.go", "// @alias boundary @web to Web\n")
+        assert "@xss" not in self.workspace.symbols["threat"]
+        assert ("@web", "@server") not in self.workspace.symbols["component"]
+        assert self.workspace.symbols["boundary"]["@web"] == [("file:///library.go", 1, "Web")]
+
+    def test_remove(self):
+        self.workspace.remove("file:///library.go")
+        assert self.workspace.symbols["boundary"] == {}
+        assert "file:///library.go" not in self.workspace.documents
+
+    def test_remove_keeps_shared_definitions(self):
+        self.workspace.update("file:///other.go", "// @alias boundary @web to Web\n")
+        assert ("boundary", "@web", "Web", 1) in self.workspace.documents["file:///other.go"].definitions
+        self.workspace.remove("file:///library.go")
+        assert self.workspace.symbols["boundary"]["@web"] == [("file:///other.go", 1, "Web")]
+        assert self.workspace.diagnostics("file:///other.go") == []
+
+    def test_complete_identifiers(self):
+        assert self.workspace.complete("# @exposes @w") == [("@web", "boundary", "Web")]
+        assert self.workspace.complete("# @exposes @web:@server to @x") == [("@xss", "threat", "Cross-site Scripting")]
+
+    def test_complete_components(self):
+        assert self.workspace.complete("# @exposes @web:@s") == [("@server", "component", "Web Server")]
+
+    def test_definition(self):
+        line = "    # @mitigates @web:@server against @xss with output encoding"
+        assert self.workspace.definition(line, line.index("@web") + 1) == [("file:///library.go", 2)]
+        assert self.workspace.definition(line, line.index("@server") + 1) == [("file:///library.go", 3)]
+        assert self.workspace.definition(line, line.index("@xss") + 1) == [("file:///library.go", 4)]
+        assert self.workspace.definition(line, 0) == []
+
+
+def frame(message):
+    body = json.dumps(message).encode("utf-8")
+    return "Content-Length: {}\r\n\r\n".format(len(body)).encode("ascii") + body
+
+
+def unframe(data):
+    messages = []
+    while data:
+        header, _, data = data.partition(b"\r\n\r\n")
+        length = int(header.decode("ascii").split(":")[1])
+        messages.append(json.loads(data[:length].decode("utf-8")))
+        data = data[length:]
+    return messages
+
+
+class TestPTSLanguageServer:
+    def test_session(self):
+        requests = [
+            {"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {}},
+            {"jsonrpc": "2.0", "method": "textDocument/didOpen", "params": {"textDocument": {"uri": "file:///library.go", "text": LIBRARY}}},
+            {"jsonrpc": "2.0", "method": "textDocument/didOpen", "params": {"textDocument": {"uri": "file:///code.py", "text": CODE}}},
+            {"jsonrpc": "2.0", "id": 2, "method": "textDocument/definition", "params": {"textDocument": {"uri": "file:///code.py"}, "position": {"line": 2, "character": 42}}},
+            {"jsonrpc": "2.0", "id": 3, "method": "unknown/method", "params": {}},
+            {"jsonrpc": "2.0", "id": 4, "method": "shutdown"},
+            {"jsonrpc": "2.0", "method": "exit"}
+        ]
+        outstream = io.BytesIO()
+        server = PTSLanguageServer(io.BytesIO(b"".join(frame(r) for r in requests)), outstream)
+        server.run()
+        responses = unframe(outstream.getvalue())
+
+        assert responses[0]["id"] == 1
+        assert responses[0]["result"]["capabilities"]["definitionProvider"]
+        diagnostics = [r["params"] for r in responses if r.get("method") == "textDocument/publishDiagnostics"]
+        assert diagnostics[-1]["uri"] == "file:///code.py"
+        assert diagnostics[-1]["diagnostics"][0]["range"]["start"]["line"] == 3
+        definition = [r for r in responses if r.get("id") == 2][0]
+        assert definition["result"][0]["uri"] == "file:///library.go"
+        assert definition["result"][0]["range"]["start"]["line"] == 3
+        error = [r for r in responses if r.get("id") == 3][0]
+        assert error["error"]["code"] == -32601
+        assert server.shutdown_requested
+
+    def test_handler_errors(self):
+        def fail(params):
+            raise KeyError("@Exposes")
+        requests = [
+            {"jsonrpc": "2.0", "method": "textDocument/didOpen", "params": {"textDocument": {"uri": "file:///library.go", "text": LIBRARY}}},
+            {"jsonrpc": "2.0", "id": 1, "method": "textDocument/completion", "params": {}},
+            {"jsonrpc": "2.0", "id": 2, "method": "shutdown"}
+        ]
+        outstream = io.BytesIO()
+        server = PTSLanguageServer(io.BytesIO(b"".join(frame(r) for r in requests)), outstream)
+        server.method_table["textDocument/didOpen"] = fail
+        server.run()
+        responses = unframe(outstream.getvalue())
+        assert responses[0]["method"] == "window/logMessage"
+        assert responses[1]["error"]["code"] == -32603
+        assert responses[2] == {"jsonrpc": "2.0", "id": 2, "result": None}
+
+    def test_close_rechecks_documents(self):
+        requests = [
+            {"jsonrpc": "2.0", "method": "textDocument/didOpen", "params": {"textDocument": {"uri": "file:///library.go", "text": LIBRARY}}},
+            {"jsonrpc": "2.0", "method": "textDocument/didOpen", "params": {"textDocument": {"uri": "file:///code.py", "text": CODE}}},
+            {"jsonrpc": "2.0", "method": "textDocument/didClose", "params": {"textDocument": {"uri": "file:///library.go"}}}
+        ]
+        outstream = io.BytesIO()
+        PTSLanguageServer(io.BytesIO(b"".join(frame(r) for r in requests)), outstream).run()
+        diagnostics = [r["params"] for r in unframe(outstream.getvalue()) if r.get("method") == "textDocument/publishDiagnostics"]
+        assert diagnostics[-1]["uri"] == "file:///code.py"
+        assert len(diagnostics[-1]["diagnostics"]) == 6
+        assert diagnostics[-1]["diagnostics"][0]["message"] == "unknown boundary identifier @web"
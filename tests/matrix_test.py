@@ -0,0 +1,103 @@
+from nose.tools import *
+from pythreatspec.pythreatspec import *
+from pythreatspec.matrix import *
+
+THREATS = {
+    "@xss": {"name": "XSS", "parent": "@injection"},
+    "@sqli": {"name": "SQLi", "parent": "@injection"},
+    "@injection": {"name": "Injection", "parent": "@sfp"},
+    "@weak_crypto": {"name": "Weak crypto", "parent": "@crypto"},
+    "@crypto": {"name": "Crypto", "parent": "@sfp"},
+    "@sfp": {"name": "SFP"}
+}
+
+
+def parse(tags):
+    parser = PyThreatspecParser()
+    for lineno, tag in enumerate(tags, 1):
+        parser._parse_comment(tag, parser.new_source("app.py", lineno, "handler"))
+    return parser
+
+
+class TestPTSCoverageMatrix:
+    def setup(self):
+        self.axes = PTSMatrixAxes()
+        self.first = PTSCoverageMatrix.from_parser(parse([
+            "@exposes @web:@server to @xss with raw templates",
+            "@mitigates @web:@server against @sqli with prepared statements",
+            "@exposes @db:@mysql to @weak_crypto with md5 passwords",
+        ]), self.axes)
+        self.second = PTSCoverageMatrix.from_parser(parse([
+            "@mitigates @web:@server against @xss with output encoding",
+            "@exposes @web:@server to @sqli with string concatenation",
+        ]), self.axes)
+
+    def test_has(self):
+        assert self.first.has("exposed", "@web", "@server", "@xss")
+        assert not self.first.has("mitigated", "@web", "@server", "@xss")
+        assert not self.first.has("exposed", "@web", "@unknown", "@xss")
+        assert not self.first.has("exposed", "@web", "@server", "@unknown")
+
+    def test_threats_and_components(self):
+        assert self.first.threats("exposed", "@web", "@server") == ["@xss"]
+        assert self.first.components("exposed", "@weak_crypto") == [("@db", "@mysql")]
+        assert self.first.count("exposed") == 2
+
+    def test_union(self):
+        portfolio = union([self.first, self.second])
+        assert portfolio.threats("exposed", "@web", "@server") == ["@xss", "@sqli"]
+        assert portfolio.threats("mitigated", "@web", "@server") == ["@xss", "@sqli"]
+        assert portfolio.threats("exposed", "@db", "@mysql") == ["@weak_crypto"]
+
+    def test_intersection(self):
+        common = intersection([self.first, self.second])
+        assert common.count("exposed") == 0
+        assert common.rows["exposed"] == {}
+
+    @raises(ValueError)
+    def test_union_different_axes(self):
+        union([self.first, PTSCoverageMatrix()])
+
+    def test_unmitigated(self):
+        assert self.first.unmitigated() == {
+            self.axes.components.get(("@web", "@server")): 1 << self.axes.threats.get("@xss"),
+            self.axes.components.get(("@db", "@mysql")): 1 << self.axes.threats.get("@weak_crypto")
+        }
+        assert self.axes.components.get(("@web", "@server")) not in union([self.first, self.second]).unmitigated()
+
+    def test_rollup(self):
+        rolled = self.first.rollup(THREATS)
+        assert rolled.threats("exposed", "@web", "@server") == ["@injection", "@sfp"]
+        assert rolled.threats("exposed", "@db", "@mysql") == ["@sfp", "@crypto"]
+        assert rolled.threats("mitigated", "@web", "@server") == ["@injection", "@sfp"]
+
+    def test_rollup_unparented(self):
+        matrix = PTSCoverageMatrix.from_parser(parse(["@exposes @web:@server to @csrf with no tokens"]))
+        rolled = matrix.rollup(THREATS)
+        assert rolled.threats("exposed", "@web", "@server") == ["@csrf"]
+        assert len(rolled.unmitigated()) == 1
+
+    def test_rollup_unmitigated(self):
+        matrix = PTSCoverageMatrix.from_parser(parse([
+            "@exposes @web:@server to @xss with raw templates",
+            "@mitigates @web:@server against @sqli with prepared statements",
+        ]))
+        rolled = matrix.rollup(THREATS)
+        row = rolled.axes.components.get(("@web", "@server"))
+        assert len(matrix.unmitigated()) == 1
+        assert rolled.unmitigated()[row] == (1 << rolled.axes.threats.get("@injection")) | (1 << rolled.axes.threats.get("@sfp"))
+
+    @raises(ValueError)
+    def test_union_rolled_up(self):
+        union([self.first.rollup(THREATS)])
+
+    def test_export_to_json(self):
+        rep = self.first.export_to_json()
+        assert rep["exposed"] == {"@web": {"@server": ["@xss"]}, "@db": {"@mysql": ["@weak_crypto"]}}
+        assert rep["accepted"] == {}
+
+    def test_from_json(self):
+        parser = parse(["@exposes @web:@server to @xss with raw templates"])
+        data = PyThreatspecReporter(parser, "project").export_to_json()
+        matrix = PTSCoverageMatrix.from_json(data)
+        assert matrix.threats("exposed", "@web", "@server") == ["@xss"]
@@ -0,0 +1,116 @@
+import json
+import os
+import shutil
+import tempfile
+
+from nose.tools import *
+from pythreatspec.pythreatspec import *
+from pythreatspec.merge import *
+from pythreatspec import binary
+
+WEB = [
+    "@alias boundary @web to Web",
+    "@alias component @web:@server to Server",
+    "@alias threat @xss to Cross-site scripting",
+    "@mitigates @web:@server against @xss with output encoding",
+    "@connects @web:@server to @db:@mysql as SQL",
+]
+
+DB = [
+    "@alias boundary @db to Database",
+    "@alias threat @sqli to SQL injection",
+    "@exposes @db:@mysql to @sqli with string queries",
+    "@mitigates @web:@server against @xss with output encoding",
+]
+
+
+def export(tags, project="default", fname="app.py"):
+    parser = PyThreatspecParser()
+    for lineno, tag in enumerate(tags, 1):
+        parser._parse_comment(tag, parser.new_source(fname, lineno, "handler"))
+    return PyThreatspecReporter(parser, project).export_to_json()
+
+
+class TestPTSMerger:
+    def test_merge(self):
+        merger = PTSMerger()
+        merger.add(export(WEB, "web"))
+        merger.add(export(DB, "db"))
+        document = merger.export_to_json()
+        assert sorted(document["boundaries"]) == ["@db", "@web"]
+        assert sorted(document["threats"]) == ["@sqli", "@xss"]
+        assert sorted(document["components"]["@web"]) == ["@server"]
+        assert sorted(document["projects"]) == ["db", "web"]
+        assert list(document["projects"]["db"]["exposures"]) == ["@string_queries"]
+        assert document["dfd"]["@web"]["@server"]["@db"]["@mysql"]["name"] == "SQL"
+        assert merger.conflicts == []
+
+    def test_same_project(self):
+        merger = PTSMerger()
+        merger.add(export(WEB))
+        merger.add(export(DB, fname="db.py"))
+        merger.add(export(DB, fname="db.py"))
+        projects = merger.export_to_json()["projects"]
+        assert list(projects) == ["default"]
+        assert [element["source"]["file"] for element in projects["default"]["mitigations"]["@output_encoding"]] == ["app.py", "db.py"]
+        assert len(projects["default"]["exposures"]["@string_queries"]) == 1
+
+    def test_conflicts(self):
+        merger = PTSMerger()
+        merger.add(export(WEB), "web.json")
+        merger.add(export(["@alias threat @xss to XSS", "@connects @web:@server to @db:@mysql as HTTP"]), "other.json")
+        assert merger.export_to_json()["threats"]["@xss"]["name"] == "Cross-site scripting"
+        assert [(conflict.section, conflict.identifier, conflict.field) for conflict in merger.conflicts] == [
+            ("threats", ["@xss"], "name"),
+            ("dfd", ["@web", "@server", "@db", "@mysql"], "name")
+        ]
+        assert merger.conflicts[0].files == ["web.json", "other.json"]
+        assert str(merger.conflicts[0]) == "threats @xss has name 'Cross-site scripting' in web.json but 'XSS' in other.json"
+
+    def test_missing_members(self):
+        merger = PTSMerger()
+        merger.add(export(["@alias threat @xss to Cross-site scripting"]))
+        merger.add(export(["@alias threat @xss to Cross-site scripting", "@describe threat @xss as script injection"]))
+        assert merger.export_to_json()["threats"]["@xss"]["description"] == "script injection"
+        assert merger.conflicts == []
+
+    def test_conflict_field_origin(self):
+        merger = PTSMerger()
+        merger.add({"threats": {"@xss": {"name": "Cross-site scripting"}}}, "a.json")
+        merger.add({"threats": {"@xss": {"name": "Cross-site scripting", "description": "A"}}}, "b.json")
+        merger.add({"threats": {"@xss": {"name": "Cross-site scripting", "description": "B"}}}, "c.json")
+        assert [(conflict.field, conflict.files) for conflict in merger.conflicts] == [("description", ["b.json", "c.json"])]
+
+    def test_times(self):
+        first = export(WEB)
+        second = export(DB)
+        first["document"] = {"created": 5, "updated": 10}
+        second["document"] = {"created": 2, "updated": 7}
+        merger = PTSMerger()
+        merger.add(first)
+        merger.add(second)
+        assert merger.export_to_json()["document"] == {"created": 2, "updated": 10}
+
+
+class TestMergeFiles:
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def test_merge_files(self):
+        filenames = []
+        for number in range(6):
+            filename = os.path.join(self.directory, "team{}.threatspec.json".format(number))
+            with open(filename, "w") as fh:
+                json.dump(export(WEB, "team{}".format(number)), fh)
+            filenames.append(filename)
+        with open(filenames[-1] + ".bin", "wb") as fh:
+            binary.dump(export(DB, "db"), fh)
+        filenames.append(filenames[-1] + ".bin")
+
+        merger = merge_files(filenames, 2)
+        assert merger.count == 7
+        assert sorted(merger.export_to_json()["projects"]) == ["db", "team0", "team1", "team2", "team3", "team4", "team5"]
+        assert [filename for filename, document in iter_documents(filenames, 3)] == filenames
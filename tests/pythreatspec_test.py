@@ -1,7 +1,13 @@
 from nose.tools import *
+import collections
+import os
 import json
 import time
 import ast
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 from pythreatspec.pythreatspec import *
 
 class TestModuleFunctions:
@@ -46,6 +52,82 @@ class TestPTSSource:
         assert str(source) == "abc@10"
 
 
+    def test_ptssource_compact(self):
+        table = PTSSourceTable()
+        source = PTSSource(fname="abc", lineno=10, function="xyz", table=table)
+        assert source.compact() == (0, 10, 0)
+        assert table.source("abc", 20, "uvw").compact() == (0, 20, 1)
+
+    def test_ptssource_set_names(self):
+        source = PTSSource(fname="abc", lineno=10, function="xyz")
+        source.fname = "def"
+        source.function = "uvw"
+        assert str(source) == "def@10"
+        assert source.function == "uvw"
+
+
+class TestPTSSourceTable:
+    def test_ptssourcetable_shares_names(self):
+        table = PTSSourceTable()
+        first = table.source("abc", 10, "xyz")
+        second = table.source("abc", 20, "xyz")
+        assert first.file_index == second.file_index
+        assert first.function_index == second.function_index
+        assert table.files == ["abc"]
+        assert table.functions == ["xyz"]
+
+    def test_ptssourcetable_expand(self):
+        table = PTSSourceTable()
+        source = table.expand(table.source("abc", 10, "xyz").compact())
+        assert isinstance(source, PTSSource)
+        export = json.dumps(source.export_to_json(), sort_keys=True)
+        assert export == '{"file": "abc", "function": "xyz", "line": 10}'
+
+    def test_ptssourcetable_export_to_json(self):
+        table = PTSSourceTable()
+        table.source("abc", 10, "xyz")
+        export = json.dumps(table.export_to_json(), sort_keys=True)
+        assert export == '{"files": ["abc"], "functions": ["xyz"]}'
+
+    def test_ptssourcetable_clear(self):
+        table = PTSSourceTable()
+        table.source("abc", 10, "xyz")
+        table.clear()
+        assert table.export_to_json() == {"files": [], "functions": []}
+        assert table.source("def", 1, "uvw").file_index == 0
+
+    def test_ptsdfd_from_json_table(self):
+        table = PTSSourceTable()
+        parser = PyThreatspecParser()
+        parser._parse_comment("@connects @web:@server to @db:@mysql as SQL", parser.new_source("app.py", 1, "handler"))
+        dfd = PTSDfd.from_json(parser.dfd.export_to_json(), table=table)
+        assert dfd.edges[0].source.table is table
+        assert table.files == ["app.py"]
+
+
+class TestPTSSymbolTable:
+    def test_ptssymboltable_ids(self):
+        symbols = PTSSymbolTable()
+        assert symbols.id_of("@a") == 0
+        assert symbols.id_of("@b") == 1
+        assert symbols.id_of("@a") == 0
+        assert symbols.lookup(1) == "@b"
+        assert len(symbols) == 2
+        assert "@a" in symbols
+
+    def test_ptssymboltable_get(self):
+        symbols = PTSSymbolTable()
+        assert symbols.get("@a") is None
+        assert "@a" not in symbols
+        assert symbols.export_to_json() == []
+
+    def test_ptssymboltable_intern(self):
+        symbols = PTSSymbolTable()
+        first = symbols.intern("".join(["@", "abc"]))
+        second = symbols.intern("".join(["@", "ab", "c"]))
+        assert first is second
+
+
 class TestPTSProperty:
     def test_ptsproperty_no_desc(self):
         prop = PTSProperty("abc")
@@ -97,6 +179,15 @@ class TestPTSThreat:
         threat = PTSThreat("abc", "xyz")
         assert threat.name == "abc"
         assert threat.desc == "xyz"
+        assert threat.refs == []
+        assert threat.parent is None
+        assert json.dumps(threat.export_to_json(), sort_keys=True) == '{"description": "xyz", "name": "abc"}'
+
+    def test_ptsthreat_library(self):
+        rep = {"name": "abc", "references": ["CWE 1"], "parent": "@parent"}
+        threat = PTSThreat.from_json(rep)
+        assert threat.parent == "@parent"
+        assert threat.export_to_json() == rep
 
 class TestPTSElement:
     def test_ptselement_no_refs(self):
@@ -292,6 +383,36 @@ class TestPTSDfd:
         assert export == '{"@source_boundary": {"@source_component": {"@dest_boundary": {"@dest_component": {"name": "edge", "source": {"file": "", "function": "", "line": 0}, "type": "uni"}}}}}'
 
 
+    def test_adjacency(self):
+        dfd = PTSDfd()
+        dfd.add_edge(PTSDfdEdge("@a", "@user", "@b", "@web", PTSDfdEdge.UNI_DIRECTIONAL, "https", PTSSource()))
+        dfd.add_edge(PTSDfdEdge("@a", "@user", "@b", "@web", PTSDfdEdge.UNI_DIRECTIONAL, "websocket", PTSSource()))
+        dfd.add_edge(PTSDfdEdge("@b", "@web", "@c", "@db", PTSDfdEdge.BI_DIRECTIONAL, "sql", PTSSource()))
+        assert dfd.nodes == [("@a", "@user"), ("@b", "@web"), ("@c", "@db")]
+        assert [e.name for e in dfd.outgoing("@a", "@user")] == ["https", "websocket"]
+        assert [e.name for e in dfd.incoming("@b", "@web")] == ["https", "websocket"]
+        assert [e.name for e in dfd.incoming("@c", "@db")] == ["sql"]
+        assert dfd.incoming("@a", "@user") == []
+        assert dfd.outgoing("@x", "@unknown") == []
+        assert [e.name for e in dfd.edges_between("@a", "@user", "@b", "@web")] == ["https", "websocket"]
+        assert dfd.components_in("@b") == [("@b", "@web")]
+        assert dfd.edge_nodes(2) == (1, 2)
+
+    def test_add_edge_duplicate(self):
+        dfd = PTSDfd()
+        first = dfd.add_edge(PTSDfdEdge("@a", "@user", "@b", "@web", PTSDfdEdge.UNI_DIRECTIONAL, "https", PTSSource()))
+        second = dfd.add_edge(PTSDfdEdge("@a", "@user", "@b", "@web", PTSDfdEdge.UNI_DIRECTIONAL, "https", PTSSource()))
+        assert first == second
+        assert len(dfd.edges) == 1
+
+    def test_export_to_json_first_edge(self):
+        dfd = PTSDfd()
+        dfd.add_edge(PTSDfdEdge("@a", "@user", "@b", "@web", PTSDfdEdge.UNI_DIRECTIONAL, "https", PTSSource()))
+        dfd.add_edge(PTSDfdEdge("@a", "@user", "@b", "@web", PTSDfdEdge.BI_DIRECTIONAL, "websocket", PTSSource()))
+        assert dfd.export_to_json()["@a"]["@user"]["@b"]["@web"]["name"] == "https"
+        assert dfd.tree["@a"]["@user"]["@b"]["@web"]["name"] == "https"
+
+
 class TestPTSDfdEdge:
     def test_ptsdfdedge(self):
         edge = PTSDfdEdge(
@@ -331,11 +452,168 @@ class TestPyThreatspecReporter:
         export = json.dumps(reporter.export_to_json(), sort_keys=True)
         assert export == '{"boundaries": {}, "components": {}, "dfd": {}, "document": {"created": 0, "updated": 0}, "projects": {"project": {"acceptances": {}, "exposures": {}, "mitigations": {}, "reviews": {}, "transfers": {}}}, "specification": {"name": "ThreatSpec", "version": "0.1.0"}, "threats": {}}'
 
+    def canonical(self, tags, source_date=None, universal=False):
+        parser = PyThreatspecParser()
+        if universal:
+            parser.tag_regex = universal_tag_regex()
+        for fname, lineno, tag in tags:
+            parser._parse_comment(tag, parser.new_source(fname, lineno, "handler"))
+        reporter = PyThreatspecReporter(parser, "project", True, source_date)
+        fh = StringIO()
+        reporter.write_json(fh)
+        return fh.getvalue()
+
+    def test_canonical_independent_of_order(self):
+        tags = [
+            ("a.py", 1, "@mitigates @web:@server against @xss with output encoding"),
+            ("b.py", 1, "@mitigates @web:@server against @xss with output encoding"),
+            ("a.py", 2, "@exposes @db:@mysql to @sqli with string queries"),
+            ("a.py", 3, "@connects @web:@server to @db:@mysql as SQL"),
+            ("b.py", 2, "@connects @web:@server to @db:@mysql as Queries"),
+        ]
+        first = self.canonical(tags, 100)
+        assert first == self.canonical(list(reversed(tags)), 100)
+        data = json.loads(first, object_pairs_hook=collections.OrderedDict)
+        assert data["document"]["created"] == 100000
+        assert data["document"]["digest"] == content_digest(data)
+        assert data["dfd"]["@web"]["@server"]["@db"]["@mysql"]["name"] == "Queries"
+        assert list(data) == sorted(data)
+
+    def test_canonical_independent_of_file_order(self):
+        root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+        fnames = ["tutorial/LAMP_Multi_AZ_04_threats.py", "tutorial/LAMP_Multi_AZ_03_connections.py", "examples/simple_web.go"]
+        tags = []
+        for fname in fnames:
+            with open(os.path.join(root, fname)) as fh:
+                tags.extend((fname, lineno, line.strip()) for lineno, line in enumerate(fh, 1) if "@" in line)
+        first = self.canonical(tags, 0, True)
+        assert '"@mgmt"' in first
+        assert first == self.canonical([tag for fname in reversed(fnames) for tag in tags if tag[0] == fname], 0, True)
+
+    def test_duplicate_edges_keep_first(self):
+        parser = PyThreatspecParser()
+        for fname in ["z.py", "a.py"]:
+            parser._parse_comment("@connects @web:@server to @db:@mysql as SQL", parser.new_source(fname, 1, "handler"))
+        assert parser.dfd.export_to_json()["@web"]["@server"]["@db"]["@mysql"]["source"]["file"] == "z.py"
+        assert next(parser.dfd.canonical_edges()).source.fname == "a.py"
+
+    def test_canonical_digest(self):
+        tags = [("a.py", 1, "@exposes @db:@mysql to @sqli with string queries")]
+        digest = json.loads(self.canonical(tags, 1))["document"]["digest"]
+        assert json.loads(self.canonical(tags, 2))["document"]["digest"] == digest
+        assert json.loads(self.canonical(tags + [("a.py", 2, "@review @db:@mysql check")], 1))["document"]["digest"] != digest
+
+    def test_source_date_milli_time(self):
+        assert source_date_milli_time(5) == 5000
+        os.environ["SOURCE_DATE_EPOCH"] = "7"
+        try:
+            assert source_date_milli_time() == 7000
+        finally:
+            del os.environ["SOURCE_DATE_EPOCH"]
+
+    def test_project_map(self):
+        parser = PyThreatspecParser()
+        for fname, tag in [
+            ("services/payments/app.py", "@mitigates @web:@server against @xss with output encoding"),
+            ("services/search/app.py", "@mitigates @web:@server against @xss with output encoding"),
+            ("services/search/app.js", "@exposes @web:@search to @xss with raw templates"),
+            ("tools/build.py", "@review @ci:@runner check the secrets"),
+        ]:
+            parser._parse_comment(tag, parser.new_source(fname, 1, "handler"))
+        project_map = PTSProjectMap.from_strings(["services/payments=payments", "*.js=frontend", "services/search/=search"])
+        data = PyThreatspecReporter(parser, "other", project_map=project_map).export_to_json()
+        assert sorted(data["projects"]) == ["frontend", "other", "payments", "search"]
+        assert data["projects"]["search"]["mitigations"]["@output_encoding"][0]["source"]["file"] == "services/search/app.py"
+        assert list(data["projects"]["frontend"]["exposures"]) == ["@raw_templates"]
+        assert list(data["projects"]["other"]["reviews"]) == ["@check_the_secrets"]
+
+class TestPTSProjectMap:
+    def test_directory(self):
+        project_map = PTSProjectMap([("./services/payments/", "payments")])
+        assert project_map.project_of("services/payments/app.py") == "payments"
+        assert project_map.project_of("./services/payments/api/views.py") == "payments"
+        assert project_map.project_of("services/payments_old/app.py") is None
+
+    def test_glob(self):
+        project_map = PTSProjectMap([("services/*/web/*", "web"), ("*.py", "python")])
+        assert project_map.project_of("services/search/web/app.js") == "web"
+        assert project_map.project_of("tools/build.py") == "python"
+        assert project_map.project_of("README") is None
+
+    @raises(ValueError)
+    def test_invalid_mapping(self):
+        PTSProjectMap.from_strings(["services/payments"])
+
 class TestPyThreatspecParser:
     def test_pythreatspecparser(self):
         parser = PyThreatspecParser()
         assert parser.projects == {}
 
+    def test_new_source(self):
+        parser = PyThreatspecParser()
+        source = parser.new_source("abc", 10, "xyz")
+        assert source.table is parser.source_table
+        assert str(source) == "abc@10"
+
+    def test_symbols(self):
+        parser = PyThreatspecParser()
+        parser._parse_mitigates("@mitigates @boundary:@component against threat with mitigation", PTSSource())
+        mitigation = parser.mitigations["@mitigation"][0]
+        assert mitigation.boundary is parser.symbols.lookup(parser.symbols.get("@boundary"))
+        assert parser.element_key(mitigation) == (
+            parser.symbols.get("@boundary"),
+            parser.symbols.get("@component"),
+            parser.symbols.get("@threat")
+        )
+
+    def test_element_key_review(self):
+        parser = PyThreatspecParser()
+        parser._parse_review("@review @boundary:@component a review", PTSSource())
+        assert parser.element_key(parser.reviews["@a_review"][0])[2] == -1
+
+    def test_element_key_lookup_only(self):
+        parser = PyThreatspecParser()
+        symbols = len(parser.symbols)
+        assert parser.element_key(PTSMitigation("@boundary", "@component", "@threat", "mitigation")) == (None, None, None)
+        assert len(parser.symbols) == symbols
+
+    def test_add_element_listeners(self):
+        class Listener:
+            def __init__(self):
+                self.added = []
+            def add_element(self, kind, element_id, element):
+                self.added.append((kind, element_id))
+        parser = PyThreatspecParser()
+        listener = Listener()
+        parser.listeners.append(listener)
+        parser._parse_comment("@exposes @boundary:@component to threat with exposure", PTSSource())
+        assert listener.added == [("exposures", "@exposure")]
+        assert [(kind, element_id) for kind, element_id, element in parser.iter_elements()] == [("exposures", "@exposure")]
+
+    def test_property_and_edge_listeners(self):
+        class Listener:
+            def __init__(self):
+                self.events = []
+            def add_element(self, kind, element_id, element):
+                pass
+            def add_property(self, pclass, identifier, prop, boundary_id=None):
+                self.events.append((pclass, identifier, prop.desc))
+            def add_edge(self, edge):
+                self.events.append(("edge", edge.name))
+        parser = PyThreatspecParser()
+        listener = Listener()
+        parser.listeners.append(listener)
+        parser._parse_comment("@alias threat @threat to Threat", PTSSource())
+        parser._parse_comment("@describe threat @threat as a threat", PTSSource())
+        parser._parse_comment("@connects @a:@b to @c:@d as flow", PTSSource())
+        parser._parse_comment("@connects @a:@b to @c:@d as flow", PTSSource())
+        assert listener.events == [("threat", "@threat", ""), ("threat", "@threat", "a threat"), ("edge", "flow")]
+
+    @raises(ValueError)
+    def test_add_element_unknown_kind(self):
+        parser = PyThreatspecParser()
+        parser.add_element("unknowns", "@exposure", PTSExposure("@boundary", "@component", "@threat", "exposure"))
+
 class TestParser:
     def setup(self):
         self.parser = PyThreatspecParser()
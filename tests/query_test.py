@@ -0,0 +1,69 @@
+from nose.tools import *
+from pythreatspec.pythreatspec import *
+from pythreatspec.query import *
+
+TAGS = [
+    ("app.py", "@mitigates @web:@server against xss with output encoding"),
+    ("app.py", "@exposes @web:@server to @xss with raw templates"),
+    ("app.py", "@exposes @web:@server to sqli with string concatenation"),
+    ("db.py", "@mitigates @db:@mysql against sqli with prepared statements"),
+    ("db.py", "@accepts sqli to @db:@mysql with legacy schema"),
+    ("db.py", "@review @db:@mysql check the grants"),
+]
+
+
+class TestPTSQuery:
+    def setup(self):
+        self.parser = PyThreatspecParser()
+        for lineno, (fname, tag) in enumerate(TAGS, 1):
+            self.parser._parse_comment(tag, self.parser.new_source(fname, lineno, "handler"))
+        self.query = PTSQuery(self.parser)
+
+    @raises(ValueError)
+    def test_parser_without_index(self):
+        PTSQuery(PyThreatspecParser(store=object()))
+
+    def test_mitigations_of(self):
+        assert [m.mitigation for m in self.query.mitigations_of("@sqli")] == ["prepared statements"]
+        assert self.query.mitigations_of("@unknown") == []
+
+    def test_exposures_to(self):
+        assert [e.exposure for e in self.query.exposures_to("@xss")] == ["raw templates"]
+
+    def test_exposures_on(self):
+        assert [e.threat for e in self.query.exposures_on("@web", "@server")] == ["@xss", "@sqli"]
+        assert self.query.mitigations_on("@db", "@mysql")[0].mitigation == "prepared statements"
+
+    def test_by_threat(self):
+        entries = self.query.by_threat("@sqli")
+        assert [(kind, element_id) for kind, element_id, element in entries] == [
+            ("mitigations", "@prepared_statements"),
+            ("exposures", "@string_concatenation"),
+            ("acceptances", "@legacy_schema")
+        ]
+
+    def test_by_file(self):
+        assert len(self.query.by_file("db.py")) == 3
+        assert len(self.query.by_file("db.py", "reviews")) == 1
+        assert self.query.by_file("missing.py") == []
+
+    def test_by_kind(self):
+        assert len(self.query.by_kind("exposures")) == 2
+
+    @raises(ValueError)
+    def test_by_kind_unknown(self):
+        self.query.by_kind("unknowns")
+
+    def test_threats_on(self):
+        assert self.query.threats_on("@web", "@server") == ["@xss", "@sqli"]
+        assert self.query.threats_on("@db", "@mysql") == ["@sqli"]
+
+    def test_components_for(self):
+        assert self.query.components_for("@sqli") == [("@db", "@mysql"), ("@web", "@server")]
+        assert self.query.components_for("@sqli", "exposures") == [("@web", "@server")]
+
+    def test_count(self):
+        assert self.query.count() == 6
+        assert self.query.count(kind="mitigations") == 2
+        assert self.query.count(threat_id="@sqli") == 3
+        assert self.query.count(kind="exposures", boundary_id="@web", component_id="@server") == 2
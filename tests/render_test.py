@@ -0,0 +1,146 @@
+from nose.tools import *
+from pythreatspec.pythreatspec import *
+from pythreatspec.render import *
+
+TAGS = [
+    "@alias boundary @web to Web Tier",
+    "@alias component @web:@server to Web \"Front\" Server",
+    "@connects @external:@user to @web:@server as HTTPS",
+    "@connects @web:@server with @web:@app",
+    "@connects @web:@app to @db:@mysql as SQL",
+    "@connects @web:@server to @db:@mysql as reporting",
+    "@exposes @db:@mysql to @sqli with string concatenation",
+]
+
+
+def parse(tags):
+    parser = PyThreatspecParser()
+    for lineno, tag in enumerate(tags, 1):
+        parser._parse_comment(tag, parser.new_source("app.py", lineno, "handler"))
+    return parser
+
+
+class TestPTSDfdRenderer:
+    def setup(self):
+        self.parser = parse(TAGS)
+        self.renderer = PTSDfdRenderer.from_parser(self.parser, elements=True)
+
+    def node(self, *identifiers):
+        return self.renderer.node_ids[identifiers]
+
+    def test_mermaid(self):
+        mermaid = self.renderer.render("mermaid")
+        web, server, app = self.node("@web"), self.node("@web", "@server"), self.node("@web", "@app")
+        mysql = self.node("@db", "@mysql")
+        assert mermaid.startswith("graph LR\n")
+        assert '    subgraph {}["Web Tier"]'.format(web) in mermaid
+        assert '        {}("Web #quot;Front#quot; Server")'.format(server) in mermaid
+        assert "        {} --- {}".format(server, app) in mermaid
+        assert '    {} == "HTTPS" ==> {}'.format(self.node("@external", "@user"), server) in mermaid
+        assert '    {}_exposures_0>"Exposed to sqli with string<br/>concatenation"]'.format(mysql) in mermaid
+        assert "    class {}_exposures_0 exposures".format(mysql) in mermaid
+
+    def test_node_ids(self):
+        self.renderer.render("mermaid")
+        node_ids = list(self.renderer.node_ids.values())
+        assert sorted(node_ids) == sorted("n{}".format(i) for i in range(len(node_ids)))
+        assert self.node("@web") == "n0"
+        assert self.node("@web", "@server") == "n1"
+        self.renderer.render("dot")
+        assert self.node("@web", "@server") == "n1"
+
+    def test_dot(self):
+        dot = self.renderer.render("dot")
+        server, app = self.node("@web", "@server"), self.node("@web", "@app")
+        assert dot.startswith("digraph dfd {\n")
+        assert "    subgraph cluster_{} {{".format(self.node("@web")) in dot
+        assert '        {} [label="Web \\"Front\\" Server"];'.format(server) in dot
+        assert "        {} -> {} [dir=both];".format(server, app) in dot
+        assert '    {} -> {} [label="SQL", style=bold];'.format(app, self.node("@db", "@mysql")) in dot
+        assert dot.endswith("}\n")
+
+    @raises(ValueError)
+    def test_unknown_format(self):
+        self.renderer.render("svg")
+
+    def test_collapse_all(self):
+        mermaid = self.renderer.render("mermaid", collapse=True)
+        web, db = self.node("@web"), self.node("@db")
+        assert "subgraph" not in mermaid
+        assert '    {}[["Web Tier"]]'.format(web) in mermaid
+        assert '    {} == "2 flows" ==> {}'.format(web, db) in mermaid
+        assert '    {} == "HTTPS" ==> {}'.format(self.node("@external"), web) in mermaid
+        assert "{} ==> {}".format(web, web) not in mermaid
+
+    def test_collapse_some(self):
+        dot = self.renderer.render("dot", collapse=["@db"])
+        db = self.node("@db")
+        assert "    subgraph cluster_{} {{".format(self.node("@web")) in dot
+        assert '    {} [label="db", shape=box3d, style=""];'.format(db) in dot
+        assert "cluster_{}".format(db) not in dot
+        assert '    {} -> {} [label="SQL", style=bold];'.format(self.node("@web", "@app"), db) in dot
+        assert '    {} -> {} [label="reporting", style=bold];'.format(self.node("@web", "@server"), db) in dot
+
+    def test_cache(self):
+        self.renderer.render("mermaid")
+        cached = dict((key, value[:]) for key, value in self.renderer.cache.items())
+        assert sorted(cached) == ["mermaid:@db", "mermaid:@external", "mermaid:@web"]
+
+        self.parser._parse_comment("@connects @web:@app to @web:@cache as memcached", PTSSource())
+        calls = []
+        original = self.renderer._mermaid_subgraph
+
+        def counting(boundary_id, content):
+            calls.append(boundary_id)
+            return original(boundary_id, content)
+
+        self.renderer._mermaid_subgraph = counting
+        mermaid = self.renderer.render("mermaid")
+        assert calls == ["@web"]
+        assert self.node("@web", "@cache") == "n7"
+        assert '        {} -- "memcached" --> {}'.format(self.node("@web", "@app"), self.node("@web", "@cache")) in mermaid
+        assert self.renderer.cache["mermaid:@db"] == cached["mermaid:@db"]
+        assert self.renderer.cache["mermaid:@web"] != cached["mermaid:@web"]
+
+        calls[:] = []
+        self.renderer.render("mermaid")
+        assert calls == []
+
+    def test_dot_identifiers(self):
+        renderer = PTSDfdRenderer.from_parser(parse([
+            "@connects @3tier:@web-app to @db.v2:@mysql as SQL",
+            "@exposes @3tier:@web-app to @xss with raw templates",
+        ]), elements=True)
+        dot = renderer.render("dot")
+        assert "    subgraph cluster_n0 {\n        label=\"3tier\";" in dot
+        assert '        n1 [label="web-app"];' in dot
+        assert dot.count("web-app") == 1
+        assert '    n1 -> n3 [label="SQL", style=bold];' in dot
+        assert "        n1_exposures_0 -> n1 [style=dashed, arrowhead=none];" in dot
+        assert '    n2 [label="db.v2", shape=box3d, style=""];' in renderer.render("dot", collapse=True)
+
+    def test_colliding_identifiers(self):
+        renderer = PTSDfdRenderer.from_parser(parse([
+            "@connects @a_b:@c to @a:@b_c as HTTPS",
+        ]))
+        mermaid = renderer.render("mermaid")
+        source, dest = renderer.node_ids[("@a_b", "@c")], renderer.node_ids[("@a", "@b_c")]
+        assert source != dest
+        assert '    {} == "HTTPS" ==> {}'.format(source, dest) in mermaid
+        assert '        {}("c")'.format(source) in mermaid
+        assert '        {}("b c")'.format(dest) in mermaid
+
+    def test_from_json(self):
+        reporter = PyThreatspecReporter(self.parser, "default")
+        renderer = PTSDfdRenderer.from_json([reporter.export_to_json()], elements=True)
+        # The JSON groups edges by source component, so only the order of edges can differ
+        assert sorted(renderer.render("mermaid").splitlines()) == sorted(self.renderer.render("mermaid").splitlines())
+        assert sorted(renderer.render("dot", collapse=True).splitlines()) == sorted(self.renderer.render("dot", collapse=True).splitlines())
+
+
+class TestPTSDfdFromJson:
+    def test_round_trip(self):
+        parser = parse(TAGS)
+        dfd = PTSDfd.from_json(parser.dfd.export_to_json())
+        assert dfd.export_to_json() == parser.dfd.export_to_json()
+        assert dfd.edges_between("@web", "@server", "@web", "@app")[0].connection_type == "bi"
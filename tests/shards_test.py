@@ -0,0 +1,96 @@
+import json
+import os
+import shutil
+import tempfile
+
+from nose.tools import *
+from pythreatspec.pythreatspec import *
+from pythreatspec.shards import *
+
+TAGS = [
+    ("src/web/app.py", "@alias boundary @web to Web"),
+    ("src/web/app.py", "@mitigates @web:@server against @xss with output encoding"),
+    ("src/web/views.py", "@exposes @web:@server to @xss with raw templates"),
+    ("src/db/models.py", "@exposes @db:@mysql to @sqli with string queries"),
+    ("setup.py", "@review @db:@mysql check the grants"),
+    ("src/web/app.py", "@connects @web:@server to @db:@mysql as SQL"),
+]
+
+
+def reporter(canonical=False):
+    parser = PyThreatspecParser()
+    for lineno, (fname, tag) in enumerate(TAGS, 1):
+        parser._parse_comment(tag, parser.new_source(fname, lineno, "handler"))
+    return PyThreatspecReporter(parser, "project", canonical, 0)
+
+
+def without_document(rep):
+    rep = dict(rep)
+    del rep["document"]
+    return rep
+
+
+class TestShards:
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def test_by_boundary(self):
+        manifest = reporter().write_shards(self.directory)
+        assert [(shard["key"], shard["elements"]) for shard in manifest["shards"]] == [("@web", 2), ("@db", 2)]
+        assert sorted(os.listdir(self.directory)) == ["manifest.json", "project.db.threatspec.json", "project.web.threatspec.json", "shared.threatspec.json"]
+        with open(os.path.join(self.directory, "project.web.threatspec.json")) as fh:
+            shard = json.load(fh)
+        assert "threats" not in shard
+        assert list(shard["projects"]["project"]["mitigations"]) == ["@output_encoding"]
+
+    def test_by_directory(self):
+        manifest = reporter().write_shards(self.directory, "directory", 2)
+        shards = dict((shard["key"], shard) for shard in manifest["shards"])
+        assert sorted(shards) == ["", "src/db", "src/web"]
+        assert shards["src/web"]["ranges"]["element"] == ["@output_encoding", "@raw_templates"]
+        assert "threat" not in shards[""]["ranges"]
+
+    def test_document(self):
+        rep = reporter()
+        rep.write_shards(self.directory, "directory", 1, None, ".threatspec.json.gz")
+        manifest = PTSShardManifest.from_file(self.directory)
+        assert without_document(manifest.document()) == without_document(rep.export_to_json())
+
+    def test_select(self):
+        reporter().write_shards(self.directory)
+        manifest = PTSShardManifest.from_file(os.path.join(self.directory, "manifest.json"))
+        assert [shard["key"] for shard in manifest.select(threat="@sqli")] == ["@db"]
+        assert [shard["key"] for shard in manifest.select(project="project", boundary="@web")] == ["@web"]
+        assert manifest.select(project="other") == []
+        document = manifest.document(manifest.select(key="@db"))
+        assert list(document["projects"]["project"]["exposures"]) == ["@string_queries"]
+        assert "@web" in document["boundaries"]
+
+    def test_canonical(self):
+        first = reporter(True).write_shards(self.directory)
+        second = reporter(True).write_shards(self.directory)
+        assert first == second
+        assert [shard["key"] for shard in first["shards"]] == ["@db", "@web"]
+
+    def test_projects(self):
+        rep = reporter()
+        rep.project_map = PTSProjectMap([("src/web", "web")])
+        manifest = rep.write_shards(self.directory)
+        assert sorted((shard["project"], shard["key"]) for shard in manifest["shards"]) == [("project", "@db"), ("web", "@web")]
+        document = PTSShardManifest.from_file(self.directory).document()
+        assert without_document(document) == without_document(rep.export_to_json())
+
+    @raises(ValueError)
+    def test_verify(self):
+        reporter().write_shards(self.directory)
+        with open(os.path.join(self.directory, "project.db.threatspec.json"), "a") as fh:
+            fh.write(" ")
+        manifest = PTSShardManifest.from_file(self.directory)
+        manifest.load(manifest.select(key="@db")[0])
+
+    @raises(ValueError)
+    def test_unknown_shard_type(self):
+        PTSShardWriter(reporter(), self.directory, "threat")
@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+
+from nose.tools import *
+from pythreatspec.pythreatspec import *
+from pythreatspec.sqlstore import *
+
+TAGS = [
+    "@alias boundary @web to Web",
+    "@alias component @web:@server to Server",
+    "@alias threat @xss to Cross-site scripting",
+    "@describe threat @xss as cross-site scripting",
+    "@exposes @web:@server to @xss with raw templates",
+    "@mitigates @web:@server against @xss with output encoding",
+    "@accepts @sqli to @db:@data_warehouse with legacy schema",
+    "@accepts @xss to @web:@data_export with internal users only",
+    "@transfers @sqli to @db:@mysql with the DBA",
+    "@review @db:@mysql check the grants",
+    "@connects @web:@server to @db:@mysql as SQL",
+]
+
+
+def parse(tags, fname="app.py"):
+    parser = PyThreatspecParser()
+    for lineno, tag in enumerate(tags, 1):
+        parser._parse_comment(tag, parser.new_source(fname, lineno, "handler"))
+    return parser
+
+
+def export(parser, project="default"):
+    return PyThreatspecReporter(parser, project).export_to_json()
+
+
+class TestPTSSqliteStore:
+    def setup(self):
+        self.store = PTSSqliteStore()
+        self.document = export(parse(TAGS), "payments")
+
+    def teardown(self):
+        self.store.close()
+
+    def test_round_trip(self):
+        assert self.store.add_document(self.document) == ["payments"]
+        assert self.store.document() == self.document
+
+    def test_parser(self):
+        parser = parse(TAGS)
+        self.store.add_parser(parser, "payments")
+        loaded = self.store.parser()
+        assert loaded.threats["@xss"].desc == "cross-site scripting"
+        assert export(loaded, "payments") == export(parser, "payments")
+
+    def test_parser_projects(self):
+        self.store.add_document(self.document)
+        self.store.add_document(export(parse(TAGS[6:8]), "api"))
+        project_map = PTSProjectMap()
+        loaded = self.store.parser(project_map=project_map)
+        reporter = PyThreatspecReporter(loaded, "default", project_map=project_map)
+        assert reporter.export_to_json()["projects"] == self.store.document()["projects"]
+
+    def test_select(self):
+        self.store.add_document(self.document)
+        self.store.add_document(export(parse(TAGS[6:8], "api.py"), "api"))
+        rows = self.store.select(kind="acceptances", component="@data*")
+        assert [(row["project"], row["component"], row["file"]) for row in rows] == [
+            ("payments", "@data_warehouse", "app.py"),
+            ("payments", "@data_export", "app.py"),
+            ("api", "@data_warehouse", "api.py"),
+            ("api", "@data_export", "api.py")
+        ]
+        assert [row["text"] for row in self.store.select(project="api", threat="@xss")] == ["internal users only"]
+        assert self.store.select(threat="@unknown") == []
+        assert self.store.select(kind="reviews")[0]["threat"] is None
+
+    def test_count_by(self):
+        self.store.add_document(self.document)
+        assert self.store.count_by("kind", boundary="@db") == [("acceptances", 1), ("reviews", 1), ("transfers", 1)]
+
+    def test_upsert(self):
+        self.store.add_document(self.document)
+        self.store.add_document(export(parse(TAGS[:4] + ["@describe threat @xss as script injection"] + TAGS[5:6]), "payments"))
+        assert self.store.projects() == ["payments"]
+        assert self.store.count_by("kind") == [("mitigations", 1)]
+        assert self.store.document()["threats"]["@xss"]["description"] == "script injection"
+        columns, rows = self.store.execute("SELECT COUNT(*) FROM sources")
+        assert rows == [(1,)]
+
+    def test_remove_project(self):
+        self.store.add_document(self.document)
+        self.store.remove_project("payments")
+        assert self.store.projects() == []
+        assert self.store.select() == []
+
+    def test_view(self):
+        self.store.add_document(self.document)
+        columns, rows = self.store.execute("SELECT element, line FROM element_details WHERE kind = ?", ("mitigations",))
+        assert columns == ["element", "line"]
+        assert rows == [("@output_encoding", 6)]
+
+    @raises(ValueError)
+    def test_unknown_kind(self):
+        self.store.select(kind="threats")
+
+
+class TestPTSSqliteStoreFile:
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def test_reopen(self):
+        filename = os.path.join(self.directory, "portfolio.db")
+        with PTSSqliteStore(filename) as store:
+            store.add_document(export(parse(TAGS), "payments"))
+        with PTSSqliteStore(filename) as store:
+            store.add_document(export(parse(TAGS[6:8]), "api"))
+            assert store.projects() == ["payments", "api"]
+            assert len(store.select(component="@data_export")) == 2
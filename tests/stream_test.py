@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import collections
+import json
+import sys
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from nose.tools import *
+from pythreatspec.pythreatspec import *
+from pythreatspec.columnar import PTSColumnarStore
+from pythreatspec.stream import *
+
+TAGS = [
+    "@alias boundary @web to Web",
+    "@exposes @web:@server to @xss with raw \"templates\"",
+    "@mitigates @web:@server against @xss with output encoding",
+    "@mitigates @db:@mysql against @sqli with prepared statements",
+    "@accepts @sqli to @db:@mysql with legacy schema",
+    "@review @db:@mysql check the grants",
+    "@connects @web:@server to @db:@mysql as SQL",
+    "@connects @external:@user with @web:@server",
+]
+
+
+def dump(value, indent=2):
+    return json.dumps(value, indent=indent, separators=(',', ': '))
+
+
+def same_json(text, value, indent=2):
+    # Dicts only keep their insertion order from Python 3.7, so before that the
+    # text is compared after loading it
+    if sys.version_info >= (3, 7):
+        separators = (',', ': ') if indent is not None else (',', ':')
+        return text == json.dumps(value, indent=indent, separators=separators)
+    return json.loads(text) == json.loads(json.dumps(value))
+
+
+def write(value, indent=2, chunk_size=65536):
+    fh = StringIO()
+    PTSJsonWriter(fh, indent, chunk_size).write(value)
+    return fh.getvalue()
+
+
+def parse(parser, tags):
+    for lineno, tag in enumerate(tags, 1):
+        parser._parse_comment(tag, parser.new_source("app.py", lineno, "handler"))
+    return parser
+
+
+class TestPTSJsonWriter:
+    def test_plain_values(self):
+        for value in [{}, [], {"a": [], "b": {}}, [1, "two", None, True, 1.5], {"nested": {"list": [{"x": "line\nbreak"}]}}, u"café"]:
+            assert write(value) == dump(value)
+
+    def test_compact_values(self):
+        value = {"a": [1, {"b": []}], "c": {}}
+        assert write(PTSJsonObject(value.items()), indent=None) == json.dumps(value, separators=(',', ':'))
+
+    def test_lazy_values(self):
+        lazy = PTSJsonObject([
+            ("empty", PTSJsonObject(iter([]))),
+            ("array", PTSJsonArray(({"n": n, "list": [n, n]} for n in range(3)))),
+            ("empty_array", PTSJsonArray([])),
+            ("value", {"a": {"b": [1, {}]}}),
+        ])
+        assert same_json(write(lazy, chunk_size=1), {
+            "empty": {},
+            "array": [{"n": n, "list": [n, n]} for n in range(3)],
+            "empty_array": [],
+            "value": {"a": {"b": [1, {}]}},
+        })
+
+    def test_indent(self):
+        value = {"a": [1, {"b": 2}]}
+        assert write(PTSJsonObject(value.items()), indent=4) == dump(value, indent=4)
+
+    def test_materialise(self):
+        lazy = PTSJsonObject((k, PTSJsonArray(range(k))) for k in range(3))
+        assert materialise(lazy) == {0: [], 1: [0], 2: [0, 1]}
+        assert materialise("text") == "text"
+
+
+class TestWriteJson:
+    def check(self, parser):
+        reporter = PyThreatspecReporter(parse(parser, TAGS), "default")
+        fh = StringIO()
+        reporter.write_json(fh)
+        assert same_json(fh.getvalue(), reporter.export_to_json())
+        return json.loads(fh.getvalue(), object_pairs_hook=collections.OrderedDict)
+
+    def test_default_storage(self):
+        data = self.check(PyThreatspecParser())
+        assert list(data) == ["specification", "document", "boundaries", "components", "threats", "dfd", "projects"]
+        assert data["dfd"]["@web"]["@server"]["@db"]["@mysql"]["name"] == "SQL"
+        assert data["projects"]["default"]["reviews"]["@check_the_grants"][0]["review"] == "check the grants"
+
+    def test_columnar_storage(self):
+        parser = PTSColumnarStore.new_parser()
+        data = self.check(parser)
+        assert data["projects"]["default"] == parser.store.export_to_json()
+
+    def test_empty(self):
+        fh = StringIO()
+        PyThreatspecReporter(PyThreatspecParser(), "empty").write_json(fh)
+        assert json.loads(fh.getvalue())["projects"]["empty"]["mitigations"] == {}
+
+    def test_compact(self):
+        reporter = PyThreatspecReporter(parse(PyThreatspecParser(), TAGS), "default")
+        fh = StringIO()
+        reporter.write_json(fh, None)
+        assert same_json(fh.getvalue(), reporter.export_to_json(), None)
@@ -0,0 +1,143 @@
+import functools
+import sys
+import threading
+
+from nose.tools import *
+from pythreatspec.pythreatspec import *
+from pythreatspec.tracer import *
+
+
+def handler():
+    """@mitigates @web:@server against @xss with templates"""
+    for i in range(3):
+        helper()
+    return session()
+
+
+def helper():
+    return query()
+
+
+def query():
+    """@exposes @db:@mysql to @sqli with raw queries"""
+    return 1
+
+
+def session():
+    """@mitigates @auth:@sessions against @fixation with rotation"""
+    return query()
+
+
+def logged(function):
+    @functools.wraps(function)
+    def wrapper(*args):
+        return function(*args)
+    # functools.wraps only sets __wrapped__ on Python 3
+    wrapper.__wrapped__ = function
+    return wrapper
+
+
+@logged
+def audit():
+    """@mitigates @audit:@log against @repudiation with an audit trail"""
+    return query()
+
+
+class TestPTSTracer:
+    def setup(self):
+        self.parser = PyThreatspecParser()
+        self.parser.parse(__file__)
+
+    def test_functions(self):
+        tracer = PTSTracer(self.parser)
+        assert sorted((source.function, components) for source, components in tracer.functions) == [
+            ("audit", [("@audit", "@log")]),
+            ("handler", [("@web", "@server")]),
+            ("query", [("@db", "@mysql")]),
+            ("session", [("@auth", "@sessions")]),
+        ]
+        assert tracer.function_index(helper.__code__) == -1
+        assert tracer.functions[tracer.function_index(query.__code__)][0].function == "query"
+
+    def test_trace(self):
+        tracer = PTSTracer(self.parser)
+        with tracer:
+            handler()
+        assert [(s, d, c) for s, d, c, source in tracer.component_edges()] == [
+            (("@web", "@server"), ("@auth", "@sessions"), 1),
+            (("@web", "@server"), ("@db", "@mysql"), 3),
+            (("@auth", "@sessions"), ("@db", "@mysql"), 1),
+        ]
+
+    def test_decorated(self):
+        tracer = PTSTracer(self.parser)
+        assert tracer.function_index(audit.__wrapped__.__code__) >= 0
+        with tracer:
+            audit()
+        assert [(s, d, c) for s, d, c, source in tracer.component_edges()] == [
+            (("@audit", "@log"), ("@db", "@mysql"), 1),
+        ]
+
+    def test_stop_restores_profile(self):
+        def previous(frame, event, arg):
+            pass
+        sys.setprofile(previous)
+        threading.setprofile(previous)
+        try:
+            with PTSTracer(self.parser):
+                handler()
+            assert sys.getprofile() is previous
+            assert getattr(threading, "getprofile", lambda: threading._profile_hook)() is previous
+        finally:
+            sys.setprofile(None)
+            threading.setprofile(None)
+
+    def test_sample(self):
+        tracer = PTSTracer(self.parser, sample=2)
+        with tracer:
+            for i in range(10):
+                query()
+                handler()
+        # 50 calls between tagged functions are estimated from the 25 recorded
+        assert sum(tracer.counts) == 50
+        assert all(count % 2 == 0 for count in tracer.counts)
+
+    def test_max_depth(self):
+        tracer = PTSTracer(self.parser, max_depth=1)
+        with tracer:
+            handler()
+        assert [(s, d, c) for s, d, c, source in tracer.component_edges()] == [
+            (("@web", "@server"), ("@auth", "@sessions"), 1),
+            (("@auth", "@sessions"), ("@db", "@mysql"), 1),
+        ]
+
+    def test_threads(self):
+        tracer = PTSTracer(self.parser)
+        with tracer:
+            thread = threading.Thread(target=handler)
+            thread.start()
+            thread.join()
+        assert len(tracer.component_edges()) == 3
+
+    def test_fixed_size(self):
+        tracer = PTSTracer(self.parser, size=2)
+        tracer.record(0, 2)
+        tracer.record(0, 1)
+        tracer.record(1, 2)
+        tracer.record(0, 2)
+        assert tracer.calls() == [(0, 1, 1), (0, 2, 2)]
+        assert tracer.dropped == 1
+
+    @raises(ValueError)
+    def test_invalid_sample(self):
+        PTSTracer(self.parser, sample=0)
+
+    def test_merge(self):
+        tracer = PTSTracer(self.parser)
+        with tracer:
+            handler()
+        assert tracer.merge() == 3
+        edge = self.parser.dfd.edges_between("@web", "@server", "@db", "@mysql")[0]
+        assert edge.name == "observed"
+        assert edge.source.function == "handler"
+        assert tracer.export_to_json()[1] == {"source": "@web:@server", "destination": "@db:@mysql", "count": 3}
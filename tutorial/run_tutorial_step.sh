@@ -9,14 +9,10 @@ fi
 echo "Running universal parser for $name"
 source ../venv/bin/activate
 ../universal.py -p "$name" ${name}_*.py
-deactivate
 
-echo "Running mermaid DFD reporting tool"
-pushd ../../report_dfd
-source venv/bin/activate
-./mermaid.py ../pythreatspec/examples/cwe_library.threatspec.json "../pythreatspec/tutorial/${name}.threatspec.json" > "../pythreatspec/tutorial/${name}.mermaid"
+echo "Rendering mermaid DFD"
+../render_dfd.py -e --cache .render_cache.json -o "${name}.mermaid" ../examples/cwe_library.threatspec.json "${name}.threatspec.json"
 deactivate
-popd
 
 echo "Generating PNG using mermaid"
 mermaid -w 1871 "${name}.mermaid"
@@ -1,11 +1,11 @@
 #!/usr/bin/env python
 
 import sys
-import json
-import re
 import logging
 from cli.log import LoggingApp
 from pythreatspec import pythreatspec as ts
+from pythreatspec.events import PTSEventWriter
+from pythreatspec.files import open_file, compressor
 
 class UniversalParserApp(LoggingApp):
     def parse_file(self, filename):
@@ -13,31 +13,51 @@ class UniversalParserApp(LoggingApp):
             line_no = 1
             for line in fh.readlines():
                 line = line.strip()
-                self.parser._parse_comment(line, ts.PTSSource(filename, line_no, "universal_parser"))
+                if "@" in line:
+                    self.parser._parse_comment(line, self.parser.new_source(filename, line_no, "universal_parser"))
                 line_no += 1
 
+    def parse_files(self):
+        for f in self.params.files:
+            self.log.info("Parsing file {}".format(f))
+            self.parse_file(f)
+
     def main(self):
         self.log.level = logging.INFO
         if self.params.out:
             outfile = self.params.out
         else:
-            outfile = "{}.threatspec.json".format(self.params.project)
+            outfile = "{}.threatspec.{}".format(self.params.project, self.params.format)
 
         self.parser = ts.PyThreatspecParser()
-        comments = ['//', '/*', '#', '"""', '\'\'\'']
-        tags = ['alias','describe','connects','review','mitigates','exposes','transfers','accepts']
-        self.parser.tag_regex = "^\s*(?:{})*\s*(@(?:{})).*$".format('|'.join([re.escape(c) for c in comments]), '|'.join([re.escape(t) for t in tags]))
+        self.parser.tag_regex = ts.universal_tag_regex()
 
-        for f in self.params.files:
-            self.log.info("Parsing file {}".format(f))
-            self.parse_file(f)
+        if self.params.format == "ndjson":
+            if self.params.map:
+                self.log.error("--map is not supported with --format ndjson")
+                sys.exit(1)
+            self.log.info("Writing records to {}".format(outfile))
+            with open_file(outfile, "w") as fh:
+                # Flushing each record would defeat the compression.
+                PTSEventWriter(fh, self.params.project, compressor(outfile) is None).attach(self.parser)
+                self.parse_files()
+            return
 
-        reporter = ts.PyThreatspecReporter(self.parser, self.params.project)
+        self.parse_files()
+        project_map = ts.PTSProjectMap.from_strings(self.params.map) if self.params.map else None
+        reporter = ts.PyThreatspecReporter(self.parser, self.params.project, self.params.canonical, self.params.source_date, project_map)
         from pprint import pprint
 
+        if self.params.shard:
+            directory = self.params.out or "{}.threatspec".format(self.params.project)
+            self.log.info("Writing shards by {} to {}".format(self.params.shard, directory))
+            manifest = reporter.write_shards(directory, self.params.shard, self.params.shard_depth, None if self.params.compact else 2)
+            self.log.info("Wrote {} shards".format(len(manifest["shards"])))
+            return
+
         self.log.info("Writing output to {}".format(outfile))
-        with open(outfile, "w") as fh:
-            json.dump(reporter.export_to_json(), fh, indent=2, separators=(',', ': '))
+        with open_file(outfile, "w") as fh:
+            reporter.write_json(fh, None if self.params.compact else 2)
 
 if __name__ == "__main__":
     app = UniversalParserApp(
@@ -46,6 +66,13 @@ if __name__ == "__main__":
         message_format = '%(asctime)s %(levelname)s: %(message)s'
     )
     app.add_param("-p", "--project", default="default", help="project name (default: default)")
-    app.add_param("-o", "--out", default=None, help="output file (default: PROJECT.threatspec.json)")
+    app.add_param("-o", "--out", default=None, help="output file, compressed if it ends in .gz, .bz2 or .xz (default: PROJECT.threatspec.FORMAT)")
+    app.add_param("--compact", action="store_true", help="write json without indentation")
+    app.add_param("--canonical", action="store_true", help="write the same json for the same model, with sorted keys, fixed timestamps and a content digest")
+    app.add_param("--source-date", default=None, type=int, help="timestamp in seconds since the epoch for --canonical (default: SOURCE_DATE_EPOCH or 0)")
+    app.add_param("--shard", default=None, choices=["boundary", "directory"], help="write a directory of json shards per boundary or source directory, with a manifest, to OUT (default: PROJECT.threatspec)")
+    app.add_param("--shard-depth", default=1, type=int, help="number of directory levels per shard with --shard directory (default: 1)")
+    app.add_param("-m", "--map", default=None, action="append", help="PATTERN=PROJECT to put elements from files below a directory, or matching a glob, in a project, may be repeated (default: all in PROJECT)")
+    app.add_param("-f", "--format", default="json", choices=["json", "ndjson"], help="json for a single document, or ndjson for one record per line as tags are found (default: json)")
     app.add_param("files", action="append", help="source files to parse")
     app.run()
@@ -5,6 +5,7 @@ import json
 import sys
 import logging
 from cli.log import LoggingApp
+from pythreatspec.files import load_document
 
 class ValidatorApp(LoggingApp):
     def main(self):
@@ -23,8 +24,7 @@ class ValidatorApp(LoggingApp):
         validation_error_count = 0
         for filename in self.params.files:
             self.log.info("Validating file {}".format(filename))
-            with open(filename) as fh:
-                data = json.load(fh)
+            data = load_document(filename)
             for error in sorted(validator.iter_errors(data), key=lambda e: e.path):
                 if error.validator == "additionalProperties":
                     if self.params.relax >= 1:
@@ -56,5 +56,5 @@ if __name__ == "__main__":
     )
     app.add_param("-j", "--schema", default="schema.json", help="jsonschema file")
     app.add_param("-r", "--relax", default=0, action="count", help="relax the validation")
-    app.add_param("files", action="append", help="files to validate")
+    app.add_param("files", action="append", help="files to validate, which may be compressed or binary")
     app.run()